@@ -1,27 +1,27 @@
-from fastapi import APIRouter, HTTPException
-from services.action_service import ActionItemsService
+from fastapi import APIRouter, HTTPException, Request
+from services.action_service import action_service
+from core.llm_calls import await_llm
+from core.sse import sse_event, sse_response
 from models.action_model import (
     ActionItemsRequest, 
+    ActionItemsBatchRequest,
     ActionItemsResponse,
-    ActionItem
+    ActionItem,
+    ActionMode
 )
 
 router = APIRouter()
 
-# Global Action Items service
-action_service = ActionItemsService()
-
 @router.post("/generate-actions/", response_model=ActionItemsResponse)
-async def generate_action_items(request: ActionItemsRequest):
+async def generate_action_items(request: ActionItemsRequest, http_request: Request):
     """Generate action items from analysis results"""
     try:
-        if request.business_context:
-            result = action_service.generate_prioritized_actions(
-                request.file_data, 
-                request.business_context
-            )
-        else:
-            result = action_service.generate_action_items(request.file_data)
+        result = await await_llm(action_service.agenerate_actions(
+            request.file_data, 
+            request.business_context,
+            refine=request.refine_priorities,
+            mode=request.mode
+        ), http_request)
         
         action_items = []
         for item in result.get('action_items', []):
@@ -31,25 +31,84 @@ async def generate_action_items(request: ActionItemsRequest):
             action_items=action_items,
             summary=result.get('summary', ''),
             key_insights=result.get('key_insights', []),
-            note=result.get('note')
+            note=result.get('note'),
+            prompt_usage=result.get('prompt_usage')
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Action items could not be created: {str(e)}")
 
+@router.post("/generate-actions/stream")
+async def stream_action_items(request: ActionItemsRequest):
+    """Stream action items as Server-Sent Events: token, action_item, result (or error)"""
+    async def events():
+        try:
+            result = None
+            async for event, data in action_service.astream_action_items(
+                request.file_data, request.business_context, mode=request.mode
+            ):
+                if event == "token":
+                    yield sse_event("token", {"delta": data})
+                elif event == "action_item":
+                    yield sse_event("action_item", data)
+                else:
+                    result = data
+            
+            if request.mode == "llm" and request.business_context and request.refine_priorities:
+                result = await action_service.areprioritize_actions(result, request.business_context)
+            
+            response = ActionItemsResponse(
+                action_items=[ActionItem(**item) for item in result.get('action_items', [])],
+                summary=result.get('summary', ''),
+                key_insights=result.get('key_insights', []),
+                note=result.get('note'),
+                prompt_usage=result.get('prompt_usage')
+            )
+            yield sse_event("result", response.model_dump())
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Action items could not be created: {str(e)}"})
+    
+    return sse_response(events())
+
+@router.post("/generate-actions/batch")
+async def generate_action_items_batch(request: ActionItemsBatchRequest):
+    """Generate action items for many datasets concurrently, streaming each result (SSE) as it finishes"""
+    async def events():
+        async for index, result, error in action_service.abatch_action_items(
+            request.datasets, request.business_context, request.refine_priorities, request.mode
+        ):
+            if error is not None:
+                yield sse_event("error", {"index": index, "detail": f"Action items could not be created: {str(error)}"})
+                continue
+            
+            yield sse_event("action_items", {"index": index, **result})
+        
+        yield sse_event("done", {"datasets": len(request.datasets)})
+    
+    return sse_response(events())
+
 @router.post("/analyze-and-generate-actions/")
 async def analyze_and_generate_actions(
     analysis_results: dict,
-    business_context: str = ""
+    http_request: Request,
+    business_context: str = "",
+    refine_priorities: bool = False,
+    mode: ActionMode = "llm"
 ):
     """Quick analysis + action items (in a single endpoint)"""
     try:
         request = ActionItemsRequest(
             file_data=analysis_results,
-            business_context=business_context
+            business_context=business_context,
+            refine_priorities=refine_priorities,
+            mode=mode
         )
         
-        return await generate_action_items(request)
+        return await generate_action_items(request, http_request)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis and action items failed: {str(e)}")
\ No newline at end of file
@@ -1,5 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Request, BackgroundTasks
+import asyncio
 import os
+import time
+from typing import List
 import polars as pl
 import matplotlib.pyplot as plt
 import base64
@@ -11,26 +14,44 @@ import traceback
 
 from services.file_service import save_file, parse_with_llamaparse, save_markdown
 from services.data_processor import DataProcessor
-from services.rag_service import add_document_to_rag
-from services.action_service import ActionItemsService
+from services.rag_service import aadd_document_to_rag
+from services.summary_service import summary_service
+from services.action_service import action_service
 
 from models.data_model import DataProcessingResponse
 from models.file_model import MarkdownResponse
 from models.schemas import ReportCreate
-from models.action_model import ActionItemsResponse, ActionItem
+from models.action_model import ActionItemsResponse, ActionItem, ActionMode
 
 from core.database import get_db
+from core.llm_calls import await_llm
+from core.sse import sse_event, sse_response
 from crud.crud import create_report
 
 router = APIRouter()
 
-action_service = ActionItemsService()
+# Files analyzed (polars, CPU bound) at the same time by the batch endpoint
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+def _analyze_data_file(file_path: str) -> dict:
+    processor = DataProcessor()
+    df = processor.read_file(file_path)
+    
+    return {
+        "summary": processor.get_data_summary(df),
+        "kpis": processor.calculate_kpis(df),
+        "trends": processor.identify_trends(df),
+        "sample_data": processor.generate_sample_data(df)
+    }
 
 @router.post("/process-data/", response_model=DataProcessingResponse)
 async def process_data(
+    http_request: Request,
     file: UploadFile = File(...),
     generate_actions: bool = True,
-    business_context: str = ""
+    business_context: str = "",
+    refine_priorities: bool = False,
+    mode: ActionMode = "llm"
 ):
     try:
         file_path = await save_file(file)
@@ -66,11 +87,11 @@ async def process_data(
                 }
                 
                 if business_context:
-                    action_result = action_service.generate_prioritized_actions(
-                        analysis_results, business_context
-                    )
+                    action_result = await await_llm(action_service.agenerate_actions(
+                        analysis_results, business_context, refine=refine_priorities, mode=mode
+                    ), http_request)
                 else:
-                    action_result = action_service.generate_action_items(analysis_results)
+                    action_result = await await_llm(action_service.agenerate_actions(analysis_results, mode=mode), http_request)
                 
                 action_items = []
                 for item in action_result.get('action_items', []):
@@ -80,11 +101,14 @@ async def process_data(
                     action_items=action_items,
                     summary=action_result.get('summary', ''),
                     key_insights=action_result.get('key_insights', []),
-                    note=action_result.get('note')
+                    note=action_result.get('note'),
+                    prompt_usage=action_result.get('prompt_usage')
                 )
                 
                 response_data["action_items"] = action_items_response
                 
+            except HTTPException:
+                raise
             except Exception as e:
                 response_data["action_items"] = ActionItemsResponse(
                     action_items=[],
@@ -95,6 +119,8 @@ async def process_data(
         
         return response_data
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"DEBUG: Error in process_data: {str(e)}")
         print(f"DEBUG: Traceback: {traceback.format_exc()}")
@@ -102,27 +128,22 @@ async def process_data(
 
 @router.post("/generate-actions-from-file/")
 async def generate_actions_from_file(
+    http_request: Request,
     file: UploadFile = File(...),
-    business_context: str = ""
+    business_context: str = "",
+    refine_priorities: bool = False,
+    mode: ActionMode = "llm"
 ):
     try:
         file_path = await save_file(file)
-        processor = DataProcessor()
-        df = processor.read_file(file_path)
-        
-        analysis_results = {
-            "summary": processor.get_data_summary(df),
-            "kpis": processor.calculate_kpis(df),
-            "trends": processor.identify_trends(df),
-            "sample_data": processor.generate_sample_data(df)
-        }
+        analysis_results = await asyncio.to_thread(_analyze_data_file, file_path)
         
         if business_context:
-            result = action_service.generate_prioritized_actions(
-                analysis_results, business_context
-            )
+            result = await await_llm(action_service.agenerate_actions(
+                analysis_results, business_context, refine=refine_priorities, mode=mode
+            ), http_request)
         else:
-            result = action_service.generate_action_items(analysis_results)
+            result = await await_llm(action_service.agenerate_actions(analysis_results, mode=mode), http_request)
         
         action_items = []
         for item in result.get('action_items', []):
@@ -132,12 +153,68 @@ async def generate_actions_from_file(
             action_items=action_items,
             summary=result.get('summary', ''),
             key_insights=result.get('key_insights', []),
-            note=result.get('note')
+            note=result.get('note'),
+            prompt_usage=result.get('prompt_usage')
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Action generation failed: {str(e)}")
 
+@router.post("/generate-actions-batch/")
+async def generate_actions_batch(
+    files: List[UploadFile] = File(...),
+    business_context: str = "",
+    refine_priorities: bool = False,
+    mode: ActionMode = "llm"
+):
+    """Analyze many files in parallel and stream each file's action items (SSE) as soon as it is ready"""
+    saved = [(file.filename, await save_file(file)) for file in files]
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    
+    async def analyze(file_path: str) -> dict:
+        async with semaphore:
+            return await asyncio.to_thread(_analyze_data_file, file_path)
+    
+    async def events():
+        start = time.perf_counter()
+        failed = 0
+        analyses = [analyze(file_path) for _, file_path in saved]
+        
+        async for index, result, error in action_service.abatch_action_items(
+            analyses, business_context, refine_priorities, mode
+        ):
+            filename = saved[index][0]
+            if error is not None:
+                failed += 1
+                yield sse_event("error", {"index": index, "filename": filename, "detail": f"Action generation failed: {str(error)}"})
+                continue
+            
+            try:
+                response = ActionItemsResponse(
+                    action_items=[ActionItem(**item) for item in result.get('action_items', [])],
+                    summary=result.get('summary', ''),
+                    key_insights=result.get('key_insights', []),
+                    note=result.get('note'),
+                    prompt_usage=result.get('prompt_usage')
+                )
+                yield sse_event("action_items", {"index": index, "filename": filename, **response.model_dump()})
+            except Exception as e:
+                failed += 1
+                yield sse_event("error", {"index": index, "filename": filename, "detail": f"Action generation failed: {str(e)}"})
+        
+        elapsed = time.perf_counter() - start
+        yield sse_event("done", {
+            "files": len(saved),
+            "succeeded": len(saved) - failed,
+            "failed": failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "files_per_minute": round(len(saved) * 60 / elapsed, 2) if elapsed else None
+        })
+    
+    return sse_response(events())
+
 @router.post("/visualize/")
 async def visualize_data(
     file: UploadFile = File(...),
@@ -223,6 +300,7 @@ async def visualize_data(
 
 @router.post("/parse/", response_model=MarkdownResponse)
 async def parse_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
@@ -237,8 +315,6 @@ async def parse_file(
         
         file_id = f"{os.path.splitext(file.filename)[0]}_{int(datetime.now().timestamp())}"
 
-        add_document_to_rag(file_id, markdown_content)
-        
         report_data = {
             "filename": file.filename,
             "file_type": file.content_type,
@@ -251,8 +327,12 @@ async def parse_file(
             }
         }
         
+        # Created first so the corpus nodes carry its report_id
         db_report = create_report(db, ReportCreate(**report_data))
         
+        await aadd_document_to_rag(file_id, markdown_content, db_report.id)
+        background_tasks.add_task(summary_service.aprecompute_summaries, file_id)
+        
         response = MarkdownResponse(
             filename=file.filename,
             markdown_content=markdown_content,
@@ -1,22 +1,25 @@
 # api/llama_parse.py
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Request, BackgroundTasks
 from sqlalchemy.orm import Session
 import os
 from datetime import datetime
 
 from services.file_service import save_file, parse_with_llamaparse, save_markdown
-from services.rag_service import add_document_to_rag
-from services.summary_service import SummaryService
+from services.rag_service import aadd_document_to_rag
+from services.summary_service import summary_service
 from models.file_model import MarkdownResponse
-from models.schemas import ReportCreate, SummaryCreate
+from models.schemas import ReportCreate
 from models.summary_model import SummaryRequest, SummaryResponse as SummaryResponseModel
 from core.database import get_db
-from crud.crud import create_report, get_report_by_file_id, create_summary, get_summary_by_report_id
+from core.llm_calls import await_llm
+from crud.crud import create_report, get_report_by_file_id
 
 router = APIRouter()
 
 @router.post("/llama-parse/", response_model=MarkdownResponse)
 async def parse_pdf(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     generate_summary: bool = True,
     max_length: int = 500,
@@ -29,13 +32,6 @@ async def parse_pdf(
         
         file_id = f"{os.path.splitext(file.filename)[0]}_{int(datetime.now().timestamp())}"
         
-        add_document_to_rag(file_id, markdown_content)
-        
-        summary_text = None
-        if generate_summary:
-            summary_service = SummaryService()
-            summary_text = summary_service.summarize_document(file_id, max_length)
-        
         report_data = {
             "filename": file.filename,
             "file_type": file.content_type,
@@ -45,18 +41,22 @@ async def parse_pdf(
                 "char_count": len(markdown_content),
                 "word_count": len(markdown_content.split()),
                 "file_id": file_id,
-                "summary": summary_text
+                "summary": None
             }
         }
         
+        # Created first so the corpus nodes carry its report_id
         db_report = create_report(db, ReportCreate(**report_data))
         
-        if generate_summary and summary_text:
-            summary_create = SummaryCreate(
-                report_id=db_report.id,
-                summary_text=summary_text
-            )
-            create_summary(db, summary_create)
+        await aadd_document_to_rag(file_id, markdown_content, db_report.id)
+        
+        summary_text = None
+        if generate_summary:
+            summary_text = await await_llm(summary_service.aget_summary(db, file_id, max_length), http_request)
+            db_report.data = {**report_data["data"], "summary": summary_text}
+            db.commit()
+        # Remaining length buckets are generated after the response is sent
+        background_tasks.add_task(summary_service.aprecompute_summaries, file_id)
         
         return MarkdownResponse(
             filename=file.filename,
@@ -69,12 +69,15 @@ async def parse_pdf(
             report_id=db_report.id
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF parsing failed: {str(e)}")
 
 @router.post("/llama-parse/summarize/", response_model=SummaryResponseModel)
 async def summarize_parsed_pdf(
     request: SummaryRequest,
+    http_request: Request,
     db: Session = Depends(get_db)
 ):
     """Generate a summary for a previously parsed PDF document"""
@@ -84,25 +87,13 @@ async def summarize_parsed_pdf(
         if not report:
             raise HTTPException(status_code=404, detail="Report not found")
         
-        existing_summary = get_summary_by_report_id(db, report.id)
-        if existing_summary:
-            return SummaryResponseModel(
-                file_id=request.file_id,
-                summary=existing_summary.summary_text
-            )
-        
-        summary_service = SummaryService()
-        summary_text = summary_service.summarize_document(request.file_id, request.max_length)
-        
-        summary_create = SummaryCreate(
-            report_id=report.id,
-            summary_text=summary_text
-        )
-        db_summary = create_summary(db, summary_create)
+        summary_text = await await_llm(summary_service.aget_summary(db, request.file_id, request.max_length), http_request)
         
         return SummaryResponseModel(
             file_id=request.file_id,
-            summary=db_summary.summary_text
+            summary=summary_text
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Summarization failed: {str(e)}")
\ No newline at end of file
@@ -1,35 +1,78 @@
-from fastapi import APIRouter, Depends, HTTPException
-from services.rag_service import RAGService
+from fastapi import APIRouter, Depends, HTTPException, Request
+from services.rag_service import rag_service
+from core.llm_calls import await_llm
+from core.sse import sse_event, sse_response
 from models.rag_model import (
     AddDocumentRequest, AddDocumentResponse,
-    QueryRequest, QueryResponse
+    QueryRequest, QueryResponse,
+    QueryBatchRequest, QueryBatchResponse
 )
 
 router = APIRouter()
 
-rag_service = RAGService()
-
 @router.post("/add-document/", response_model=AddDocumentResponse)
 async def add_document(request: AddDocumentRequest):
     try:
-        message = rag_service.add_document(request.file_id, request.text)
-        return AddDocumentResponse(message=message)
+        stats = await rag_service.aingest_document(request.file_id, request.text, request.report_id)
+        return AddDocumentResponse(message=f"Document {request.file_id} is added", ingest_stats=stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Doküman eklenemedi: {str(e)}")
 
 @router.post("/query/", response_model=QueryResponse)
-async def query_document(request: QueryRequest):
+async def query_document(request: QueryRequest, http_request: Request):
     try:
-        response = rag_service.query(request.file_id, request.query)
+        response = await await_llm(rag_service.aquery(
+            request.file_id, request.query, request.file_ids, request.filters,
+            mode=request.mode, response_mode=request.response_mode
+        ), http_request)
         print(response)
         return QueryResponse(**response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Sorgu yapılamadı: {str(e)}")
+
+@router.post("/query/batch", response_model=QueryBatchResponse)
+async def query_batch(request: QueryBatchRequest, http_request: Request):
+    """Answer many questions over the same documents: one embedding request, shared retrieval, concurrent answers"""
+    try:
+        response = await await_llm(rag_service.abatch_query(
+            request.file_id, request.queries, request.file_ids, request.filters, request.response_mode
+        ), http_request)
+        return QueryBatchResponse(**response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Sorgu yapılamadı: {str(e)}")
 
+@router.post("/query/stream")
+async def stream_query(request: QueryRequest):
+    """Stream a RAG answer as Server-Sent Events: sources, token, result (or error)"""
+    async def events():
+        try:
+            sources = []
+            answer = ""
+            async for event, data in rag_service.astream_query(
+                request.file_id, request.query, request.file_ids, request.filters, mode=request.mode
+            ):
+                if event == "sources":
+                    sources = data
+                    yield sse_event("sources", data)
+                elif event == "token":
+                    yield sse_event("token", {"delta": data})
+                else:
+                    answer = data
+            
+            yield sse_event("result", QueryResponse(query=request.query, answer=answer, sources=sources).model_dump())
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Sorgu yapılamadı: {str(e)}"})
+    
+    return sse_response(events())
+
 @router.delete("/document/{file_id}")
 async def delete_document(file_id: str):
     try:
-        message = rag_service.delete_document(file_id)
+        message = await rag_service.adelete_document(file_id)
         return {"message": message}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Doküman silinemedi: {str(e)}")
\ No newline at end of file
@@ -1,5 +1,5 @@
 # api/structured_parse.py
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Request
 from sqlalchemy.orm import Session
 import os
 import numpy as np
@@ -7,10 +7,12 @@ from datetime import datetime
 
 from services.file_service import save_file, process_file
 from services.data_processor import DataProcessor
-from services.action_service import ActionItemsService
-from services.rag_service import add_document_to_rag
+from services.action_service import action_service
+from services.rag_service import aadd_document_to_rag
 from models.data_model import DataProcessingResponse
 from core.database import get_db
+from core.llm_calls import await_llm
+from models.action_model import ActionMode
 from crud.crud import create_report
 from models.schemas import ReportCreate
 
@@ -18,9 +20,12 @@ router = APIRouter()
 
 @router.post("/parse/", response_model=DataProcessingResponse)
 async def parse_structured_data(
+    http_request: Request,
     file: UploadFile = File(...),
     generate_actions: bool = True,
     business_context: str = "",
+    refine_priorities: bool = False,
+    mode: ActionMode = "llm",
     add_to_rag: bool = True,
     db: Session = Depends(get_db)
 ):
@@ -42,8 +47,6 @@ async def parse_structured_data(
                 markdown_content = file_info["markdown_content"]
                 
                 rag_file_id = f"{os.path.splitext(file.filename)[0]}_kpi_{int(datetime.now().timestamp())}"
-                
-                add_document_to_rag(rag_file_id, markdown_content)
 
         processor = DataProcessor()
         df = processor.read_file(file_path)
@@ -91,17 +94,17 @@ async def parse_structured_data(
                     "sample_data": sample_data
                 }
                 
-                action_service = ActionItemsService()
-                
                 if business_context:
-                    action_result = action_service.generate_prioritized_actions(
-                        analysis_results, business_context
-                    )
+                    action_result = await await_llm(action_service.agenerate_actions(
+                        analysis_results, business_context, refine=refine_priorities, mode=mode
+                    ), http_request)
                 else:
-                    action_result = action_service.generate_action_items(analysis_results)
+                    action_result = await await_llm(action_service.agenerate_actions(analysis_results, mode=mode), http_request)
                 
                 action_items_dict = action_result if isinstance(action_result, dict) else action_result.dict()
                 
+            except HTTPException:
+                raise
             except Exception as e:
                 action_items_dict = {
                     "action_items": [],
@@ -126,6 +129,8 @@ async def parse_structured_data(
         db_report = create_report(db, ReportCreate(**report_data))
 
         if add_to_rag and rag_file_id and markdown_content:
+            # Added once the report exists so the corpus nodes carry its report_id
+            await aadd_document_to_rag(rag_file_id, markdown_content, db_report.id)
             report_data["data"]["rag_file_id"] = rag_file_id
             report_data["data"]["markdown_report"] = markdown_content
             
@@ -144,6 +149,8 @@ async def parse_structured_data(
             rag_file_id=rag_file_id
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Data processing failed: {str(e)}")
     
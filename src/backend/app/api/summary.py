@@ -1,19 +1,21 @@
 # api/summary.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 import traceback
 
-from services.summary_service import SummaryService
+from services.summary_service import summary_service, length_bucket
 from models.summary_model import SummaryRequest, SummaryResponse as SummaryResponseModel
-from models.schemas import SummaryCreate
-from core.database import get_db
-from crud.crud import create_summary, get_summary_by_report_id, get_report_by_file_id
+from core.database import get_db, SessionLocal
+from core.sse import sse_event, sse_response
+from core.llm_calls import await_llm
+from crud.crud import get_report_by_file_id
 
 router = APIRouter()
 
 @router.post("/summarize/", response_model=SummaryResponseModel)
 async def summarize_document(
     request: SummaryRequest,
+    http_request: Request,
     db: Session = Depends(get_db)
 ):
     try:
@@ -22,28 +24,57 @@ async def summarize_document(
         if not report:
             raise HTTPException(status_code=404, detail="Report not found")
         
-        existing_summary = get_summary_by_report_id(db, report.id)
-        
-        if existing_summary:
-            return SummaryResponseModel(
-                file_id=request.file_id,
-                summary=existing_summary.summary_text
-            )
-        
-        summary_service = SummaryService()
-        summary_text = summary_service.summarize_document(request.file_id, request.max_length)
-        
-        summary_create = SummaryCreate(
-            report_id=report.id,
-            summary_text=summary_text
-        )
-
-        db_summary = create_summary(db, summary_create)
+        summary_text = await await_llm(summary_service.aget_summary(db, request.file_id, request.max_length), http_request)
         
         return SummaryResponseModel(
             file_id=request.file_id,
-            summary=db_summary.summary_text
+            summary=summary_text
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"DEBUG: Traceback: {traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=f"Summarization failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Summarization failed: {str(e)}")
+
+@router.post("/summarize/stream")
+async def stream_summary(
+    request: SummaryRequest,
+    db: Session = Depends(get_db)
+):
+    """Stream a document summary as Server-Sent Events: sources, token, result (or error)"""
+    report = get_report_by_file_id(db, request.file_id)
+    
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    existing_text = summary_service.stored_summary(db, request.file_id, request.max_length)
+    max_length = length_bucket(request.max_length)
+    
+    async def events():
+        if existing_text is not None:
+            yield sse_event("result", {"file_id": request.file_id, "summary": existing_text})
+            return
+        
+        try:
+            summary_text = ""
+            async for event, data in summary_service.astream_summary(request.file_id, max_length):
+                if event == "token":
+                    yield sse_event("token", {"delta": data})
+                elif event == "sources":
+                    yield sse_event("sources", data)
+                else:
+                    summary_text = data
+            
+            # The request-scoped session is closed once streaming starts, persist with a fresh one
+            stream_db = SessionLocal()
+            try:
+                summary_service.store_summary(stream_db, request.file_id, max_length, summary_text)
+            finally:
+                stream_db.close()
+            
+            yield sse_event("result", {"file_id": request.file_id, "summary": summary_text})
+        except Exception as e:
+            print(f"DEBUG: Traceback: {traceback.format_exc()}")
+            yield sse_event("error", {"detail": f"Summarization failed: {str(e)}"})
+    
+    return sse_response(events())
@@ -0,0 +1,93 @@
+# benchmarks/bench_index_load.py
+"""Startup and first-query latency of a persisted index: JSON persist dir vs. binary snapshot.
+
+Builds a synthetic index with random embeddings (no embedding model needed), persists it
+as JSON, migrates a copy to the snapshot format and loads both:
+
+    cd src/backend/app
+    python benchmarks/bench_index_load.py --nodes 20000 --dim 1536
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from llama_index.core import StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import QueryBundle, TextNode
+
+from services.index_snapshot import load_index
+
+WORDS = "revenue churn growth customer invoice total month region margin forecast".split()
+
+
+def build_json_index(directory: str, nodes: int, dim: int):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(nodes, dim)).astype(np.float32)
+    text_nodes = [
+        TextNode(
+            id_=f"node-{i}",
+            text=" ".join(rng.choice(WORDS, size=120)),
+            embedding=vectors[i].tolist(),
+            metadata={"file_id": f"file-{i % 20}", "section": f"Section {i % 7}"}
+        )
+        for i in range(nodes)
+    ]
+    index = VectorStoreIndex(text_nodes, embed_model=MockEmbedding(embed_dim=dim))
+    index.storage_context.persist(persist_dir=directory)
+    return vectors[0].tolist()
+
+
+def measure(load, directory: str, query_embedding):
+    start = time.perf_counter()
+    index = load(directory)
+    loaded = time.perf_counter()
+    retriever = index.as_retriever(similarity_top_k=5)
+    nodes = retriever.retrieve(QueryBundle("total revenue", embedding=query_embedding))
+    nodes[0].node.get_content()
+    return loaded - start, time.perf_counter() - loaded
+
+
+def load_json(directory: str):
+    return load_index_from_storage(StorageContext.from_defaults(persist_dir=directory))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        json_dir = os.path.join(root, "json")
+        snapshot_dir = os.path.join(root, "snapshot")
+        query_embedding = build_json_index(json_dir, args.nodes, args.dim)
+        shutil.copytree(json_dir, snapshot_dir)
+
+        start = time.perf_counter()
+        load_index(snapshot_dir)
+        migration = time.perf_counter() - start
+
+        json_load, json_query = measure(load_json, json_dir, query_embedding)
+        snapshot_load, snapshot_query = measure(load_index, snapshot_dir, query_embedding)
+
+        def size_mb(path):
+            return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files) / 1024 / 1024
+
+        print(f"nodes: {args.nodes}, dim: {args.dim}, one-time migration: {migration:.2f}s")
+        print(f"{'format':<10}{'size (MB)':>12}{'load (s)':>12}{'first query (s)':>18}")
+        print(f"{'json':<10}{size_mb(json_dir):>12.1f}{json_load:>12.3f}{json_query:>18.3f}")
+        print(f"{'snapshot':<10}{size_mb(snapshot_dir):>12.1f}{snapshot_load:>12.3f}{snapshot_query:>18.3f}")
+        print(f"startup + first query speedup: {(json_load + json_query) / (snapshot_load + snapshot_query):.1f}x")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_prioritized_actions.py
+"""Latency of single-call prioritized actions vs. the two-pass reprioritization flow.
+
+Runs offline against the fake LLM with a simulated per-call latency:
+
+    cd src/backend/app
+    python benchmarks/bench_prioritized_actions.py --latency 1.5 --runs 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ANALYSIS_RESULTS = {
+    "summary": {
+        "rows": 1200,
+        "columns": 4,
+        "column_names": ["month", "revenue", "churn", "signups"],
+        "null_counts": {"month": 0, "revenue": 3, "churn": 0, "signups": 12}
+    },
+    "kpis": {
+        "statistics": {
+            "revenue": [1000.0, 9000.0, 5100.0, 4900.0, 1200.0],
+            "churn": [0.01, 0.09, 0.04, 0.04, 0.02]
+        },
+        "categorical": {"month": {"unique_count": 12, "most_common": "Jan"}}
+    },
+    "trends": [
+        {"column": "revenue", "trend": "decreasing", "correlation": -0.71},
+        {"column": "churn", "trend": "increasing", "correlation": 0.55},
+        {"column": "signups", "trend": "increasing", "correlation": 0.32}
+    ]
+}
+BUSINESS_CONTEXT = "Q3 focus is retention; marketing budget is frozen."
+
+
+async def measure(service, refine: bool, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await service.agenerate_prioritized_actions(ANALYSIS_RESULTS, BUSINESS_CONTEXT, refine=refine)
+        timings.append(time.perf_counter() - start)
+    return sum(timings) / len(timings)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=1.0, help="simulated seconds per LLM call")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["FAKE_LLM_LATENCY"] = str(args.latency)
+    from services.action_service import action_service as service
+
+    single = await measure(service, refine=False, runs=args.runs)
+    two_pass = await measure(service, refine=True, runs=args.runs)
+
+    print(f"LLM latency per call: {args.latency:.2f}s, runs: {args.runs}")
+    print(f"{'mode':<24}{'avg latency (s)':>16}")
+    print(f"{'single call':<24}{single:>16.3f}")
+    print(f"{'two-pass (refine)':<24}{two_pass:>16.3f}")
+    print(f"speedup: {two_pass / single:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+# benchmarks/bench_quantization.py
+"""Memory, query latency and recall@k of the quantized numpy vector store vs. exact search.
+
+Uses clustered random vectors (no embedding model needed); recall@k is the share of the
+exact top-k that the int8 and binary stores return after rescoring:
+
+    cd src/backend/app
+    python benchmarks/bench_quantization.py --vectors 50000 --dim 1536 --top-k 5
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import VectorStoreQuery
+
+from services.numpy_vector_store import NumpyVectorStore, NUMPY_STORE_RESCORE_FACTOR, quantize
+
+
+def clustered_vectors(rng, centers: np.ndarray, count: int, spread: float = 0.6) -> np.ndarray:
+    """Vectors around topic centers, like chunks of reports on a few hundred subjects"""
+    noise = spread * rng.normal(size=(count, centers.shape[1]))
+    return (centers[rng.integers(0, len(centers), count)] + noise).astype(np.float32)
+
+
+def query_ids(store, queries: np.ndarray, top_k: int):
+    start = time.perf_counter()
+    ids = [store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=top_k)).ids for query in queries]
+    return ids, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--rescore-factor", type=int, default=NUMPY_STORE_RESCORE_FACTOR, help="default: 10 for int8, 40 for binary")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(args.clusters, args.dim))
+    vectors = clustered_vectors(rng, centers, args.vectors)
+    queries = clustered_vectors(rng, centers, args.queries)
+    nodes = [TextNode(id_=f"node-{i}", text="", embedding=vector.tolist()) for i, vector in enumerate(vectors)]
+
+    root = tempfile.mkdtemp()
+    try:
+        rows = []
+        exact_ids = None
+        for quantization in ("none", "int8", "binary"):
+            directory = os.path.join(root, quantization)
+            store = NumpyVectorStore(quantization=quantization, rescore_factor=args.rescore_factor)
+            store.add(nodes)
+            store.persist(os.path.join(directory, "default__vector_store.json"))
+            loaded = NumpyVectorStore.from_persist_dir(
+                directory, quantization=quantization, rescore_factor=args.rescore_factor
+            )
+
+            ids, query_ms = query_ids(loaded, queries, args.top_k)
+            if exact_ids is None:
+                exact_ids = ids
+            recall = np.mean([len(set(found) & set(exact)) / len(exact) for found, exact in zip(ids, exact_ids)])
+            # Memory the scan keeps resident: the full vectors for exact search, the codes otherwise
+            if quantization == "none":
+                scanned = vectors.nbytes
+            else:
+                matrix, scales = quantize(vectors, quantization)
+                scanned = matrix.nbytes + (0 if scales is None else scales.nbytes)
+            rows.append((quantization, scanned, query_ms, recall))
+
+        print(f"vectors: {args.vectors}, dim: {args.dim}, queries: {args.queries}, "
+              f"top_k: {args.top_k}, rescore factor: {args.rescore_factor or 'default'}")
+        print(f"{'store':<10}{'scan memory (MB)':>18}{'reduction':>11}{'query (ms)':>12}{f'recall@{args.top_k}':>11}")
+        for quantization, scanned, query_ms, recall in rows:
+            print(f"{quantization:<10}{scanned / 1024 / 1024:>18.1f}{rows[0][1] / scanned:>10.1f}x"
+                  f"{query_ms:>12.2f}{recall:>11.3f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_vector_store.py
+"""Query, persist and load latency of the numpy vector store vs. llama_index's SimpleVectorStore.
+
+Uses random unit vectors, so no embedding model is needed:
+
+    cd src/backend/app
+    python benchmarks/bench_vector_store.py --vectors 50000 --dim 1536 --queries 50
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import SimpleVectorStore, VectorStoreQuery
+
+from services.corpus_index import build_filters
+from services.numpy_vector_store import NumpyVectorStore
+
+
+def make_nodes(vectors: np.ndarray, files: int):
+    return [
+        TextNode(id_=f"node-{i}", text="", embedding=vector.tolist(), metadata={"file_id": f"file-{i % files}"})
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def measure(store, load, queries: np.ndarray, top_k: int, file_ids):
+    directory = tempfile.mkdtemp()
+    try:
+        _, persist_seconds = timed(store.persist, os.path.join(directory, "default__vector_store.json"))
+        loaded, load_seconds = timed(load, directory)
+
+        filters = build_filters(file_ids)
+        results = {}
+        for name, query_filters in (("query", None), ("filtered query", filters)):
+            start = time.perf_counter()
+            for query in queries:
+                loaded.query(VectorStoreQuery(
+                    query_embedding=query.tolist(), similarity_top_k=top_k, filters=query_filters
+                ))
+            results[name] = (time.perf_counter() - start) / len(queries) * 1000
+        return persist_seconds, load_seconds, results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--files", type=int, default=50, help="distinct file_id values in the metadata")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.vectors, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(args.vectors, size=args.queries, replace=False)]
+    nodes = make_nodes(vectors, args.files)
+    file_ids = [f"file-{i}" for i in range(min(3, args.files))]
+
+    numpy_store = NumpyVectorStore()
+    _, numpy_add = timed(numpy_store.add, nodes)
+    simple_store = SimpleVectorStore()
+    _, simple_add = timed(simple_store.add, nodes)
+
+    rows = [
+        ("numpy", numpy_add, *measure(numpy_store, NumpyVectorStore.from_persist_dir, queries, args.top_k, file_ids)),
+        ("simple", simple_add, *measure(simple_store, SimpleVectorStore.from_persist_dir, queries, args.top_k, file_ids))
+    ]
+
+    print(f"vectors: {args.vectors}, dim: {args.dim}, queries: {args.queries}, top_k: {args.top_k}")
+    print(f"{'store':<10}{'add (s)':>10}{'persist (s)':>14}{'load (s)':>12}{'query (ms)':>14}{'filtered (ms)':>16}")
+    for name, add_seconds, persist_seconds, load_seconds, queries_ms in rows:
+        print(f"{name:<10}{add_seconds:>10.2f}{persist_seconds:>14.2f}{load_seconds:>12.2f}"
+              f"{queries_ms['query']:>14.2f}{queries_ms['filtered query']:>16.2f}")
+    print(f"query speedup: {rows[1][4]['query'] / rows[0][4]['query']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
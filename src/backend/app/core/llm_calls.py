@@ -0,0 +1,43 @@
+# core/llm_calls.py
+import asyncio
+import os
+from typing import Any, Awaitable, Optional
+
+from fastapi import HTTPException, Request
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+async def _wait_for_disconnect(request: Request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def await_llm(
+    call: Awaitable[Any],
+    request: Optional[Request] = None,
+    timeout: Optional[float] = None
+) -> Any:
+    """Await an async LLM call with a timeout, cancelling it if the client goes away"""
+    timeout = LLM_TIMEOUT if timeout is None else timeout
+
+    task = asyncio.ensure_future(call)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request)) if request is not None else None
+    waiting = {task} if watcher is None else {task, watcher}
+
+    try:
+        done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+        if task in done:
+            return task.result()
+
+        task.cancel()
+        if watcher is not None and watcher in done:
+            raise HTTPException(status_code=499, detail="Client disconnected, LLM call cancelled")
+        raise HTTPException(status_code=504, detail=f"LLM call timed out after {timeout:.0f}s")
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if not task.done():
+            task.cancel()
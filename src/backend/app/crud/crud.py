@@ -1,8 +1,9 @@
 # crud/crud.py
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from models.database import Report, Summary
-from models.schemas import ReportCreate, SummaryCreate
+from sqlalchemy.exc import IntegrityError
+from models.database import Report, StoredSummary
+from models.schemas import ReportCreate, StoredSummaryCreate
 
 def create_report(db: Session, report: ReportCreate) -> Report:
     db_report = Report(
@@ -26,16 +27,22 @@ def get_report(db: Session, report_id: int):
     report = db.query(Report).filter(Report.id == report_id).first()
     return report
 
-def create_summary(db: Session, summary: SummaryCreate) -> Summary:
-    db_summary = Summary(
-        report_id=summary.report_id,
-        summary_text=summary.summary_text
-    )
+def get_stored_summary(db: Session, file_id: str, length_bucket: int, model: str):
+    summary = db.query(StoredSummary).filter(
+        StoredSummary.file_id == file_id,
+        StoredSummary.length_bucket == length_bucket,
+        StoredSummary.model == model
+    ).first()
+    return summary
+
+def save_stored_summary(db: Session, summary: StoredSummaryCreate) -> StoredSummary:
+    db_summary = StoredSummary(**summary.model_dump())
     db.add(db_summary)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Stored concurrently by another request or the ingest batch
+        db.rollback()
+        return get_stored_summary(db, summary.file_id, summary.length_bucket, summary.model)
     db.refresh(db_summary)
-    return db_summary
-
-def get_summary_by_report_id(db: Session, report_id: int):
-    summary = db.query(Summary).filter(Summary.report_id == report_id).first()
-    return summary
\ No newline at end of file
+    return db_summary
\ No newline at end of file
@@ -1,5 +1,5 @@
 # main.py
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from datetime import datetime
@@ -13,16 +13,20 @@ import traceback
 import uvicorn
 
 from services.file_service import save_file, process_file, parse_with_llamaparse, save_markdown
-from services.summary_service import SummaryService
+from services.summary_service import summary_service
 from services.data_processor import DataProcessor
-from services.action_service import ActionItemsService
-from services.rag_service import add_document_to_rag
+from services.action_service import action_service
+from services.rag_service import aadd_document_to_rag
+from services.client_registry import registry
+from services.index_registry import index_registry
+from services.query_cache import query_cache
+from services.query_engines import query_engine_cache
 
 from models.file_model import FileResponse
 from models.summary_model import SummaryRequest, SummaryResponse as SummaryResponseModel
 from models.database import create_tables
-from models.schemas import SummaryCreate
 from models.schemas import ReportCreate
+from models.action_model import ActionMode
 
 from api.data import router as data_router
 from api.rag import router as rag_router
@@ -32,8 +36,9 @@ from api.summary import router as summary_router
 from api.action import router as action_router
 from api.data import router as data_router
 
-from crud.crud import create_report, get_report_by_file_id, create_summary, get_summary_by_report_id
+from crud.crud import create_report, get_report_by_file_id
 from core.database import get_db
+from core.llm_calls import await_llm
 
 app = FastAPI(title="File Upload and Data Processing Service")
 
@@ -66,6 +71,7 @@ async def upload_file(file: UploadFile = File(...), for_rag: bool = False):
 @app.post("/api/summary/summarize/", response_model=SummaryResponseModel)
 async def summarize_document(
     request: SummaryRequest,
+    http_request: Request,
     db: Session = Depends(get_db)
 ):   
     try:
@@ -74,28 +80,14 @@ async def summarize_document(
         if not report:
             raise HTTPException(status_code=404, detail="Report not found")
         
-        existing_summary = get_summary_by_report_id(db, report.id)
-        
-        if existing_summary:
-            return SummaryResponseModel(
-                file_id=request.file_id,
-                summary=existing_summary.summary_text
-            )
-        
-        summary_service = SummaryService()
-        summary_text = summary_service.summarize_document(request.file_id, request.max_length)
-        
-        summary_create = SummaryCreate(
-            report_id=report.id,
-            summary_text=summary_text
-        )
-
-        db_summary = create_summary(db, summary_create)
+        summary_text = await await_llm(summary_service.aget_summary(db, request.file_id, request.max_length), http_request)
         
         return SummaryResponseModel(
             file_id=request.file_id,
-            summary=db_summary.summary_text
+            summary=summary_text
         )
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         print(f"DEBUG: Traceback: {traceback.format_exc()}")
@@ -103,10 +95,14 @@ async def summarize_document(
 
 @app.post("/api/data/process-data/")
 async def process_data(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     generate_summary: bool = True,
     generate_actions: bool = True,
     business_context: str = "",
+    refine_priorities: bool = False,
+    mode: ActionMode = "llm",
     db: Session = Depends(get_db)
 ):
     try:
@@ -121,13 +117,6 @@ async def process_data(
                 
                 file_id = f"{os.path.splitext(file.filename)[0]}_{int(datetime.now().timestamp())}"
                 
-                rag_result = add_document_to_rag(file_id, markdown_content)
-                
-                summary_text = None
-                if generate_summary:
-                    summary_service = SummaryService()
-                    summary_text = summary_service.summarize_document(file_id)
-                
                 report_data = {
                     "filename": file.filename,
                     "file_type": file.content_type,
@@ -137,12 +126,23 @@ async def process_data(
                         "char_count": len(markdown_content),
                         "word_count": len(markdown_content.split()),
                         "file_id": file_id,
-                        "summary": summary_text
+                        "summary": None
                     }
                 }
                 
+                # Created first so the corpus nodes carry its report_id
                 db_report = create_report(db, ReportCreate(**report_data))
                 
+                rag_result = await aadd_document_to_rag(file_id, markdown_content, db_report.id)
+                
+                summary_text = None
+                if generate_summary:
+                    summary_text = await await_llm(summary_service.aget_summary(db, file_id), http_request)
+                    db_report.data = {**report_data["data"], "summary": summary_text}
+                    db.commit()
+                # Remaining length buckets are generated after the response is sent
+                background_tasks.add_task(summary_service.aprecompute_summaries, file_id)
+                
                 return {
                     "filename": file.filename,
                     "file_type": file.content_type,
@@ -155,6 +155,8 @@ async def process_data(
                     "report_id": db_report.id
                 }
                 
+            except HTTPException:
+                raise
             except Exception as e:
                 import traceback
                 print(f"DEBUG: Traceback: {traceback.format_exc()}")
@@ -207,17 +209,17 @@ async def process_data(
                             "sample_data": sample_data
                         }
                         
-                        action_service = ActionItemsService()
-                        
                         if business_context:
-                            action_result = action_service.generate_prioritized_actions(
-                                analysis_results, business_context
-                            )
+                            action_result = await await_llm(action_service.agenerate_actions(
+                                analysis_results, business_context, refine=refine_priorities, mode=mode
+                            ), http_request)
                         else:
-                            action_result = action_service.generate_action_items(analysis_results)
+                            action_result = await await_llm(action_service.agenerate_actions(analysis_results, mode=mode), http_request)
                         
                         action_items_dict = action_result if isinstance(action_result, dict) else action_result.dict()
                         
+                    except HTTPException:
+                        raise
                     except Exception as e:
                         print(f"DEBUG: Error generating action items: {str(e)}")
                         action_items_dict = {
@@ -254,6 +256,8 @@ async def process_data(
                     "report_id": db_report.id
                 }
                 
+            except HTTPException:
+                raise
             except Exception as e:
                 import traceback
                 print(f"DEBUG: Traceback: {traceback.format_exc()}")
@@ -262,6 +266,8 @@ async def process_data(
         else:
             raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_ext}. Only PDF, CSV, TSV, and Excel files are supported.")
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"DEBUG: Error in process_data: {str(e)}")
         import traceback
@@ -362,12 +368,37 @@ async def visualize_data(
 @app.on_event("startup")
 async def startup_event():
     create_tables()
+    await registry.startup()
     
     print("DEBUG: Registered routes:")
     for route in app.routes:
         if hasattr(route, 'methods') and hasattr(route, 'path'):
             print(f"  {route.methods} {route.path}")
 
+@app.get("/api/llm-cache/stats")
+def llm_cache_stats():
+    return registry.llm_cache_stats()
+
+@app.get("/api/embedding-cache/stats")
+def embedding_cache_stats():
+    return registry.embedding_cache_stats()
+
+@app.get("/api/index-registry/stats")
+def index_registry_stats():
+    return index_registry.stats()
+
+@app.get("/api/query-cache/stats")
+def query_cache_stats():
+    return query_cache.stats()
+
+@app.get("/api/query-engines/stats")
+def query_engine_stats():
+    return query_engine_cache.stats()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await registry.shutdown()
+
 @app.get("/")
 def root():
     return {"message": "File Upload and Data Processing API is running"}
@@ -1,5 +1,7 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Literal
+
+ActionMode = Literal["rules", "llm", "hybrid"]
 
 class ActionItem(BaseModel):
     priority: str  # high, medium, low
@@ -10,15 +12,30 @@ class ActionItem(BaseModel):
     timeline: str
     responsible: str
 
+class ActionItemsResult(BaseModel):
+    """Schema the LLM is constrained to when generating action items"""
+    action_items: List[ActionItem]
+    summary: str
+    key_insights: List[str]
+
 class ActionItemsRequest(BaseModel):
     file_data: dict  # Analysis results (summary, kpis, trends, sample_data)
     business_context: Optional[str] = ""
+    refine_priorities: Optional[bool] = False  # opt-in second reprioritization pass
+    mode: ActionMode = "llm"  # rules: no LLM call, hybrid: LLM rewrites/ranks the rule results
+
+class ActionItemsBatchRequest(BaseModel):
+    datasets: List[dict]  # One analysis result per dataset
+    business_context: Optional[str] = ""
+    refine_priorities: Optional[bool] = False
+    mode: ActionMode = "llm"
 
 class ActionItemsResponse(BaseModel):
     action_items: List[ActionItem]
     summary: str
     key_insights: List[str]
     note: Optional[str] = None
+    prompt_usage: Optional[Dict[str, Any]] = None  # token counts per prompt section
     
     class Config:
         from_attributes = True
@@ -1,7 +1,6 @@
 # models/database.py
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
 from datetime import datetime
 from core.database import engine
 
@@ -16,18 +15,18 @@ class Report(Base):
     file_path = Column(String)
     data = Column(JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
-    
-    summaries = relationship("Summary", back_populates="report")
 
-class Summary(Base):
-    __tablename__ = "summaries"
+class StoredSummary(Base):
+    """Summaries per (file_id, length bucket, model), precomputed at ingest"""
+    __tablename__ = "summary_store"
+    __table_args__ = (UniqueConstraint("file_id", "length_bucket", "model", name="uq_summary_store_key"),)
     
     id = Column(Integer, primary_key=True, index=True)
-    report_id = Column(Integer, ForeignKey("reports.id"))
+    file_id = Column(String, nullable=False)
+    length_bucket = Column(Integer, nullable=False)
+    model = Column(String, nullable=False)
     summary_text = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
-    
-    report = relationship("Report", back_populates="summaries")
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
\ No newline at end of file
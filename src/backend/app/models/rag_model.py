@@ -1,21 +1,39 @@
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Literal, Optional
 
 class AddDocumentRequest(BaseModel):
     file_id: str
     text: str
+    report_id: Optional[int] = None  # tags the chunks for the report_id filter
 
 class AddDocumentResponse(BaseModel):
     message: str
+    ingest_stats: Optional[Dict[str, Any]] = None  # chunks, batches, seconds, chunks_per_second
 
 class QueryRequest(BaseModel):
-    file_id: str
+    file_id: Optional[str] = None  # omit (with file_ids/filters) to search the whole corpus
     query: str
+    file_ids: Optional[List[str]] = None
+    filters: Optional[Dict[str, Any]] = None  # e.g. {"upload_date": {"gte": "2025-07-01", "lte": "2025-09-30"}}
+    mode: Literal["answer", "retrieve"] = "answer"  # "retrieve": top nodes with scores and highlights, no LLM call
+    response_mode: Optional[Literal["compact", "refine", "tree"]] = None  # synthesis, defaults to RAG_RESPONSE_MODE
 
 class QueryResponse(BaseModel):
     query: str
     answer: str
-    sources: List[Dict[str, Any]]
+    sources: List[Dict[str, Any]]  # in retrieve mode: node_id, text, score, file_id, section, heading_path, highlights
+    cached: Optional[str] = None  # "exact" or "semantic" when served from the query cache
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class QueryBatchRequest(BaseModel):
+    file_id: Optional[str] = None
+    queries: List[str]
+    file_ids: Optional[List[str]] = None
+    filters: Optional[Dict[str, Any]] = None
+    response_mode: Optional[Literal["compact", "refine", "tree"]] = None
+
+class QueryBatchResponse(BaseModel):
+    answers: List[QueryResponse]  # in the order of the queries
+    stats: Dict[str, Any]  # questions, cached, retrieved_chunks, unique_chunks, seconds
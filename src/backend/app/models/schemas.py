@@ -4,20 +4,12 @@ from typing import Dict, Any
 from datetime import datetime
 
 # Summary schemas
-class SummaryBase(BaseModel):
-    report_id: int
+class StoredSummaryCreate(BaseModel):
+    file_id: str
+    length_bucket: int
+    model: str
     summary_text: str
 
-class SummaryCreate(SummaryBase):
-    pass
-
-class SummaryResponse(SummaryBase):
-    id: int
-    created_at: datetime
-    
-    class Config:
-        from_attributes = True
-
 # Report schemas
 class ReportBase(BaseModel):
     filename: str
@@ -3,11 +3,8 @@ from typing import Optional
 import os
 import json
 from datetime import datetime
-#from llama_index.llms.ollama import Ollama
-from llama_index.llms.openai import OpenAI
-from dotenv import load_dotenv
-load_dotenv()
-api_key = os.getenv('OPENAI_API_KEY')
+from services.client_registry import registry
+from services.map_reduce_summary import map_reduce_summarizer
 
 class SummaryRequest(BaseModel):
     """Schema for summary API request"""
@@ -22,33 +19,26 @@ class SummaryResponse(BaseModel):
 
 class SummaryService:
     def __init__(self):
-        #self.llm = Ollama(model="gemma3:12b", request_timeout=60.0)
-        self.llm = OpenAI(api_key=api_key)
         self.summaries_dir = "summaries"
         if not os.path.exists(self.summaries_dir):
             os.makedirs(self.summaries_dir)
     
-    def summarize_text(self, text: str, max_length: int = 500) -> str:
-        prompt = f"""
-        Please summarize the following text. The summary should not exceed {max_length} words and should include the main idea of the text.
-        
-        Text:
-        {text}
-        
-        Summary:
-        """
-        
-        response = self.llm.complete(prompt)
-        return str(response)
+    @property
+    def llm(self):
+        return registry.get_llm()
+    
+    async def asummarize_text(self, text: str, max_length: int = 500) -> str:
+        # Long texts are summarized chunk by chunk instead of in one prompt
+        return await map_reduce_summarizer.asummarize(text, max_length)
     
-    def summarize_document(self, file_id: str) -> str:
+    async def asummarize_document(self, file_id: str) -> str:
         file_path = f"data/{file_id}.md"
         
         try:
             with open(file_path, "r", encoding="utf-8") as f:
                 text = f.read()
             
-            summary = self.summarize_text(text)
+            summary = await self.asummarize_text(text)
             return summary
         except FileNotFoundError:
             raise FileNotFoundError(f"File not found: {file_path}")
@@ -0,0 +1,227 @@
+# services/action_rules.py
+from typing import Any, Dict, List
+
+PRIORITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+# Declarative rules: each one matches facts of one kind and renders an action item from them.
+# "when" decides if a fact triggers the rule, "priority" may depend on the fact, and every
+# template string in "action" is formatted with the fact's fields.
+RULES: List[Dict[str, Any]] = [
+    {
+        "name": "decreasing_trend",
+        "facts": "trends",
+        "when": lambda f: f["trend"] == "decreasing",
+        "priority": lambda f: "high" if f["strength"] >= 0.5 or f["strength"] == 0 else "medium",
+        "action": {
+            "category": "performance",
+            "title": "Investigate the decrease in {column} values",
+            "description": "A decreasing trend detected in {column} metric{correlation_text}. Analyze the reasons.",
+            "expected_impact": "Performance improvement",
+            "timeline": "2 weeks",
+            "responsible": "Analysis team"
+        }
+    },
+    {
+        "name": "increasing_trend",
+        "facts": "trends",
+        "when": lambda f: f["trend"] == "increasing",
+        "priority": lambda f: "medium",
+        "action": {
+            "category": "opportunity",
+            "title": "Sustain the increase in {column} values",
+            "description": "There is a positive trend in {column} metric{correlation_text}. Develop strategies to sustain this increase.",
+            "expected_impact": "Growth momentum",
+            "timeline": "1 month",
+            "responsible": "Strategy team"
+        }
+    },
+    {
+        "name": "missing_values",
+        "facts": "data_quality",
+        "when": lambda f: f["null_count"] > 0,
+        "priority": lambda f: "high" if f["null_ratio"] >= 0.2 else "medium",
+        "action": {
+            "category": "data_quality",
+            "title": "Complete missing data in {column} column",
+            "description": "{null_count} missing data detected in {column} column ({null_ratio:.1%} of rows).",
+            "expected_impact": "Data quality increase",
+            "timeline": "1 week",
+            "responsible": "Data team"
+        }
+    },
+    {
+        "name": "unreadable_null_count",
+        "facts": "data_quality",
+        "when": lambda f: f["null_count"] < 0,
+        "priority": lambda f: "medium",
+        "action": {
+            "category": "data_quality",
+            "title": "Check data quality in {column} column",
+            "description": "Data quality issues detected in {column} column.",
+            "expected_impact": "Data quality increase",
+            "timeline": "1 week",
+            "responsible": "Data team"
+        }
+    },
+    {
+        "name": "outliers",
+        "facts": "kpis",
+        "when": lambda f: f["severity"] >= 3,
+        "priority": lambda f: "high" if f["severity"] >= 5 else "medium",
+        "action": {
+            "category": "risk",
+            "title": "Review outliers in {column}",
+            "description": "{column} has values {severity:.1f} standard deviations from its average of {mean:.2f}. Verify whether they are errors or real events.",
+            "expected_impact": "Reliable KPIs and early risk detection",
+            "timeline": "1 week",
+            "responsible": "Analysis team"
+        }
+    },
+    {
+        "name": "high_volatility",
+        "facts": "kpis",
+        "when": lambda f: f["std"] > 0 and f["variation"] >= 1,
+        "priority": lambda f: "low",
+        "action": {
+            "category": "optimization",
+            "title": "Reduce volatility in {column}",
+            "description": "{column} varies strongly (standard deviation {std:.2f} vs. average {mean:.2f}). Identify the drivers and stabilize the process.",
+            "expected_impact": "More predictable performance",
+            "timeline": "1 month",
+            "responsible": "Operations team"
+        }
+    },
+    {
+        "name": "constant_column",
+        "facts": "kpis",
+        "when": lambda f: f["std"] == 0 and f["count_known"],
+        "priority": lambda f: "low",
+        "action": {
+            "category": "data_quality",
+            "title": "Check the constant {column} column",
+            "description": "{column} has the same value ({mean:.2f}) in every row. Confirm it is populated correctly or drop it from reporting.",
+            "expected_impact": "Cleaner reports",
+            "timeline": "1 week",
+            "responsible": "Data team"
+        }
+    },
+]
+
+
+def _trends_as_list(trends: Any) -> List[Dict[str, Any]]:
+    if isinstance(trends, dict):
+        return [{"column": col, **data} for col, data in trends.items() if isinstance(data, dict)]
+    if isinstance(trends, list):
+        return [item for item in trends if isinstance(item, dict) and item.get("column")]
+    return []
+
+
+def _float(value: Any) -> float:
+    try:
+        result = float(value)
+    except (ValueError, TypeError):
+        return 0.0
+    return result if result == result else 0.0
+
+
+def extract_facts(results: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Flatten analysis results into per-kind facts the rules match against"""
+    facts = {"trends": [], "data_quality": [], "kpis": []}
+
+    for item in _trends_as_list(results.get("trends")):
+        correlation = item.get("correlation")
+        strength = abs(_float(correlation))
+        facts["trends"].append({
+            "column": item["column"],
+            "trend": item.get("trend"),
+            "strength": strength,
+            "correlation_text": f" (correlation {_float(correlation):.2f})" if strength else "",
+            "salience": strength
+        })
+
+    summary = results.get("summary") or {}
+    rows = summary.get("rows") or 0
+    null_counts = summary.get("null_counts")
+    if isinstance(null_counts, dict):
+        for col, count in null_counts.items():
+            try:
+                null_count = int(count) if count is not None else 0
+            except (ValueError, TypeError):
+                null_count = -1 if count else 0
+            null_ratio = null_count / rows if rows and null_count > 0 else 0.0
+            facts["data_quality"].append({
+                "column": col,
+                "null_count": null_count,
+                "null_ratio": null_ratio,
+                "salience": null_ratio
+            })
+
+    statistics = (results.get("kpis") or {}).get("statistics")
+    if isinstance(statistics, dict):
+        for col, values in statistics.items():
+            if not isinstance(values, list) or len(values) < 5:
+                continue
+            minimum, maximum, mean, _, std = (_float(v) for v in values[:5])
+            severity = max(abs(maximum - mean), abs(mean - minimum)) / std if std else 0.0
+            facts["kpis"].append({
+                "column": col,
+                "mean": mean,
+                "std": std,
+                "severity": severity,
+                "variation": std / abs(mean) if mean else 0.0,
+                "count_known": values[4] is not None,
+                "salience": min(severity / 6.0, 1.0)
+            })
+
+    return facts
+
+
+class ActionRuleEngine:
+    """Deterministic, LLM-free action item generation from analysis results"""
+
+    def __init__(self, rules: List[Dict[str, Any]] = None):
+        self.rules = RULES if rules is None else rules
+
+    def evaluate(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        facts = extract_facts(results)
+        matches = []
+
+        for rule in self.rules:
+            for fact in facts.get(rule["facts"], []):
+                if not rule["when"](fact):
+                    continue
+                item = {"priority": rule["priority"](fact)}
+                item.update({key: template.format(**fact) for key, template in rule["action"].items()})
+                matches.append((PRIORITY_ORDER[item["priority"]], -fact["salience"], len(matches), rule["name"], item))
+
+        matches.sort(key=lambda m: m[:3])
+        action_items = [match[4] for match in matches]
+
+        return {
+            "action_items": action_items,
+            "summary": "Action items created based on automatic analysis results.",
+            "key_insights": self._key_insights(facts, [match[3] for match in matches]),
+            "note": "Generated by rule engine"
+        }
+
+    def _key_insights(self, facts: Dict[str, List[Dict[str, Any]]], fired: List[str]) -> List[str]:
+        insights = []
+
+        decreasing = [f["column"] for f in facts["trends"] if f["trend"] == "decreasing"]
+        increasing = [f["column"] for f in facts["trends"] if f["trend"] == "increasing"]
+        if decreasing:
+            insights.append(f"Decreasing trend in {', '.join(decreasing)}")
+        if increasing:
+            insights.append(f"Increasing trend in {', '.join(increasing)}")
+
+        missing = [f["column"] for f in facts["data_quality"] if f["null_count"] != 0]
+        if missing:
+            insights.append(f"{len(missing)} column(s) with missing or invalid values")
+
+        if "outliers" in fired:
+            insights.append(f"{fired.count('outliers')} metric(s) with significant outliers")
+
+        return insights or ["No significant trends or data quality issues detected"]
+
+
+action_rule_engine = ActionRuleEngine()
@@ -1,118 +1,212 @@
-#from llama_index.llms.ollama import Ollama
-from llama_index.llms.openai import OpenAI
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Tuple, List, Optional, Awaitable, Union
+import asyncio
+import inspect
 import json
 import os
-from dotenv import load_dotenv
-load_dotenv()
-api_key = os.getenv('OPENAI_API_KEY')
+from services.client_registry import registry
+from services.json_stream import JSONArrayStreamParser, parse_partial_json
+from models.action_model import ActionItem, ActionItemsResult
+from services.prompt_builder import PromptBuilder, count_tokens
+from services.rate_limiter import limited_acomplete, llm_rate_limiter, is_bad_request
+from services.action_rules import action_rule_engine
+
+# Token budget for the analysis facts packed into the action items prompt
+ACTION_PROMPT_TOKEN_BUDGET = int(os.getenv("ACTION_PROMPT_TOKEN_BUDGET", "1500"))
+# Expected completion size, reserved in the tokens/min rate limiter for each call
+ACTION_OUTPUT_TOKENS = int(os.getenv("ACTION_OUTPUT_TOKENS", "1000"))
+
+# rules: rule engine only (no LLM call), llm: LLM from the analysis facts, hybrid: LLM rewrites/ranks the rule results
+ACTION_MODES = ("rules", "llm", "hybrid")
 
 class ActionItemsService:
-    def __init__(self):
-        #self.llm = Ollama(model="gemma3:12b", request_timeout=120.0)
-        self.llm = OpenAI(api_key=api_key)
+    @property
+    def llm(self):
+        return registry.get_llm()
+    
+    def generate_action_items(self, analysis_results: Dict[str, Any], business_context: str = "") -> Dict[str, Any]:
+        prompt, usage = self._build_action_items_prompt(analysis_results, business_context)
+        
+        response = self._complete(prompt)
+        
+        return {**self._action_items_from_response(analysis_results, str(response)), "prompt_usage": usage}
     
-    def _get_trends_as_dict(self, trends: Any) -> Dict[str, Dict[str, Any]]:
-        if isinstance(trends, dict):
-            return trends
-        elif isinstance(trends, list):
-            trends_dict = {}
-            for item in trends:
-                if isinstance(item, dict):
-                    col = item.get('column')
-                    if col:
-                        trend_data = {k: v for k, v in item.items() if k != 'column'}
-                        trends_dict[col] = trend_data
-            return trends_dict
-        return {}
+    async def agenerate_action_items(self, analysis_results: Dict[str, Any], business_context: str = "") -> Dict[str, Any]:
+        prompt, usage = self._build_action_items_prompt(analysis_results, business_context)
+        
+        response = await self._acomplete(prompt, usage["prompt_tokens"] + ACTION_OUTPUT_TOKENS)
+        
+        return {**self._action_items_from_response(analysis_results, str(response)), "prompt_usage": usage}
     
-    def generate_action_items(self, analysis_results: Dict[str, Any]) -> Dict[str, Any]:
-        formatted_results = self._format_analysis_results(analysis_results)
+    async def astream_action_items(
+        self,
+        analysis_results: Dict[str, Any],
+        business_context: str = "",
+        mode: str = "llm"
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Yields ("token", delta) while streaming, ("action_item", item) as each array element completes, then ("result", dict)"""
+        if mode == "rules":
+            result = action_rule_engine.evaluate(analysis_results)
+            for item in result["action_items"]:
+                yield "action_item", item
+            yield "result", result
+            return
         
-        prompt = self._create_action_items_prompt(formatted_results)
+        if mode == "hybrid":
+            rule_result = action_rule_engine.evaluate(analysis_results)
+            if not rule_result["action_items"]:
+                yield "result", rule_result
+                return
+            prompt = self._create_hybrid_prompt(rule_result, business_context)
+            usage = {"prompt_tokens": count_tokens(prompt)}
+        else:
+            rule_result = None
+            prompt, usage = self._build_action_items_prompt(analysis_results, business_context)
+        parser = JSONArrayStreamParser("action_items")
         
-        response = self.llm.complete(prompt)
+        await llm_rate_limiter.acquire(usage["prompt_tokens"] + ACTION_OUTPUT_TOKENS)
+        text = ""
+        async for chunk in self._astream_complete(prompt):
+            delta = chunk.delta or ""
+            if not delta:
+                continue
+            text += delta
+            yield "token", delta
+            for item in parser.feed(delta):
+                yield "action_item", item
         
+        if rule_result is not None:
+            yield "result", {**self._hybrid_from_response(rule_result, text), "prompt_usage": usage}
+        else:
+            yield "result", {**self._action_items_from_response(analysis_results, text), "prompt_usage": usage}
+    
+    def _action_items_from_response(self, analysis_results: Dict[str, Any], response: str) -> Dict[str, Any]:
         try:
-            action_items = self._parse_llm_response(str(response))
-            return action_items
+            return self._parse_llm_response(response)
         except Exception as e:
-            return self._create_fallback_actions(analysis_results, str(response))
+            return self._create_fallback_actions(analysis_results, response)
+    
+    def _build_action_items_prompt(self, analysis_results: Dict[str, Any], business_context: str = "") -> Tuple[str, Dict[str, Any]]:
+        builder = PromptBuilder(ACTION_PROMPT_TOKEN_BUDGET)
+        self._add_analysis_facts(builder, analysis_results)
+        prompt = self._create_action_items_prompt(builder.build(), business_context)
+        
+        usage = {**builder.usage, "prompt_tokens": builder.count_tokens(prompt)}
+        print(f"DEBUG: Action items prompt uses {usage['prompt_tokens']} tokens "
+              f"(analysis {usage['total']}/{usage['budget']}): "
+              + ", ".join(f"{name}={s['tokens']}" for name, s in usage['sections'].items()))
+        return prompt, usage
     
     def _format_analysis_results(self, results: Dict[str, Any]) -> str:
-        formatted = []
+        builder = PromptBuilder(ACTION_PROMPT_TOKEN_BUDGET)
+        self._add_analysis_facts(builder, results)
+        return builder.build()
+    
+    def _format_value(self, value: Any) -> str:
+        if value is None:
+            return "N/A"
+        if isinstance(value, (int, float)):
+            try:
+                if isinstance(value, float) and value.is_integer():
+                    return str(int(value))
+                return f"{value:.2f}" if isinstance(value, float) else str(value)
+            except:
+                return str(value)
+        return str(value)
+    
+    def _add_analysis_facts(self, builder: PromptBuilder, results: Dict[str, Any]):
+        """Turn analysis results into prompt facts, scored by salience for the token budget"""
+        builder.add_section("summary", "📊 DATA SUMMARY:")
+        builder.add_section("data_quality", "\n🧹 DATA QUALITY:")
+        builder.add_section("statistics", "\n📈 KPI ANALYSIS:\n- Statistical Summary:")
+        builder.add_section("categorical", "\n🏷️ CATEGORICAL ANALYSIS:")
+        builder.add_section("trends", "\n📊 TREND ANALYSIS:")
+        builder.add_section("sample_data", "\n📝 SAMPLE DATA:")
         
+        rows = 0
         if 'summary' in results:
             summary = results['summary']
-            formatted.append(f"📊 DATA SUMMARY:")
             
             rows = summary.get('rows', 0)
             cols = summary.get('columns', 0)
-            formatted.append(f"- Total rows: {rows}")
-            formatted.append(f"- Number of columns: {cols}")
+            builder.add_fact("summary", f"- Total rows: {rows}", required=True)
+            builder.add_fact("summary", f"- Number of columns: {cols}", required=True)
             
             columns = summary.get('column_names', [])
             if columns:
                 col_preview = ', '.join(map(str, columns[:5]))
                 if len(columns) > 5:
                     col_preview += " ..."
-                formatted.append(f"- Columns: {col_preview}")
+                builder.add_fact("summary", f"- Columns: {col_preview}", required=True)
+            
+            null_counts = summary.get('null_counts')
+            if isinstance(null_counts, dict):
+                for col, count in null_counts.items():
+                    try:
+                        count_int = int(count) if count is not None else 0
+                    except (ValueError, TypeError):
+                        continue
+                    if count_int > 0:
+                        null_ratio = count_int / rows if rows else 1.0
+                        builder.add_fact(
+                            "data_quality",
+                            f"  * {col}: {count_int} missing values ({null_ratio:.1%})",
+                            salience=min(null_ratio, 1.0)
+                        )
         
         if 'kpis' in results:
-            formatted.append(f"\n📈 KPI ANALYSIS:")
             kpis = results['kpis']
             
-            if 'statistics' in kpis:
-                formatted.append("- Statistical Summary:")
-                stats = kpis['statistics']
-                if isinstance(stats, dict):
-                    for key, values in stats.items():
-                        if isinstance(values, list) and len(values) > 2:
-                            try:
-                                mean_value = float(values[2]) if values[2] is not None else 0.0
-                                formatted.append(f"  * {key}: Average {mean_value:.2f}")
-                            except (ValueError, TypeError):
-                                formatted.append(f"  * {key}: {values[2]}")
-                            except IndexError:
-                                formatted.append(f"  * {key}: {values[0] if len(values) > 0 else 'N/A'}")
-                        else:
-                            formatted.append(f"  * {key}: Insufficient data")
-                else:
-                    formatted.append("- Statistical Summary: Insufficient data")
+            stats = kpis.get('statistics')
+            if isinstance(stats, dict):
+                for key, values in stats.items():
+                    if isinstance(values, list) and len(values) > 2:
+                        try:
+                            mean_value = float(values[2]) if values[2] is not None else 0.0
+                        except (ValueError, TypeError):
+                            builder.add_fact("statistics", f"  * {key}: {values[2]}")
+                            continue
+                        
+                        severity = self._anomaly_severity(values)
+                        text = f"  * {key}: Average {mean_value:.2f}"
+                        if severity >= 3:
+                            text += f" (extremes {severity:.1f} std from mean)"
+                        builder.add_fact("statistics", text, salience=min(severity / 6.0, 1.0))
+                    else:
+                        builder.add_fact("statistics", f"  * {key}: Insufficient data")
             
-            if 'categorical' in kpis:
-                formatted.append("- Categorical Analysis:")
-                categorical = kpis['categorical']
-                if isinstance(categorical, dict):
-                    for col, data in categorical.items():
-                        if isinstance(data, dict) and 'unique_count' in data:
-                            try:
-                                unique_count = int(data['unique_count'])
-                                formatted.append(f"  * {col}: {unique_count} unique values")
-                            except (ValueError, TypeError):
-                                formatted.append(f"  * {col}: {data['unique_count']} unique values")
-                else:
-                    formatted.append("- Categorical Analysis: Insufficient data")
+            categorical = kpis.get('categorical')
+            if isinstance(categorical, dict):
+                for col, data in categorical.items():
+                    if isinstance(data, dict) and 'unique_count' in data:
+                        try:
+                            unique_count = int(data['unique_count'])
+                            builder.add_fact("categorical", f"  * {col}: {unique_count} unique values", salience=0.1)
+                        except (ValueError, TypeError):
+                            builder.add_fact("categorical", f"  * {col}: {data['unique_count']} unique values", salience=0.1)
         
         if 'trends' in results:
-            formatted.append(f"\n📊 TREND ANALYSIS:")
             trends_dict = self._get_trends_as_dict(results['trends'])
             for col, trend_data in trends_dict.items():
                 if isinstance(trend_data, dict) and 'trend' in trend_data:
                     trend = trend_data['trend']
                     if trend == 'increasing':
-                        formatted.append(f"  * {col}: ↗️ INCREASING trend")
+                        text = f"  * {col}: ↗️ INCREASING trend"
                     elif trend == 'decreasing':
-                        formatted.append(f"  * {col}: ↘️ DECREASING trend")
+                        text = f"  * {col}: ↘️ DECREASING trend"
                     else:
-                        formatted.append(f"  * {col}: ➡️ STABLE trend")
+                        text = f"  * {col}: ➡️ STABLE trend"
                     
+                    strength = 0.0
                     if 'correlation' in trend_data and trend_data['correlation'] is not None:
                         try:
                             corr_value = float(trend_data['correlation'])
-                            formatted.append(f"    (Correlation: {corr_value:.3f})")
+                            if corr_value == corr_value:  # NaN for constant columns
+                                strength = abs(corr_value)
+                            text += f"\n    (Correlation: {corr_value:.3f})"
                         except (ValueError, TypeError):
                             pass
+                    
+                    builder.add_fact("trends", text, salience=strength if trend != 'stable' else strength / 2)
         
         if 'sample_data' in results:
             try:
@@ -120,54 +214,40 @@ class ActionItemsService:
                 if isinstance(sample_data, list) and len(sample_data) > 0:
                     sample = sample_data[0]
                     if isinstance(sample, dict):
-                        formatted.append(f"\n📝 SAMPLE DATA:")
                         for key, value in list(sample.items())[:3]:  # İlk 3 sütun
-                            if value is None:
-                                value_str = "N/A"
-                            elif isinstance(value, (int, float)):
-                                try:
-                                    if isinstance(value, float) and value.is_integer():
-                                        value_str = str(int(value))
-                                    else:
-                                        value_str = f"{value:.2f}" if isinstance(value, float) else str(value)
-                                except:
-                                    value_str = str(value)
-                            else:
-                                value_str = str(value)
-                            
-                            formatted.append(f"  * {key}: {value_str}")
+                            builder.add_fact("sample_data", f"  * {key}: {self._format_value(value)}")
                 elif isinstance(sample_data, dict) and len(sample_data) > 0:
-                    formatted.append(f"\n📝 SAMPLE DATA:")
                     for key in list(sample_data.keys())[:3]:
                         values = sample_data[key]
                         value = values[0] if isinstance(values, list) and len(values) > 0 else values
-
-                        if value is None:
-                            value_str = "N/A"
-                        elif isinstance(value, (int, float)):
-                            try:
-                                if isinstance(value, float) and value.is_integer():
-                                    value_str = str(int(value))
-                                else:
-                                    value_str = f"{value:.2f}" if isinstance(value, float) else str(value)
-                            except:
-                                value_str = str(value)
-                        else:
-                            value_str = str(value)
-                        
-                        formatted.append(f"  * {key}: {value_str}")
+                        builder.add_fact("sample_data", f"  * {key}: {self._format_value(value)}")
             except Exception:
                 pass
-        
-        return "\n".join(formatted)
     
-    def _create_action_items_prompt(self, formatted_results: str) -> str:
+    def _anomaly_severity(self, values: list) -> float:
+        """Largest distance of min/max from the mean, in standard deviations"""
+        try:
+            minimum, maximum, mean, _, std = (float(v) for v in values[:5])
+        except (ValueError, TypeError):
+            return 0.0
+        if not std or std != std:
+            return 0.0
+        return max(abs(maximum - mean), abs(mean - minimum)) / std
+    
+    def _create_action_items_prompt(self, formatted_results: str, business_context: str = "") -> str:
         """Action items için prompt oluştur"""
+        context_section = ""
+        if business_context:
+            context_section = f"""
+Business Context: {business_context}
+
+Set each item's priority according to this business context and order the action items from highest to lowest priority.
+"""
         return f"""
 Based on the following data analysis results, suggest concrete action items for business.
 
 {formatted_results}
-
+{context_section}
 Please respond in the following JSON format:
 
 {{
@@ -200,109 +280,234 @@ Action items should focus on:
 Each action item should be concrete, measurable, and actionable.
 """
     
+    def _structured_output_kwargs(self) -> Dict[str, Any]:
+        """Constrain the completion to the ActionItemsResult JSON schema when the provider supports it"""
+        if not registry.supports_structured_output:
+            return {}
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "action_items_result",
+                    "schema": ActionItemsResult.model_json_schema(),
+                    "strict": False
+                }
+            }
+        }
+    
+    def _complete(self, prompt: str):
+        kwargs = self._structured_output_kwargs()
+        try:
+            return self.llm.complete(prompt, **kwargs)
+        except Exception as e:
+            if not kwargs or not is_bad_request(e):
+                raise
+            registry.disable_structured_output(e)
+        return self.llm.complete(prompt)
+    
+    async def _acomplete(self, prompt: str, estimated_tokens: int):
+        """limited_acomplete, retried without response_format when the model rejects it"""
+        kwargs = self._structured_output_kwargs()
+        try:
+            return await limited_acomplete(self.llm, prompt, estimated_tokens, **kwargs)
+        except Exception as e:
+            if not kwargs or not is_bad_request(e):
+                raise
+            registry.disable_structured_output(e)
+        return await limited_acomplete(self.llm, prompt, estimated_tokens)
+    
+    async def _astream_complete(self, prompt: str):
+        kwargs = self._structured_output_kwargs()
+        started = False
+        try:
+            async for chunk in await self.llm.astream_complete(prompt, **kwargs):
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            if started or not kwargs or not is_bad_request(e):
+                raise
+            registry.disable_structured_output(e)
+        async for chunk in await self.llm.astream_complete(prompt):
+            yield chunk
+    
     def _parse_llm_response(self, response: str) -> Dict[str, Any]:
-        start_idx = response.find('{')
-        end_idx = response.rfind('}') + 1
+        """Parse (possibly truncated) LLM JSON, keeping every action item that validates"""
+        notes = []
         
-        if start_idx == -1 or end_idx == 0:
-            raise ValueError("JSON not found")
+        parsed = parse_partial_json(response, key='action_items')
+        if not isinstance(parsed, dict) or not isinstance(parsed.get('action_items'), list):
+            raise ValueError("action_items not found")
         
-        json_str = response[start_idx:end_idx]
+        action_items = []
+        for item in parsed['action_items']:
+            try:
+                action_items.append(ActionItem(**item).model_dump())
+            except Exception:
+                continue
         
-        parsed = json.loads(json_str)
+        dropped = len(parsed['action_items']) - len(action_items)
+        if parsed['action_items'] and not action_items:
+            raise ValueError("No valid action items in LLM response")
+        if dropped:
+            notes.append(f"{dropped} incomplete action item(s) dropped from LLM response")
         
-        if 'action_items' not in parsed:
-            raise ValueError("action_items not found")
+        parsed['action_items'] = action_items
+        parsed.setdefault('summary', '')
+        parsed.setdefault('key_insights', [])
+        if notes:
+            parsed['note'] = "; ".join(notes)
         
         return parsed
     
     def _create_fallback_actions(self, results: Dict[str, Any], llm_response: str) -> Dict[str, Any]:
-        fallback_actions = []
+        return {**action_rule_engine.evaluate(results), "note": "LLM response could not be parsed, fallback actions used"}
+
+    def generate_actions(
+        self,
+        analysis_results: Dict[str, Any],
+        business_context: str = "",
+        refine: bool = False,
+        mode: str = "llm"
+    ) -> Dict[str, Any]:
+        if mode == "rules":
+            return action_rule_engine.evaluate(analysis_results)
+        if mode == "hybrid":
+            rule_result = action_rule_engine.evaluate(analysis_results)
+            if not rule_result["action_items"]:
+                return rule_result
+            prompt = self._create_hybrid_prompt(rule_result, business_context)
+            response = self._complete(prompt)
+            return {**self._hybrid_from_response(rule_result, str(response)), "prompt_usage": {"prompt_tokens": count_tokens(prompt)}}
+        return self.generate_prioritized_actions(analysis_results, business_context, refine=refine)
+
+    async def agenerate_actions(
+        self,
+        analysis_results: Dict[str, Any],
+        business_context: str = "",
+        refine: bool = False,
+        mode: str = "llm"
+    ) -> Dict[str, Any]:
+        """Action items in the requested mode; "rules" never touches the network"""
+        if mode == "rules":
+            return action_rule_engine.evaluate(analysis_results)
+        if mode == "hybrid":
+            return await self.ahybrid_actions(analysis_results, business_context)
+        return await self.agenerate_prioritized_actions(analysis_results, business_context, refine=refine)
+
+    async def ahybrid_actions(self, analysis_results: Dict[str, Any], business_context: str = "") -> Dict[str, Any]:
+        rule_result = action_rule_engine.evaluate(analysis_results)
+        if not rule_result["action_items"]:
+            return rule_result
         
-        if 'trends' in results:
-            trends_dict = self._get_trends_as_dict(results['trends'])
-            for col, trend_data in trends_dict.items():
-                if isinstance(trend_data, dict) and 'trend' in trend_data:
-                    if trend_data['trend'] == 'decreasing':
-                        fallback_actions.append({
-                            "priority": "high",
-                            "category": "performance",
-                            "title": f"Investigate the decrease in {col} values",
-                            "description": f"A decreasing trend detected in {col} metric. Analyze the reasons.",
-                            "expected_impact": "Performance improvement",
-                            "timeline": "2 weeks",
-                            "responsible": "Analysis team"
-                        })
-                    elif trend_data['trend'] == 'increasing':
-                        fallback_actions.append({
-                            "priority": "medium",
-                            "category": "opportunity",
-                            "title": f"Sustain the increase in {col} values",
-                            "description": f"There is a positive trend in {col} metric. Develop strategies to sustain this increase.",
-                            "expected_impact": "Growth momentum",
-                            "timeline": "1 month",
-                            "responsible": "Strategy team"
-                        })
+        prompt = self._create_hybrid_prompt(rule_result, business_context)
+        prompt_tokens = count_tokens(prompt)
+        response = await self._acomplete(prompt, prompt_tokens + ACTION_OUTPUT_TOKENS)
         
-        if 'summary' in results and 'null_counts' in results['summary']:
-            null_counts = results['summary']['null_counts']
-            if isinstance(null_counts, dict):
-                for col, count in null_counts.items():
-                    try:
-                        count_int = int(count) if count is not None else 0
-                        if count_int > 0:
-                            fallback_actions.append({
-                                "priority": "medium",
-                                "category": "data_quality",
-                                "title": f"Complete missing data in {col} column",
-                                "description": f"{count_int} missing data detected in {col} column.",
-                                "expected_impact": "Data quality increase",
-                                "timeline": "1 week",
-                                "responsible": "Data team"
-                            })
-                    except (ValueError, TypeError):
-                        if count:
-                            fallback_actions.append({
-                                "priority": "medium",
-                                "category": "data_quality",
-                                "title": f"Check data quality in {col} column",
-                                "description": f"Data quality issues detected in {col} column.",
-                                "expected_impact": "Data quality increase",
-                                "timeline": "1 week",
-                                "responsible": "Data team"
-                            })
+        return {**self._hybrid_from_response(rule_result, str(response)), "prompt_usage": {"prompt_tokens": prompt_tokens}}
+
+    def _create_hybrid_prompt(self, rule_result: Dict[str, Any], business_context: str = "") -> str:
+        context_instruction = f"\nBusiness Context: {business_context}\n" if business_context else ""
+        return f"""
+The following action items were derived from data analysis by deterministic rules:
+
+{json.dumps(rule_result["action_items"], ensure_ascii=False, separators=(',', ':'))}
+{context_instruction}
+Rewrite these action items so they are clear and specific, and order them from most to least important{" for the business context" if business_context else ""}.
+Do not add new action items and do not drop any; you may adjust priority, title, description, expected_impact, timeline and responsible.
+
+Respond in JSON format with the keys "action_items", "summary" and "key_insights".
+"""
+
+    def _hybrid_from_response(self, rule_result: Dict[str, Any], response: str) -> Dict[str, Any]:
+        try:
+            result = self._parse_llm_response(response)
+        except Exception:
+            return rule_result
+        if len(result["action_items"]) > len(rule_result["action_items"]):
+            result["action_items"] = result["action_items"][:len(rule_result["action_items"])]
+        return result
+
+    def generate_prioritized_actions(
+        self,
+        analysis_results: Dict[str, Any],
+        business_context: str = "",
+        refine: bool = False
+    ) -> Dict[str, Any]:
+        """Prioritized action items in a single completion; refine=True adds the legacy reprioritization pass"""
+        basic_actions = self.generate_action_items(analysis_results, business_context)
         
-        return {
-            "action_items": fallback_actions,
-            "summary": "Action items created based on automatic analysis results.",
-            "key_insights": [
-                "Data analysis completed",
-                "Trend analyses reviewed", 
-                "Action items determined"
-            ],
-            "note": "LLM response could not be parsed, fallback actions used"
-        }
+        if not business_context or not refine:
+            return basic_actions
+        
+        response = self._complete(self._create_reprioritize_prompt(basic_actions, business_context))
+        
+        return self._reprioritized_from_response(basic_actions, str(response))
 
-    def generate_prioritized_actions(self, analysis_results: Dict[str, Any], business_context: str = "") -> Dict[str, Any]:
-        basic_actions = self.generate_action_items(analysis_results)
+    async def agenerate_prioritized_actions(
+        self,
+        analysis_results: Dict[str, Any],
+        business_context: str = "",
+        refine: bool = False
+    ) -> Dict[str, Any]:
+        basic_actions = await self.agenerate_action_items(analysis_results, business_context)
         
-        if not business_context:
+        if not business_context or not refine:
             return basic_actions
         
-        context_prompt = f"""
+        return await self.areprioritize_actions(basic_actions, business_context)
+
+    async def areprioritize_actions(self, basic_actions: Dict[str, Any], business_context: str) -> Dict[str, Any]:
+        prompt = self._create_reprioritize_prompt(basic_actions, business_context)
+        response = await self._acomplete(prompt, count_tokens(prompt) + ACTION_OUTPUT_TOKENS)
+        
+        return self._reprioritized_from_response(basic_actions, str(response))
+
+    async def abatch_action_items(
+        self,
+        analyses: List[Union[Dict[str, Any], Awaitable[Dict[str, Any]]]],
+        business_context: str = "",
+        refine: bool = False,
+        mode: str = "llm"
+    ) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]]:
+        """Generate action items for many analyses concurrently, yielding (index, result, error) as each finishes.
+
+        Items may be analysis dicts or awaitables producing them (e.g. file analysis in a thread).
+        LLM calls are paced by the shared rate limiter, so throughput follows the rate limit.
+        """
+        async def run(index: int, analysis):
+            try:
+                analysis_results = await analysis if inspect.isawaitable(analysis) else analysis
+                result = await self.agenerate_actions(analysis_results, business_context, refine=refine, mode=mode)
+                return index, result, None
+            except Exception as e:
+                return index, None, e
+
+        tasks = [asyncio.ensure_future(run(index, analysis)) for index, analysis in enumerate(analyses)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _create_reprioritize_prompt(self, basic_actions: Dict[str, Any], business_context: str) -> str:
+        actions = {k: v for k, v in basic_actions.items() if k != "prompt_usage"}
+        return f"""
 Reprioritize the existing action items according to the following business context:
 
 Business Context: {business_context}
 
-Existing Action Items: {json.dumps(basic_actions, ensure_ascii=False, indent=2)}
+Existing Action Items: {json.dumps(actions, ensure_ascii=False, separators=(',', ':'))}
 
 Please respond in the same JSON format, but with priorities updated according to the business context.
 """
-        
-        response = self.llm.complete(context_prompt)
-        
+
+    def _reprioritized_from_response(self, basic_actions: Dict[str, Any], response: str) -> Dict[str, Any]:
         try:
-            return self._parse_llm_response(str(response))
+            return {**self._parse_llm_response(response), "prompt_usage": basic_actions.get("prompt_usage")}
         except:
 
             return basic_actions
+
+action_service = ActionItemsService()
@@ -0,0 +1,238 @@
+# services/bm25_index.py
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores import MetadataFilters
+
+from services.index_registry import INDEX_DIR
+from services.numpy_vector_store import matches_filters
+
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(INDEX_DIR, "_bm25.db"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Posting lists are rewritten without deleted nodes once this share of the nodes is deleted since the last compaction
+BM25_COMPACT_DEAD_RATIO = 0.3
+
+# Words, numbers and identifiers such as INV-2024-0012, SKU_88/A or revenue_q3
+TOKEN = re.compile(r"\w+(?:[-_./]\w+)*", re.UNICODE)
+TOKEN_PART = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens; compound identifiers are indexed whole and by their parts"""
+    tokens = []
+    for match in TOKEN.finditer(text.lower()):
+        token = match.group(0)
+        tokens.append(token)
+        parts = TOKEN_PART.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """On-disk BM25 inverted index over corpus nodes.
+
+    Each term maps to one packed int32 (doc, tf) posting list in a SQLite WITHOUT ROWID
+    table, so a query term costs one primary key lookup and is scored with numpy. Node
+    ids, lengths and filter metadata are loaded into memory; deleted nodes are masked
+    out and dropped from the posting lists by periodic compaction.
+    """
+
+    def __init__(self, path: str = BM25_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS bm25_docs (
+                doc INTEGER PRIMARY KEY,
+                node_id TEXT,
+                file_id TEXT,
+                length INTEGER,
+                metadata TEXT,
+                alive INTEGER
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS bm25_terms (
+                term TEXT PRIMARY KEY,
+                postings BLOB
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        rows = self._conn.execute("SELECT doc, node_id, file_id, length, metadata, alive FROM bm25_docs ORDER BY doc").fetchall()
+        size = rows[-1][0] + 1 if rows else 0
+        self._node_ids: List[Optional[str]] = [None] * size
+        self._file_ids: List[Optional[str]] = [None] * size
+        self._metadata: List[Dict[str, Any]] = [{} for _ in range(size)]
+        self._lengths = np.zeros(size, dtype=np.float32)
+        self._alive = np.zeros(size, dtype=bool)
+        self._docs_by_node: Dict[str, int] = {}
+        # Deleted nodes still present in posting lists (alive = 0); compacted ones have alive = -1
+        self._stale = 0
+        for doc, node_id, file_id, length, metadata, alive in rows:
+            self._node_ids[doc], self._file_ids[doc] = node_id, file_id
+            self._metadata[doc] = json.loads(metadata)
+            self._lengths[doc], self._alive[doc] = length, alive == 1
+            if alive == 1:
+                self._docs_by_node[node_id] = doc
+            elif alive == 0:
+                self._stale += 1
+
+    @property
+    def doc_count(self) -> int:
+        return int(self._alive.sum())
+
+    @property
+    def avg_length(self) -> float:
+        return float(self._lengths[self._alive].mean()) if self.doc_count else 0.0
+
+    def _kill(self, docs: List[int]):
+        for doc in docs:
+            self._alive[doc] = False
+            self._docs_by_node.pop(self._node_ids[doc], None)
+        self._stale += len(docs)
+        self._conn.executemany("UPDATE bm25_docs SET alive = 0 WHERE doc = ?", [(doc,) for doc in docs])
+
+    def _postings(self, term: str) -> Optional[np.ndarray]:
+        row = self._conn.execute("SELECT postings FROM bm25_terms WHERE term = ?", (term,)).fetchone()
+        return np.frombuffer(row[0], dtype=np.int32).reshape(-1, 2) if row else None
+
+    def add_nodes(self, nodes: List[Any]):
+        """Index nodes; a node id indexed before is replaced"""
+        if not nodes:
+            return
+        with self._lock:
+            self._kill([self._docs_by_node[node.node_id] for node in nodes if node.node_id in self._docs_by_node])
+
+            first = len(self._node_ids)
+            new_postings = defaultdict(list)
+            docs = []
+            for offset, node in enumerate(nodes):
+                doc = first + offset
+                counts = Counter(tokenize(node.get_content(metadata_mode=MetadataMode.NONE)))
+                for term, tf in counts.items():
+                    new_postings[term].extend((doc, tf))
+                metadata = dict(node.metadata)
+                docs.append((doc, node.node_id, metadata.get("file_id"), sum(counts.values()), metadata))
+
+            self._conn.executemany(
+                "INSERT INTO bm25_docs (doc, node_id, file_id, length, metadata, alive) VALUES (?, ?, ?, ?, ?, 1)",
+                [(doc, node_id, file_id, length, json.dumps(metadata, ensure_ascii=False, default=str))
+                 for doc, node_id, file_id, length, metadata in docs]
+            )
+            updates = []
+            for term, postings in new_postings.items():
+                existing = self._postings(term)
+                merged = np.asarray(postings, dtype=np.int32)
+                if existing is not None:
+                    merged = np.concatenate([existing.ravel(), merged])
+                updates.append((term, merged.tobytes()))
+            self._conn.executemany("INSERT OR REPLACE INTO bm25_terms (term, postings) VALUES (?, ?)", updates)
+            self._conn.commit()
+
+            for doc, node_id, file_id, length, metadata in docs:
+                self._node_ids.append(node_id)
+                self._file_ids.append(file_id)
+                self._metadata.append(metadata)
+                self._docs_by_node[node_id] = doc
+            self._lengths = np.concatenate([self._lengths, np.asarray([d[3] for d in docs], dtype=np.float32)])
+            self._alive = np.concatenate([self._alive, np.ones(len(docs), dtype=bool)])
+
+    def delete_file(self, file_id: str):
+        with self._lock:
+            self._kill([doc for doc, doc_file_id in enumerate(self._file_ids) if doc_file_id == file_id and self._alive[doc]])
+            self._commit_deletes()
+
+    def delete_nodes(self, node_ids: List[str]):
+        with self._lock:
+            self._kill([self._docs_by_node[node_id] for node_id in node_ids if node_id in self._docs_by_node])
+            self._commit_deletes()
+
+    def _commit_deletes(self):
+        if self._stale > BM25_COMPACT_DEAD_RATIO * len(self._alive):
+            self._compact()
+        self._conn.commit()
+
+    def _compact(self):
+        """Drop deleted nodes from the posting lists (doc numbers stay stable)"""
+        updates, empty = [], []
+        for term, blob in self._conn.execute("SELECT term, postings FROM bm25_terms").fetchall():
+            postings = np.frombuffer(blob, dtype=np.int32).reshape(-1, 2)
+            kept = postings[self._alive[postings[:, 0]]]
+            if not len(kept):
+                empty.append((term,))
+            elif len(kept) < len(postings):
+                updates.append((term, kept.tobytes()))
+        self._conn.executemany("UPDATE bm25_terms SET postings = ? WHERE term = ?", [(b, t) for t, b in updates])
+        self._conn.executemany("DELETE FROM bm25_terms WHERE term = ?", empty)
+        self._conn.execute("UPDATE bm25_docs SET alive = -1, metadata = '{}' WHERE alive = 0")
+        self._stale = 0
+        print(f"DEBUG: Compacted BM25 index ({len(updates)} posting lists rewritten, {len(empty)} dropped)")
+
+    def search(self, query: str, top_k: int = 10, filters: Optional[MetadataFilters] = None) -> List[Tuple[str, float]]:
+        """Top-k (node_id, BM25 score) for a query, restricted to nodes matching the filters"""
+        terms = set(tokenize(query))
+        with self._lock:
+            doc_count = self.doc_count
+            if not terms or not doc_count:
+                return []
+            avg_length = self.avg_length
+
+            # Doc numbers are unique within a posting list, so each term is one scatter-add
+            scores = np.zeros(len(self._alive), dtype=np.float32)
+            matched = False
+            for term in terms:
+                postings = self._postings(term)
+                if postings is None:
+                    continue
+                postings = postings[self._alive[postings[:, 0]]]
+                if not len(postings):
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                docs, tf = postings[:, 0], postings[:, 1].astype(np.float32)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[docs] / avg_length)
+                scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                matched = True
+            if not matched:
+                return []
+
+            candidates = int(np.count_nonzero(scores))
+            if filters is None and candidates > top_k:
+                top = np.argpartition(-scores, top_k - 1)[:top_k]
+                order = top[np.argsort(-scores[top])]
+            else:
+                order = np.argsort(-scores)[:candidates]
+
+            hits = []
+            for doc in order.tolist():
+                if filters is not None and not matches_filters(self._metadata[doc], filters):
+                    continue
+                hits.append((self._node_ids[doc], float(scores[doc])))
+                if len(hits) == top_k:
+                    break
+            return hits
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            terms = self._conn.execute("SELECT COUNT(*) FROM bm25_terms").fetchone()[0]
+            return {
+                "nodes": self.doc_count,
+                "terms": terms,
+                "avg_length": round(self.avg_length, 1),
+                "size_mb": round(os.path.getsize(self.path) / 1024 / 1024, 2) if os.path.exists(self.path) else 0.0
+            }
@@ -0,0 +1,188 @@
+# services/client_registry.py
+import os
+import threading
+import httpx
+from dotenv import load_dotenv
+from llama_index.core import Settings
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.llms.openai import OpenAI
+from llama_index.embeddings.openai import OpenAIEmbedding
+#from llama_index.llms.ollama import Ollama
+#from llama_index.embeddings.ollama import OllamaEmbedding
+
+from core.llm_calls import LLM_TIMEOUT
+from services.llm_cache import LLMCache, CachedLLM
+from services.fake_llm import FakeLLM, FakeEmbedding
+from services.embedding_cache import EmbeddingCache, CachedEmbedding
+from services.markdown_chunker import MarkdownStructureParser
+
+load_dotenv()
+api_key = os.getenv('OPENAI_API_KEY')
+
+# "openai" for the real models, "fake" for the deterministic offline stand-ins
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+
+# "markdown" (heading/table aware chunks) or "sentence" (fixed 512 token windows)
+CHUNKER = os.getenv("CHUNKER", "markdown").lower()
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+# Chat model of the "openai" provider
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+# JSON-schema constrained completions (OpenAI response_format) for structured outputs
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() == "true"
+# Model families that accept response_format={"type": "json_schema"}
+STRUCTURED_OUTPUT_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class ClientRegistry:
+    """Process-wide LLM, embedding and HTTP clients shared by every service"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._http_client = None
+        self._async_http_client = None
+        self._llm = None
+        self._embed_model = None
+        self._settings_configured = False
+        self._structured_output = LLM_STRUCTURED_OUTPUT
+        self.llm_cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES) if LLM_CACHE_ENABLED else None
+        self.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR) if EMBEDDING_CACHE_ENABLED else None
+
+    def _http_options(self):
+        return {
+            "http2": LLM_HTTP2 and HTTP2_AVAILABLE,
+            "timeout": LLM_TIMEOUT,
+            "limits": httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+            )
+        }
+
+    @property
+    def http_client(self) -> httpx.Client:
+        with self._lock:
+            if self._http_client is None:
+                self._http_client = httpx.Client(**self._http_options())
+            return self._http_client
+
+    @property
+    def async_http_client(self) -> httpx.AsyncClient:
+        with self._lock:
+            if self._async_http_client is None:
+                self._async_http_client = httpx.AsyncClient(**self._http_options())
+            return self._async_http_client
+
+    def get_llm(self):
+        with self._lock:
+            if self._llm is None:
+                if LLM_PROVIDER == "fake":
+                    llm = FakeLLM(latency=FAKE_LLM_LATENCY)
+                else:
+                    #llm = Ollama(model="gemma3:12b", request_timeout=600.0)
+                    llm = OpenAI(
+                        model=LLM_MODEL,
+                        api_key=api_key,
+                        timeout=LLM_TIMEOUT,
+                        http_client=self.http_client,
+                        async_http_client=self.async_http_client
+                    )
+                self._llm = CachedLLM(llm, self.llm_cache) if self.llm_cache is not None else llm
+            return self._llm
+
+    def get_embed_model(self):
+        with self._lock:
+            if self._embed_model is None:
+                if LLM_PROVIDER == "fake":
+                    embed_model = FakeEmbedding()
+                else:
+                    #embed_model = OllamaEmbedding(model_name="nomic-embed-text:latest")
+                    embed_model = OpenAIEmbedding(
+                        api_key=api_key,
+                        timeout=LLM_TIMEOUT,
+                        http_client=self.http_client,
+                        async_http_client=self.async_http_client
+                    )
+                self._embed_model = (
+                    CachedEmbedding(embed_model, self.embedding_cache) if self.embedding_cache is not None else embed_model
+                )
+            return self._embed_model
+
+    def configure_settings(self):
+        """Point llama_index's global Settings at the shared clients (once per process)"""
+        with self._lock:
+            if self._settings_configured:
+                return
+            Settings.embed_model = self.get_embed_model()
+            Settings.llm = self.get_llm()
+            if CHUNKER == "sentence":
+                Settings.text_splitter = SentenceSplitter(chunk_size=512, chunk_overlap=10)
+            else:
+                Settings.text_splitter = MarkdownStructureParser()
+            self._settings_configured = True
+
+    @property
+    def supports_structured_output(self) -> bool:
+        return (
+            self._structured_output
+            and LLM_PROVIDER == "openai"
+            and LLM_MODEL.startswith(STRUCTURED_OUTPUT_MODEL_PREFIXES)
+            and LLM_MODEL != "gpt-4o-2024-05-13"
+        )
+
+    def disable_structured_output(self, error: Exception):
+        """The model rejected response_format: send plain completions from now on"""
+        with self._lock:
+            if self._structured_output:
+                print(f"DEBUG: Structured output disabled for {LLM_MODEL}: {type(error).__name__}: {error}")
+            self._structured_output = False
+
+    def llm_cache_stats(self):
+        if self.llm_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.llm_cache.stats()}
+
+    def embedding_cache_stats(self):
+        if self.embedding_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.embedding_cache.stats()}
+
+    async def startup(self):
+        self.configure_settings()
+        print(f"DEBUG: LLM clients ready (provider={LLM_PROVIDER}, http2={LLM_HTTP2 and HTTP2_AVAILABLE}, "
+              f"max_connections={LLM_MAX_CONNECTIONS})")
+
+    async def shutdown(self):
+        with self._lock:
+            http_client, async_http_client = self._http_client, self._async_http_client
+            self._http_client = None
+            self._async_http_client = None
+            self._llm = None
+            self._embed_model = None
+            self._settings_configured = False
+
+        if async_http_client is not None:
+            await async_http_client.aclose()
+        if http_client is not None:
+            http_client.close()
+
+
+registry = ClientRegistry()
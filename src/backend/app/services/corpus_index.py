@@ -0,0 +1,274 @@
+# services/corpus_index.py
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import weakref
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores import MetadataFilter, MetadataFilters, FilterOperator, FilterCondition, SimpleVectorStore
+
+from services.bm25_index import BM25Index
+from services.hybrid_retriever import HYBRID_SEARCH_ENABLED, HybridRetriever
+from services.index_registry import INDEX_DIR, estimate_index_size, index_registry
+from services.index_snapshot import INDEX_SNAPSHOT_ENABLED, SnapshotDocumentStore, load_docstore
+from services.numpy_vector_store import NumpyVectorStore
+
+CORPUS_INDEX_DIR = os.getenv("CORPUS_INDEX_DIR", os.path.join(INDEX_DIR, "_corpus"))
+# "numpy" (memory-mapped float32 matrix) or "simple" (llama_index JSON vector store)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "numpy").lower()
+
+# Node metadata used for filtering; kept out of the embedded text so re-uploads hit the embedding cache
+FILTER_METADATA_KEYS = ["file_id", "report_id", "section", "upload_date"]
+EXCLUDED_LLM_METADATA_KEYS = ["file_id", "report_id", "upload_date"]
+
+FILTER_OPERATORS = {
+    "eq": FilterOperator.EQ,
+    "ne": FilterOperator.NE,
+    "gt": FilterOperator.GT,
+    "gte": FilterOperator.GTE,
+    "lt": FilterOperator.LT,
+    "lte": FilterOperator.LTE,
+    "in": FilterOperator.IN,
+    "nin": FilterOperator.NIN
+}
+
+HEADING = re.compile(r"^\s*#{1,6}\s+(.+?)\s*$", re.MULTILINE)
+
+
+def build_filters(file_ids: Optional[List[str]] = None, filters: Optional[Dict[str, Any]] = None) -> Optional[MetadataFilters]:
+    """MetadataFilters from a file_id scope plus a {key: value} filter.
+
+    Values may be scalars (equality), lists (any of) or {"gte": ..., "lt": ...} operator maps;
+    upload_date is an ISO date, so ranges compare correctly.
+    """
+    conditions = []
+    if file_ids:
+        conditions.append(MetadataFilter(key="file_id", value=list(file_ids), operator=FilterOperator.IN))
+
+    for key, value in (filters or {}).items():
+        if isinstance(value, dict):
+            for op, operand in value.items():
+                if op not in FILTER_OPERATORS:
+                    raise ValueError(f"Unsupported filter operator '{op}' for '{key}'")
+                conditions.append(MetadataFilter(key=key, value=operand, operator=FILTER_OPERATORS[op]))
+        elif isinstance(value, list):
+            conditions.append(MetadataFilter(key=key, value=value, operator=FilterOperator.IN))
+        else:
+            conditions.append(MetadataFilter(key=key, value=value, operator=FilterOperator.EQ))
+
+    if not conditions:
+        return None
+    return MetadataFilters(filters=conditions, condition=FilterCondition.AND)
+
+
+def tag_documents(documents: List[Any], file_id: str, report_id: Optional[int] = None):
+    """Attach corpus metadata to reader documents; nodes split from them inherit it"""
+    upload_date = datetime.now().date().isoformat()
+    for document in documents:
+        heading = HEADING.search(document.text)
+        document.metadata.update({
+            "file_id": file_id,
+            "report_id": report_id,
+            "section": heading.group(1) if heading else "",
+            "upload_date": upload_date
+        })
+        document.excluded_embed_metadata_keys = list(FILTER_METADATA_KEYS)
+        document.excluded_llm_metadata_keys = list(EXCLUDED_LLM_METADATA_KEYS)
+
+
+def content_hash(node: Any) -> str:
+    """Hash of the text a node is embedded from; volatile metadata like upload_date is excluded"""
+    return hashlib.sha256(node.get_content(metadata_mode=MetadataMode.EMBED).encode("utf-8")).hexdigest()
+
+
+class CorpusIndex:
+    """One vector index over every ingested document.
+
+    Nodes carry file_id, report_id, section and upload_date metadata, so a single top-k
+    search can run over one document, a set of documents or the whole corpus. A BM25
+    index over the same nodes is kept in step for hybrid retrieval. Writes (inserts,
+    deletes, persists) are serialized; reads run concurrently. Re-adds and deletes of
+    one file also hold its file_lock from the diff to the persist.
+    """
+
+    def __init__(self, persist_dir: str = CORPUS_INDEX_DIR, bm25: Optional[BM25Index] = None):
+        self.persist_dir = persist_dir
+        self.bm25 = bm25 or BM25Index()
+        self._index = None
+        self._file_ids: Set[str] = set()
+        self._load_lock = threading.Lock()
+        self._write_lock: Optional[asyncio.Lock] = None
+        # Dropped once no ingest of the file holds or waits for it
+        self._file_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @property
+    def write_lock(self) -> asyncio.Lock:
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+
+    def file_lock(self, file_id: str) -> asyncio.Lock:
+        lock = self._file_locks.get(file_id)
+        if lock is None:
+            lock = self._file_locks[file_id] = asyncio.Lock()
+        return lock
+
+    @staticmethod
+    def _new_vector_store():
+        return NumpyVectorStore() if VECTOR_STORE_BACKEND == "numpy" else SimpleVectorStore()
+
+    def _load_vector_store(self):
+        if VECTOR_STORE_BACKEND != "numpy":
+            return SimpleVectorStore.from_persist_dir(self.persist_dir)
+        if NumpyVectorStore.exists(self.persist_dir):
+            return NumpyVectorStore.from_persist_dir(self.persist_dir)
+        # Corpus persisted with the JSON vector store: migrate it, the next persist writes the matrix
+        print(f"DEBUG: Migrating corpus vectors in {self.persist_dir} to the numpy vector store")
+        return NumpyVectorStore.from_simple_vector_store(SimpleVectorStore.from_persist_dir(self.persist_dir))
+
+    def get_index(self):
+        if self._index is not None:
+            return self._index
+
+        with self._load_lock:
+            if self._index is None:
+                if os.path.exists(self.persist_dir):
+                    storage_context = StorageContext.from_defaults(
+                        persist_dir=self.persist_dir,
+                        docstore=load_docstore(self.persist_dir) if INDEX_SNAPSHOT_ENABLED else None,
+                        vector_store=self._load_vector_store()
+                    )
+                    index = load_index_from_storage(storage_context)
+                    print(f"DEBUG: Loaded corpus index from {self.persist_dir} ({VECTOR_STORE_BACKEND} vector store)")
+                else:
+                    storage_context = StorageContext.from_defaults(
+                        docstore=SnapshotDocumentStore() if INDEX_SNAPSHOT_ENABLED else None,
+                        vector_store=self._new_vector_store()
+                    )
+                    index = VectorStoreIndex(nodes=[], storage_context=storage_context)
+                # Ref doc info carries the document metadata, so nodes are not decoded here
+                self._file_ids = {
+                    info.metadata.get("file_id") for info in self._ref_doc_info(index).values() if info.metadata.get("file_id")
+                }
+                if not self.bm25.doc_count and self._file_ids:
+                    # Corpus built before the BM25 index existed
+                    self.bm25.add_nodes(list(index.docstore.docs.values()))
+                    print(f"DEBUG: Built BM25 index over {self.bm25.doc_count} corpus nodes")
+                self._index = index
+            index_registry.enforce_budget()
+            return self._index
+
+    @staticmethod
+    def _ref_doc_info(index) -> Dict[str, Any]:
+        return index.docstore.get_all_ref_doc_info() or {}
+
+    @property
+    def resident_bytes(self) -> int:
+        """Estimated memory of the loaded index; counted against the index registry budget"""
+        if self._index is None:
+            return 0
+        return estimate_index_size(self._index, self.persist_dir)
+
+    async def aget_index(self):
+        if self._index is not None:
+            return self._index
+        return await asyncio.to_thread(self.get_index)
+
+    def contains(self, file_id: str) -> bool:
+        self.get_index()
+        return file_id in self._file_ids
+
+    @property
+    def file_ids(self) -> List[str]:
+        self.get_index()
+        return sorted(self._file_ids)
+
+    def insert_callback(self, file_id: str) -> Callable[[List[Any]], Awaitable[None]]:
+        async def insert(nodes: List[Any]):
+            index = await self.aget_index()
+            async with self.write_lock:
+                await asyncio.to_thread(index.insert_nodes, nodes)
+                await asyncio.to_thread(self.bm25.add_nodes, nodes)
+                self._file_ids.add(file_id)
+            index_registry.enforce_budget()
+        return insert
+
+    async def adelete_file(self, file_id: str) -> int:
+        index = await self.aget_index()
+        async with self.write_lock:
+            ref_doc_ids = await asyncio.to_thread(self._delete_file, index, file_id)
+            await asyncio.to_thread(self.bm25.delete_file, file_id)
+            self._file_ids.discard(file_id)
+        return len(ref_doc_ids)
+
+    def _delete_file(self, index, file_id: str) -> Set[str]:
+        ref_doc_ids = {
+            ref_doc_id for ref_doc_id, info in self._ref_doc_info(index).items()
+            if info.metadata.get("file_id") == file_id
+        }
+        for ref_doc_id in ref_doc_ids:
+            index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+        return ref_doc_ids
+
+    async def adiff_file(self, file_id: str, nodes: List[Any]) -> Tuple[List[Any], Dict[str, int]]:
+        """Upsert step for a re-added file: keep its stored nodes whose content is unchanged and delete the
+        ones that are gone. Returns the nodes that still need embedding and insertion, plus diff counts.
+        """
+        index = await self.aget_index()
+        async with self.write_lock:
+            new_nodes, removed = await asyncio.to_thread(self._diff_file, index, file_id, nodes)
+            if removed:
+                await asyncio.to_thread(self.bm25.delete_nodes, removed)
+        return new_nodes, {"unchanged": len(nodes) - len(new_nodes), "added": len(new_nodes), "removed": len(removed)}
+
+    def _diff_file(self, index, file_id: str, nodes: List[Any]) -> Tuple[List[Any], List[str]]:
+        node_ids = [
+            node_id for info in self._ref_doc_info(index).values()
+            if info.metadata.get("file_id") == file_id for node_id in info.node_ids
+        ]
+        existing: Dict[str, List[str]] = {}
+        for node in index.docstore.get_nodes(node_ids, raise_error=False):
+            if node is not None:
+                existing.setdefault(content_hash(node), []).append(node.node_id)
+
+        new_nodes = []
+        for node in nodes:
+            unchanged = existing.get(content_hash(node))
+            if unchanged:
+                unchanged.pop()
+            else:
+                new_nodes.append(node)
+
+        removed = [node_id for ids in existing.values() for node_id in ids]
+        if removed:
+            index.delete_nodes(removed, delete_from_docstore=True)
+        return new_nodes, removed
+
+    async def apersist(self):
+        index = await self.aget_index()
+        async with self.write_lock:
+            await asyncio.to_thread(index.storage_context.persist, persist_dir=self.persist_dir)
+
+    def retriever_kwargs(
+        self,
+        similarity_top_k: int,
+        file_ids: Optional[List[str]] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        return {"similarity_top_k": similarity_top_k, "filters": build_filters(file_ids, filters)}
+
+    def as_retriever(self, similarity_top_k: int, filters: Optional[MetadataFilters] = None):
+        """Hybrid BM25 + vector retriever, or plain vector retrieval when hybrid search is disabled"""
+        index = self.get_index()
+        if not HYBRID_SEARCH_ENABLED:
+            return index.as_retriever(similarity_top_k=similarity_top_k, filters=filters)
+        return HybridRetriever(index, self.bm25, similarity_top_k=similarity_top_k, filters=filters)
+
+
+corpus_index = CorpusIndex()
+index_registry.pin("corpus", lambda: corpus_index.resident_bytes)
@@ -0,0 +1,199 @@
+# services/embedding_cache.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+
+SQLITE_MAX_VARIABLES = 500
+
+
+class EmbeddingCache:
+    """Persistent chunk embedding cache.
+
+    Vectors are appended as raw float32 rows to one file per (model, dimensions) and read
+    back through np.memmap; a SQLite table maps the hash of model + normalized chunk text
+    to the row offset. Meant for a single writer process.
+    """
+
+    def __init__(self, directory: str = "embedding_cache"):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._maps: Dict[str, np.memmap] = {}
+        self._conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_index (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                dim INTEGER,
+                row INTEGER
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def make_key(cls, model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{cls.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def _vector_path(self, model: str, dim: int) -> str:
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model)
+        return os.path.join(self.directory, f"{slug}-{dim}.f32")
+
+    def _matrix(self, path: str, dim: int, min_rows: int) -> np.memmap:
+        matrix = self._maps.get(path)
+        if matrix is None or matrix.shape[0] < min_rows:
+            rows = os.path.getsize(path) // (4 * dim)
+            matrix = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim))
+            self._maps[path] = matrix
+        return matrix
+
+    def _lookup(self, model: str, keys: List[str]) -> Dict[str, tuple]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), SQLITE_MAX_VARIABLES):
+            batch = unique[start:start + SQLITE_MAX_VARIABLES]
+            rows = self._conn.execute(
+                f"SELECT key, dim, row FROM embedding_index WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                (model, *batch)
+            ).fetchall()
+            found.update({key: (dim, row) for key, dim, row in rows})
+        return found
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        keys = [self.make_key(model, text) for text in texts]
+        results = []
+        with self._lock:
+            found = self._lookup(model, keys)
+            for key in keys:
+                if key not in found:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                dim, row = found[key]
+                matrix = self._matrix(self._vector_path(model, dim), dim, row + 1)
+                results.append(matrix[row].tolist())
+                self.hits += 1
+        return results
+
+    def contains_all(self, model: str, texts: List[str]) -> bool:
+        """Existence check that leaves hit/miss stats untouched"""
+        keys = [self.make_key(model, text) for text in texts]
+        with self._lock:
+            return len(self._lookup(model, keys)) == len(set(keys))
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        if not texts:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        dim = vectors.shape[1]
+        path = self._vector_path(model, dim)
+
+        with self._lock:
+            keys = [self.make_key(model, text) for text in texts]
+            existing = self._lookup(model, keys)
+            new = {}
+            for i, key in enumerate(keys):
+                if key not in existing and key not in new:
+                    new[key] = i
+            if not new:
+                return
+
+            first_row = os.path.getsize(path) // (4 * dim) if os.path.exists(path) else 0
+            with open(path, "ab") as f:
+                f.write(vectors[list(new.values())].tobytes())
+
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embedding_index (key, model, dim, row) VALUES (?, ?, ?, ?)",
+                [(key, model, dim, first_row + offset) for offset, key in enumerate(new)]
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embedding_index").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "directory": self.directory
+        }
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Wraps a llama_index embedding model and only embeds chunks missing from an EmbeddingCache"""
+
+    _embed_model: Any = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _model_id: str = PrivateAttr()
+
+    def __init__(self, embed_model: Any, cache: EmbeddingCache, **kwargs: Any):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+        dimensions = getattr(embed_model, "dimensions", None)
+        self._model_id = f"{embed_model.model_name}@{dimensions}" if dimensions else embed_model.model_name
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def wrapped_embed_model(self) -> Any:
+        return self._embed_model
+
+    def is_cached(self, texts: List[str]) -> bool:
+        return self._cache.contains_all(self._model_id, texts)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._embed_model.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self._cache.get_many(self._model_id, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new = self._embed_model.get_text_embedding_batch(missing_texts)
+            self._cache.put_many(self._model_id, missing_texts, new)
+            for i, embedding in zip(missing, new):
+                embeddings[i] = embedding
+        return embeddings
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self._cache.get_many(self._model_id, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new = await self._embed_model.aget_text_embedding_batch(missing_texts)
+            self._cache.put_many(self._model_id, missing_texts, new)
+            for i, embedding in zip(missing, new):
+                embeddings[i] = embedding
+        return embeddings
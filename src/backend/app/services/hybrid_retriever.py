@@ -0,0 +1,104 @@
+# services/hybrid_retriever.py
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores import MetadataFilters
+
+from services.bm25_index import BM25Index
+
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+# Candidates taken from each retriever before fusion
+HYBRID_CANDIDATE_K = int(os.getenv("HYBRID_CANDIDATE_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> Dict[str, float]:
+    """score(node) = sum over rankings of 1 / (k + rank), rank starting at 1"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, start=1):
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+class HybridRetriever(BaseRetriever):
+    """Vector similarity + BM25 retrieval over the corpus index, fused with reciprocal-rank fusion"""
+
+    def __init__(
+        self,
+        index: Any,
+        bm25: BM25Index,
+        similarity_top_k: int = 5,
+        filters: Optional[MetadataFilters] = None,
+        candidate_k: int = HYBRID_CANDIDATE_K,
+        rrf_k: int = RRF_K
+    ):
+        candidate_k = max(candidate_k, similarity_top_k)
+        self._vector_retriever = index.as_retriever(similarity_top_k=candidate_k, filters=filters)
+        self._docstore = index.docstore
+        self._vector_store = index.vector_store
+        self._bm25 = bm25
+        self._filters = filters
+        self._similarity_top_k = similarity_top_k
+        self._candidate_k = candidate_k
+        self._rrf_k = rrf_k
+        super().__init__()
+
+    def _fuse(
+        self,
+        query_str: str,
+        vector_nodes: List[NodeWithScore],
+        lexical: Optional[List[Tuple[str, float]]] = None
+    ) -> List[NodeWithScore]:
+        if lexical is None:
+            lexical = self._bm25.search(query_str, self._candidate_k, self._filters)
+        scores = reciprocal_rank_fusion(
+            [[node.node.node_id for node in vector_nodes], [node_id for node_id, _ in lexical]],
+            self._rrf_k
+        )
+
+        nodes = {node.node.node_id: node.node for node in vector_nodes}
+        results = []
+        for node_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            node = nodes.get(node_id) or self._docstore.get_document(node_id, raise_error=False)
+            if node is None:
+                continue
+            results.append(NodeWithScore(node=node, score=score))
+            if len(results) == self._similarity_top_k:
+                break
+        return results
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._fuse(query_bundle.query_str, self._vector_retriever.retrieve(query_bundle))
+
+    def retrieve_batch(self, query_bundles: List[QueryBundle]) -> List[List[NodeWithScore]]:
+        """Retrieve for several embedded queries at once.
+
+        With the numpy vector store the vector candidates of all queries come from one
+        matrix top-k, and nodes retrieved by more than one query are loaded once.
+        """
+        query_batch = getattr(self._vector_store, "query_batch", None)
+        if query_batch is None or any(bundle.embedding is None for bundle in query_bundles):
+            return [self.retrieve(bundle) for bundle in query_bundles]
+
+        results = query_batch([bundle.embedding for bundle in query_bundles], self._candidate_k, self._filters)
+        node_ids = list(dict.fromkeys(node_id for result in results for node_id in result.ids))
+        nodes = {node_id: self._docstore.get_document(node_id, raise_error=False) for node_id in node_ids}
+        return [
+            self._fuse(bundle.query_str, [
+                NodeWithScore(node=nodes[node_id], score=score)
+                for node_id, score in zip(result.ids, result.similarities) if nodes[node_id] is not None
+            ])
+            for bundle, result in zip(query_bundles, results)
+        ]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # BM25 reads SQLite under a lock: keep it off the event loop, alongside the vector search
+        vector_nodes, lexical = await asyncio.gather(
+            self._vector_retriever.aretrieve(query_bundle),
+            asyncio.to_thread(self._bm25.search, query_bundle.query_str, self._candidate_k, self._filters)
+        )
+        return self._fuse(query_bundle.query_str, vector_nodes, lexical)
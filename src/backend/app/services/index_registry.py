@@ -0,0 +1,187 @@
+# services/index_registry.py
+import asyncio
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from services.index_snapshot import load_index
+
+INDEX_DIR = "index"
+# Estimated memory the resident indices may use before the least recently used ones are evicted
+INDEX_MEMORY_BUDGET_MB = float(os.getenv("INDEX_MEMORY_BUDGET_MB", "1024"))
+
+# A float in a Python list: 8 byte pointer + 24 byte float object
+FLOAT_LIST_ITEM_BYTES = 32
+
+
+def _directory_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+def estimate_index_size(index: Any, index_path: Optional[str] = None) -> int:
+    """Approximate resident bytes of a vector index: node texts and metadata plus embedding vectors.
+
+    Stores that report resident_bytes (memory-mapped snapshots) are taken at their word.
+    Falls back to the size of the persisted index when the stores cannot be inspected.
+    """
+    try:
+        size = 0
+        docstore_bytes = getattr(index.docstore, "resident_bytes", None)
+        if docstore_bytes is not None:
+            size += docstore_bytes
+        else:
+            for node in index.docstore.docs.values():
+                size += sys.getsizeof(node.get_content()) + sys.getsizeof(str(node.metadata))
+        size += getattr(index.vector_store, "resident_bytes", 0)
+
+        embedding_dict = getattr(getattr(index.vector_store, "data", None), "embedding_dict", None) or {}
+        for embedding in embedding_dict.values():
+            size += sys.getsizeof(embedding) + len(embedding) * FLOAT_LIST_ITEM_BYTES
+        if size:
+            return size
+    except Exception:
+        pass
+
+    if index_path and os.path.exists(index_path):
+        return _directory_size(index_path)
+    return 0
+
+
+class IndexRegistry:
+    """Process-wide LRU cache of loaded vector indices, shared by RAG and summarization.
+
+    Indices built at ingest are registered directly, so the next request does not
+    deserialize them again from disk. Concurrent loads of the same file_id wait for
+    a single load instead of each reading the persisted index. When the estimated
+    size of the resident indices exceeds the memory budget, the least recently used
+    ones are dropped (they stay persisted and are reloaded on demand).
+
+    Long-lived indices that are not cached here (the corpus index) are pinned: their
+    size counts against the same budget and is reported in stats, but they are never
+    evicted, so per-file indices make room for them.
+    """
+
+    def __init__(self, index_dir: str = INDEX_DIR, memory_budget_mb: float = INDEX_MEMORY_BUDGET_MB):
+        self.index_dir = index_dir
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._indices: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._pinned: Dict[str, Callable[[], int]] = {}
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def index_path(self, file_id: str) -> str:
+        return os.path.join(self.index_dir, file_id)
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def pin(self, name: str, resident_bytes: Callable[[], int]):
+        """Count a long-lived index against the budget; resident_bytes is re-read on every check"""
+        with self._lock:
+            self._pinned[name] = resident_bytes
+
+    def _pinned_sizes(self) -> Dict[str, int]:
+        return {name: resident_bytes() for name, resident_bytes in self._pinned.items()}
+
+    def enforce_budget(self):
+        """Evict after a pinned index grew"""
+        with self._lock:
+            self._evict()
+
+    def put(self, file_id: str, index: Any):
+        size = estimate_index_size(index, self.index_path(file_id))
+        with self._lock:
+            self._indices[file_id] = index
+            self._indices.move_to_end(file_id)
+            self._sizes[file_id] = size
+            self._evict(keep=file_id)
+
+    def _evict(self, keep: Optional[str] = None):
+        """Drop least recently used indices until the budget holds; the newest one is always kept"""
+        budget = self.memory_budget - sum(self._pinned_sizes().values())
+        while self.resident_bytes > budget and self._indices and (keep is None or len(self._indices) > 1):
+            file_id = next(iter(self._indices))
+            if file_id == keep:
+                break
+            del self._indices[file_id]
+            size = self._sizes.pop(file_id, 0)
+            self.evictions += 1
+            print(f"DEBUG: Evicted index {file_id} ({size / 1024 / 1024:.1f} MB) from memory")
+
+    def _cached(self, file_id: str) -> Optional[Any]:
+        with self._lock:
+            index = self._indices.get(file_id)
+            if index is not None:
+                self._indices.move_to_end(file_id)
+                self.hits += 1
+            return index
+
+    def get(self, file_id: str) -> Optional[Any]:
+        """Cached index, loading it from disk once if needed; None if it was never persisted"""
+        index = self._cached(file_id)
+        if index is not None:
+            return index
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(file_id, threading.Lock())
+
+        with load_lock:
+            try:
+                index = self._cached(file_id)
+                if index is not None:
+                    return index
+
+                index_path = self.index_path(file_id)
+                if not os.path.exists(index_path):
+                    return None
+
+                index = load_index(index_path)
+                self.loads += 1
+                self.put(file_id, index)
+                return index
+            finally:
+                with self._lock:
+                    if self._load_locks.get(file_id) is load_lock:
+                        del self._load_locks[file_id]
+
+    async def aget(self, file_id: str) -> Optional[Any]:
+        index = self._cached(file_id)
+        if index is not None:
+            return index
+        return await asyncio.to_thread(self.get, file_id)
+
+    def remove(self, file_id: str):
+        with self._lock:
+            self._indices.pop(file_id, None)
+            self._sizes.pop(file_id, None)
+
+    def __contains__(self, file_id: str) -> bool:
+        return file_id in self._indices
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pinned = self._pinned_sizes()
+            return {
+                "resident": len(self._indices),
+                "resident_mb": round(self.resident_bytes / 1024 / 1024, 2),
+                "pinned_mb": {name: round(size / 1024 / 1024, 2) for name, size in pinned.items()},
+                "total_mb": round((self.resident_bytes + sum(pinned.values())) / 1024 / 1024, 2),
+                "memory_budget_mb": round(self.memory_budget / 1024 / 1024, 2),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions
+            }
+
+
+index_registry = IndexRegistry()
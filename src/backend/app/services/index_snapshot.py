@@ -0,0 +1,421 @@
+# services/index_snapshot.py
+import json
+import os
+import shutil
+import struct
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.kvstore.types import BaseInMemoryKVStore, DEFAULT_COLLECTION
+from llama_index.core.vector_stores import SimpleVectorStore
+
+from services.numpy_vector_store import NumpyVectorStore
+
+# Persist indices as binary snapshots (and migrate JSON persist dirs when they are loaded)
+INDEX_SNAPSHOT_ENABLED = os.getenv("INDEX_SNAPSHOT_ENABLED", "true").lower() == "true"
+
+SNAPSHOT_DIRNAME = "snapshot"
+CURRENT_FNAME = "CURRENT"
+TABLE_FNAME = "table.npz"
+DOCSTORE_FNAME = "docstore.json"
+VECTOR_STORE_FNAME = "default__vector_store.json"
+
+LENGTH = struct.Struct("<I")
+NO_TEXT = 0xFFFFFFFF
+# The collections log is rewritten once it holds this many records beyond twice the live entries
+LOG_SLACK = 1024
+
+
+def _write_record(f, payload: Optional[bytes]) -> int:
+    offset = f.tell()
+    if payload is None:
+        f.write(LENGTH.pack(NO_TEXT))
+    else:
+        f.write(LENGTH.pack(len(payload)))
+        f.write(payload)
+    return offset
+
+
+def _read_record(blob: np.ndarray, offset: int) -> Optional[bytes]:
+    (length,) = LENGTH.unpack(blob[offset:offset + LENGTH.size].tobytes())
+    if length == NO_TEXT:
+        return None
+    start = offset + LENGTH.size
+    return blob[start:start + length].tobytes()
+
+
+def _raw_record(blob: np.ndarray, offset: int) -> bytes:
+    (length,) = LENGTH.unpack(blob[offset:offset + LENGTH.size].tobytes())
+    return blob[offset:offset + LENGTH.size + (0 if length == NO_TEXT else length)].tobytes()
+
+
+def _blob(directory: str, name: str) -> np.ndarray:
+    path = os.path.join(directory, name)
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+@dataclass(frozen=True)
+class Generation:
+    """A loaded snapshot generation as readers see it; never modified, a persist swaps in a new one"""
+    directory: Optional[str] = None
+    keys: List[str] = field(default_factory=list)
+    rows: Dict[str, int] = field(default_factory=dict)
+    table: np.ndarray = field(default_factory=lambda: np.zeros((0, 2), dtype=np.int64))
+    dead: int = 0
+    text: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.uint8))
+    meta: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.uint8))
+    log_file: Optional[str] = None
+    log_bytes: int = 0
+    log_records: int = 0
+
+
+class SnapshotKVStore(BaseInMemoryKVStore):
+    """KV store whose node collection lives in a memory-mapped binary snapshot.
+
+    A snapshot generation holds text.bin (length-prefixed node texts), meta.bin
+    (length-prefixed JSON of each node without its text), a collections log (length-prefixed
+    [collection, key, value] records of the small collections such as docstore/metadata and
+    ref_doc_info, value null for a delete) and table.npz (keys, int64 text and meta offsets
+    per node, the valid length of the log and the count of dead records). Nodes are decoded
+    on access only. Writes and deletes go to an in-memory overlay; persist appends the
+    overlay to the blobs and the changed small entries to the log, swaps in a new table,
+    and only writes a fresh generation when dead records outnumber live ones. The key and
+    offset arrays of table.npz are still rewritten on each persist, as is the index store
+    (index_store.json, whose index struct lists every node id), which llama_index persists
+    whole. Readers take the current Generation once, so a persist never shows them a
+    half-replaced one.
+    """
+
+    def __init__(self, directory: Optional[str] = None, data_collection: str = "docstore/data"):
+        self.data_collection = data_collection
+        self._collections: Dict[str, Dict[str, dict]] = {}
+        self._deleted: Set[str] = set()
+        # Small-collection entries changed since the last persist
+        self._dirty: Set[Tuple[str, str]] = set()
+        self._generation = Generation()
+        if directory:
+            self._open(directory)
+
+    @property
+    def directory(self) -> Optional[str]:
+        return self._generation.directory
+
+    def _open(self, directory: str, collections: Optional[Dict[str, Dict[str, dict]]] = None):
+        """Load a generation; collections skips replaying the log when the caller holds them already"""
+        table_path = os.path.join(directory, TABLE_FNAME)
+        log_file, log_bytes, log_records = None, 0, 0
+        if os.path.exists(table_path):
+            with np.load(table_path) as table:
+                keys = table["keys"].tolist()
+                offsets = table["offsets"]
+                dead = int(table["dead"])
+                if "log_file" in table:
+                    log_file, log_bytes, log_records = str(table["log_file"]), int(table["log_bytes"]), int(table["log_records"])
+                elif collections is None:
+                    # Tables written before the collections log
+                    collections = json.loads(table["collections"].tobytes().decode("utf-8"))
+            if collections is None:
+                collections = self._replay_log(directory, log_file, log_bytes)
+        else:
+            # Generations written before table.npz
+            with open(os.path.join(directory, "keys.json"), "r", encoding="utf-8") as f:
+                keys = json.load(f)
+            if collections is None:
+                with open(os.path.join(directory, "collections.json"), "r", encoding="utf-8") as f:
+                    collections = json.load(f)
+            offsets = np.load(os.path.join(directory, "table.npy"), mmap_mode="r")
+            dead = 0
+        collections = {name: values for name, values in collections.items() if name != self.data_collection}
+        collections[self.data_collection] = {}
+        generation = Generation(
+            directory=directory,
+            keys=keys,
+            rows={key: row for row, key in enumerate(keys)},
+            table=offsets,
+            dead=dead,
+            text=_blob(directory, "text.bin"),
+            meta=_blob(directory, "meta.bin"),
+            log_file=log_file,
+            log_bytes=log_bytes,
+            log_records=log_records
+        )
+        # The new generation holds everything the overlay did, so it goes in first
+        self._generation = generation
+        self._collections, self._deleted, self._dirty = collections, set(), set()
+
+    @staticmethod
+    def _replay_log(directory: str, log_file: Optional[str], log_bytes: int) -> Dict[str, Dict[str, dict]]:
+        collections: Dict[str, Dict[str, dict]] = {}
+        if log_file is None:
+            return collections
+        with open(os.path.join(directory, log_file), "rb") as f:
+            blob = np.frombuffer(f.read(log_bytes), dtype=np.uint8)
+        offset = 0
+        while offset < log_bytes:
+            payload = _read_record(blob, offset)
+            offset += LENGTH.size + len(payload)
+            collection, key, value = json.loads(payload)
+            if value is None:
+                collections.get(collection, {}).pop(key, None)
+            else:
+                collections.setdefault(collection, {})[key] = value
+        return collections
+
+    def _small_collections(self) -> Dict[str, Dict[str, dict]]:
+        return {name: values for name, values in self._collections.items() if name != self.data_collection}
+
+    def _write_log(self, directory: str, generation: Generation, rewrite: bool) -> Tuple[str, int, int]:
+        """Append the changed small entries to the log, or rewrite it with every entry; returns (file, bytes, records)"""
+        small = self._small_collections()
+        live = sum(len(values) for values in small.values())
+        if rewrite or generation.log_file is None or generation.log_records > 2 * live + LOG_SLACK:
+            log_file, start, count = f"collections-{uuid.uuid4().hex}.log", 0, 0
+            records = [(name, key, value) for name, values in small.items() for key, value in values.items()]
+        else:
+            log_file, start, count = generation.log_file, generation.log_bytes, generation.log_records
+            records = [(name, key, small.get(name, {}).get(key)) for name, key in self._dirty]
+
+        path = os.path.join(directory, log_file)
+        with open(path, "r+b" if start else "wb") as f:
+            # Bytes past the table's length are left over from a persist that crashed before its table swap
+            f.seek(start)
+            f.truncate()
+            for record in records:
+                _write_record(f, json.dumps(record, ensure_ascii=False, default=str).encode("utf-8"))
+            return log_file, f.tell(), count + len(records)
+
+    @staticmethod
+    def _remove_stale_logs(directory: str, log_file: str):
+        for name in os.listdir(directory):
+            if name.startswith("collections-") and name != log_file:
+                os.remove(os.path.join(directory, name))
+
+    def _write_table(self, directory: str, keys: List[str], offsets: List[Any], dead: int, log: Tuple[str, int, int]):
+        """Write table.npz through a temporary file so readers never see a partial table"""
+        log_file, log_bytes, log_records = log
+        tmp_path = os.path.join(directory, f"{TABLE_FNAME}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                keys=np.asarray(keys, dtype=str),
+                offsets=np.asarray(offsets, dtype=np.int64).reshape(-1, 2),
+                log_file=np.asarray(log_file),
+                log_bytes=np.int64(log_bytes),
+                log_records=np.int64(log_records),
+                dead=np.int64(dead)
+            )
+        os.replace(tmp_path, os.path.join(directory, TABLE_FNAME))
+
+    @staticmethod
+    def _decode(generation: Generation, row: int) -> dict:
+        text_offset, meta_offset = generation.table[row]
+        value = json.loads(_read_record(generation.meta, int(meta_offset)))
+        text = _read_record(generation.text, int(text_offset))
+        if text is not None:
+            value["__data__"]["text"] = text.decode("utf-8")
+        return value
+
+    def _snapshot_keys(self, generation: Generation) -> List[str]:
+        overlay = self._collections.get(self.data_collection, {})
+        return [key for key in generation.keys if key not in self._deleted and key not in overlay]
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self._collections.setdefault(collection, {})[key] = val.copy()
+        if collection != self.data_collection:
+            self._dirty.add((collection, key))
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        value = self._collections.get(collection, {}).get(key)
+        if value is not None:
+            return value.copy()
+        generation = self._generation
+        if collection == self.data_collection and key in generation.rows and key not in self._deleted:
+            return self._decode(generation, generation.rows[key])
+        return None
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        values = {}
+        if collection == self.data_collection:
+            generation = self._generation
+            values = {key: self._decode(generation, generation.rows[key]) for key in self._snapshot_keys(generation)}
+        values.update({key: value.copy() for key, value in self._collections.get(collection, {}).items()})
+        return values
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        deleted = self._collections.get(collection, {}).pop(key, None) is not None
+        if collection != self.data_collection and deleted:
+            self._dirty.add((collection, key))
+        if collection == self.data_collection and key in self._generation.rows and key not in self._deleted:
+            self._deleted.add(key)
+            deleted = True
+        return deleted
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection)
+
+    @property
+    def resident_bytes(self) -> int:
+        """Rough size of what is held in memory: the overlay and the key list, not the mapped snapshot"""
+        overlay = sum(len(json.dumps(values, default=str)) for values in self._collections.values())
+        return overlay + sum(len(key) + 50 for key in self._generation.keys)
+
+    def _write_overlay(self, text_file, meta_file, keys: List[str], offsets: List[Any]):
+        for key, value in self._collections.get(self.data_collection, {}).items():
+            value = json.loads(json.dumps(value, default=str))
+            text = value.get("__data__", {}).pop("text", None)
+            offsets.append((
+                _write_record(text_file, None if text is None else text.encode("utf-8")),
+                _write_record(meta_file, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+            ))
+            keys.append(key)
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """Persist next to persist_path: append the overlay to the current generation, or compact into a new one"""
+        snapshot_dir = os.path.abspath(os.path.join(os.path.dirname(persist_path), SNAPSHOT_DIRNAME))
+        generation = self._generation
+        live = self._snapshot_keys(generation)
+        dead = generation.dead + len(generation.keys) - len(live)
+        same_dir = bool(generation.directory) and os.path.dirname(os.path.abspath(generation.directory)) == snapshot_dir
+        if same_dir and dead <= len(live):
+            self._append(generation, live, dead)
+        else:
+            self._compact(generation, snapshot_dir, live)
+
+    def _append(self, generation: Generation, live: List[str], dead: int):
+        """Append only the overlay; records of deleted or rewritten nodes stay behind as dead bytes"""
+        keys = list(live)
+        offsets = [generation.table[generation.rows[key]] for key in live]
+        with open(os.path.join(generation.directory, "text.bin"), "ab") as text_file, \
+                open(os.path.join(generation.directory, "meta.bin"), "ab") as meta_file:
+            self._write_overlay(text_file, meta_file, keys, offsets)
+        log = self._write_log(generation.directory, generation, rewrite=False)
+        # A crash before the table swap only leaves unreferenced bytes at the end of the blobs and the log
+        self._write_table(generation.directory, keys, offsets, dead, log)
+        self._open(generation.directory, collections=self._small_collections())
+        self._remove_stale_logs(generation.directory, log[0])
+
+    def _compact(self, generation: Generation, snapshot_dir: str, live: List[str]):
+        """Write a new generation holding only live records; unchanged nodes are copied as raw bytes"""
+        generation_dir = os.path.join(snapshot_dir, uuid.uuid4().hex)
+        os.makedirs(generation_dir)
+
+        keys, offsets = [], []
+        with open(os.path.join(generation_dir, "text.bin"), "wb") as text_file, \
+                open(os.path.join(generation_dir, "meta.bin"), "wb") as meta_file:
+            for key in live:
+                text_offset, meta_offset = generation.table[generation.rows[key]]
+                offsets.append((text_file.tell(), meta_file.tell()))
+                text_file.write(_raw_record(generation.text, int(text_offset)))
+                meta_file.write(_raw_record(generation.meta, int(meta_offset)))
+                keys.append(key)
+            self._write_overlay(text_file, meta_file, keys, offsets)
+        self._write_table(generation_dir, keys, offsets, 0, self._write_log(generation_dir, generation, rewrite=True))
+
+        # The CURRENT pointer makes the new generation visible atomically
+        tmp_path = os.path.join(snapshot_dir, f"{CURRENT_FNAME}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(os.path.basename(generation_dir))
+        os.replace(tmp_path, os.path.join(snapshot_dir, CURRENT_FNAME))
+
+        self._open(generation_dir, collections=self._small_collections())
+        for name in os.listdir(snapshot_dir):
+            path = os.path.join(snapshot_dir, name)
+            if os.path.isdir(path) and path != generation_dir:
+                # Still mapped elsewhere on Windows: it is removed on a later persist
+                shutil.rmtree(path, ignore_errors=True)
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, fs: Optional[Any] = None) -> "SnapshotKVStore":
+        return cls(current_generation(os.path.dirname(persist_path)))
+
+    @classmethod
+    def from_dict(cls, collections: Dict[str, Dict[str, dict]]) -> "SnapshotKVStore":
+        store = cls()
+        store._collections = {name: dict(values) for name, values in collections.items()}
+        return store
+
+
+class SnapshotDocumentStore(KVDocumentStore):
+    """Document store persisted as a binary snapshot instead of docstore.json"""
+
+    def __init__(self, kvstore: Optional[SnapshotKVStore] = None, **kwargs: Any):
+        super().__init__(kvstore or SnapshotKVStore(), **kwargs)
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        self._kvstore.persist(persist_path, fs=fs)
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._kvstore.resident_bytes
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, **kwargs: Any) -> "SnapshotDocumentStore":
+        return cls(SnapshotKVStore(current_generation(persist_dir)))
+
+
+def current_generation(persist_dir: str) -> Optional[str]:
+    pointer = os.path.join(persist_dir, SNAPSHOT_DIRNAME, CURRENT_FNAME)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r", encoding="utf-8") as f:
+        return os.path.join(persist_dir, SNAPSHOT_DIRNAME, f.read().strip())
+
+
+def snapshot_exists(persist_dir: str) -> bool:
+    return current_generation(persist_dir) is not None
+
+
+def load_docstore(persist_dir: str) -> SnapshotDocumentStore:
+    """Snapshot docstore of a persist dir, converting docstore.json first if needed"""
+    if snapshot_exists(persist_dir):
+        return SnapshotDocumentStore.from_persist_dir(persist_dir)
+
+    json_path = os.path.join(persist_dir, DOCSTORE_FNAME)
+    docstore = SnapshotDocumentStore(SnapshotKVStore.from_dict(
+        SimpleDocumentStore.from_persist_dir(persist_dir)._kvstore.to_dict()
+    ))
+    docstore.persist(json_path)
+    os.remove(json_path)
+    print(f"DEBUG: Migrated {json_path} to a binary snapshot")
+    return docstore
+
+
+def load_vector_store(persist_dir: str) -> NumpyVectorStore:
+    """Numpy vector store of a persist dir, converting the JSON vector store first if needed"""
+    if NumpyVectorStore.exists(persist_dir):
+        return NumpyVectorStore.from_persist_dir(persist_dir)
+
+    json_path = os.path.join(persist_dir, VECTOR_STORE_FNAME)
+    vector_store = NumpyVectorStore.from_simple_vector_store(SimpleVectorStore.from_persist_path(json_path))
+    vector_store.persist(json_path)
+    os.remove(json_path)
+    print(f"DEBUG: Migrated {json_path} to memory-mapped vectors")
+    return vector_store
+
+
+def load_index(persist_dir: str):
+    """load_index_from_storage over a binary snapshot; JSON persist dirs are migrated on first load"""
+    if not INDEX_SNAPSHOT_ENABLED:
+        return load_index_from_storage(StorageContext.from_defaults(persist_dir=persist_dir))
+    storage_context = StorageContext.from_defaults(
+        persist_dir=persist_dir,
+        docstore=load_docstore(persist_dir),
+        vector_store=load_vector_store(persist_dir)
+    )
+    return load_index_from_storage(storage_context)
@@ -0,0 +1,167 @@
+# services/json_stream.py
+import json
+import re
+from typing import Any, List, Optional
+
+
+class JSONArrayStreamParser:
+    """Incrementally extracts complete elements of a named JSON array from streamed LLM output"""
+
+    def __init__(self, key: str = "action_items"):
+        self.key = key
+        self.buffer = ""
+        self.done = False
+        self._key_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._pos = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._element_start = None
+
+    def feed(self, delta: str) -> List[Any]:
+        self.buffer += delta
+        elements = []
+
+        if self._pos is None:
+            match = self._key_pattern.search(self.buffer)
+            if not match:
+                return elements
+            self._pos = match.end()
+
+        while self._pos < len(self.buffer) and not self.done:
+            ch = self.buffer[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._element_start = self._pos
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    self.done = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._element_start is not None:
+                        try:
+                            elements.append(json.loads(self.buffer[self._element_start:self._pos + 1]))
+                        except json.JSONDecodeError:
+                            pass
+                        self._element_start = None
+
+            self._pos += 1
+
+        return elements
+
+
+def _scan_string(text: str, start: int) -> int:
+    """Index just past the closing quote of the string starting at text[start], or -1 if unterminated"""
+    i = start + 1
+    while i < len(text):
+        if text[i] == "\\":
+            i += 2
+            continue
+        if text[i] == '"':
+            return i + 1
+        i += 1
+    return -1
+
+
+def parse_partial_json(text: str, key: Optional[str] = None) -> Any:
+    """Parse the first JSON object/array in text, recovering whatever is complete if it was cut off.
+
+    Truncated output is cut back to the last fully written value and the open containers are
+    closed, so '{"action_items": [{...}, {"title": "Inc' parses with the first item intact.
+    Brackets in leading prose ("see section [2]: {...}") are skipped: objects are tried before
+    arrays, and with a key only an object holding that key is accepted (the first value that
+    parsed is returned when none does).
+    """
+    error: Exception = ValueError("JSON not found")
+    first = None
+    starts = [i for i, ch in enumerate(text) if ch == "{"] + [i for i, ch in enumerate(text) if ch == "["]
+    for start in starts:
+        try:
+            parsed = _parse_partial_from(text[start:])
+        except ValueError as e:
+            error = e
+            continue
+        if key is None or (isinstance(parsed, dict) and key in parsed):
+            return parsed
+        if first is None:
+            first = (parsed,)
+    if first is not None:
+        return first[0]
+    raise error
+
+
+def _parse_partial_from(s: str) -> Any:
+    stack = []  # [closer, expected token] per open container
+    safe_end = None
+    safe_closers = ""
+
+    def mark_safe(end: int):
+        nonlocal safe_end, safe_closers
+        safe_end = end
+        safe_closers = "".join(closer for closer, _ in reversed(stack))
+
+    i = 0
+    while i < len(s):
+        ch = s[i]
+        if ch.isspace():
+            i += 1
+            continue
+
+        top = stack[-1] if stack else None
+        if ch == '"':
+            end = _scan_string(s, i)
+            if end == -1:
+                break
+            if top is not None and top[0] == "}" and top[1] == "key":
+                top[1] = "colon"
+            else:
+                if top is not None:
+                    top[1] = "comma"
+                mark_safe(end)
+            i = end
+        elif ch in "{[":
+            stack.append(["}", "key"] if ch == "{" else ["]", "value"])
+            mark_safe(i + 1)
+            i += 1
+        elif ch in "}]":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                return json.loads(s[:i + 1])
+            stack[-1][1] = "comma"
+            mark_safe(i + 1)
+            i += 1
+        elif ch == ":":
+            if top is not None:
+                top[1] = "value"
+            i += 1
+        elif ch == ",":
+            if top is not None:
+                top[1] = "key" if top[0] == "}" else "value"
+            i += 1
+        else:
+            end = i
+            while end < len(s) and s[end] not in ",]}" and not s[end].isspace():
+                end += 1
+            if end >= len(s):
+                break
+            if top is not None:
+                top[1] = "comma"
+            mark_safe(end)
+            i = end
+
+    if safe_end is None:
+        raise ValueError("JSON not found")
+    return json.loads(s[:safe_end] + safe_closers)
@@ -0,0 +1,237 @@
+# services/llm_cache.py
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import (
+    CustomLLM,
+    CompletionResponse,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.base.llms.types import CompletionResponseAsyncGen
+
+# Hit recency is kept in memory and written in one batch after this many hits or on the next set()
+ACCESS_FLUSH_SIZE = 256
+
+
+class LLMCache:
+    """SQLite backed completion cache with TTL expiry and LRU eviction.
+
+    Hits do not write: their last_access times are buffered and flushed in one
+    statement before the next eviction, so LRU order stays exact where it matters.
+    """
+
+    def __init__(self, path: str = "llm_cache.db", ttl_seconds: int = 7 * 24 * 3600, max_entries: int = 10000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._accessed: Dict[str, float] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                created_at REAL,
+                last_access REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, params: Dict[str, Any], prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        payload = json.dumps(
+            {"model": model, "params": params, "prompt": prompt_hash},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            response, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._accessed.pop(key, None)
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._accessed[key] = now
+            if len(self._accessed) >= ACCESS_FLUSH_SIZE:
+                self._flush_access()
+                self._conn.commit()
+            self.hits += 1
+            return response
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    def _flush_access(self):
+        """Write buffered hit times; caller holds the lock and commits"""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?",
+                [(last_access, key) for key, last_access in self._accessed.items()]
+            )
+            self._accessed.clear()
+
+    def contains(self, key: str) -> bool:
+        """Existence check that leaves hit/miss stats and recency untouched"""
+        with self._lock:
+            row = self._conn.execute("SELECT created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return row is not None and not (self.ttl_seconds and time.time() - row[0] > self.ttl_seconds)
+
+    def set(self, key: str, model: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self._accessed.pop(key, None)
+            self._flush_access()
+            if self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+
+            count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if self.max_entries and count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    async def aset(self, key: str, model: str, response: str):
+        await asyncio.to_thread(self.set, key, model, response)
+
+    def clear(self):
+        with self._lock:
+            self._accessed.clear()
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "path": self.path
+        }
+
+
+class CachedLLM(CustomLLM):
+    """Wraps a llama_index LLM and answers repeated completions from an LLMCache"""
+
+    _llm: Any = PrivateAttr()
+    _cache: LLMCache = PrivateAttr()
+
+    def __init__(self, llm: Any, cache: LLMCache, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._llm = llm
+        self._cache = cache
+
+    @property
+    def wrapped_llm(self) -> Any:
+        return self._llm
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        inner = self._llm.metadata
+        # Completion-style metadata keeps predict() on complete(), which is where the cache sits
+        return LLMMetadata(
+            context_window=inner.context_window,
+            num_output=inner.num_output,
+            model_name=inner.model_name
+        )
+
+    def _cache_key(self, prompt: str, formatted: bool, kwargs: Dict[str, Any]) -> str:
+        params = {
+            "temperature": getattr(self._llm, "temperature", None),
+            "max_tokens": getattr(self._llm, "max_tokens", None),
+            "formatted": formatted,
+            "kwargs": kwargs
+        }
+        return LLMCache.make_key(self._llm.metadata.model_name, params, prompt)
+
+    def is_cached(self, prompt: str, formatted: bool = False, **kwargs: Any) -> bool:
+        return self._cache.contains(self._cache_key(prompt, formatted, kwargs))
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        key = self._cache_key(prompt, formatted, kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return CompletionResponse(text=cached)
+
+        response = self._llm.complete(prompt, formatted=formatted, **kwargs)
+        self._cache.set(key, self._llm.metadata.model_name, response.text)
+        return response
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        key = self._cache_key(prompt, formatted, kwargs)
+        cached = await self._cache.aget(key)
+        if cached is not None:
+            return CompletionResponse(text=cached)
+
+        response = await self._llm.acomplete(prompt, formatted=formatted, **kwargs)
+        await self._cache.aset(key, self._llm.metadata.model_name, response.text)
+        return response
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        key = self._cache_key(prompt, formatted, kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            yield CompletionResponse(text=cached, delta=cached)
+            return
+
+        text = ""
+        for chunk in self._llm.stream_complete(prompt, formatted=formatted, **kwargs):
+            text = chunk.text
+            yield chunk
+        self._cache.set(key, self._llm.metadata.model_name, text)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        key = self._cache_key(prompt, formatted, kwargs)
+        cached = await self._cache.aget(key)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            if cached is not None:
+                yield CompletionResponse(text=cached, delta=cached)
+                return
+
+            text = ""
+            async for chunk in await self._llm.astream_complete(prompt, formatted=formatted, **kwargs):
+                text = chunk.text
+                yield chunk
+            await self._cache.aset(key, self._llm.metadata.model_name, text)
+
+        return gen()
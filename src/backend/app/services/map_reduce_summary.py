@@ -0,0 +1,231 @@
+# services/map_reduce_summary.py
+import asyncio
+import os
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from services.client_registry import registry, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES
+from services.llm_cache import LLMCache
+from services.prompt_builder import count_tokens
+from services.rate_limiter import limited_acomplete, llm_rate_limiter
+
+# Markdown is split along headings into chunks of at most this many tokens
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "1500"))
+# Token budget of the summaries combined in one reduce call
+SUMMARY_REDUCE_INPUT_TOKENS = int(os.getenv("SUMMARY_REDUCE_INPUT_TOKENS", "3000"))
+# Length of chunk and intermediate summaries; independent of max_length so they are reusable
+SUMMARY_CHUNK_WORDS = int(os.getenv("SUMMARY_CHUNK_WORDS", "150"))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "8"))
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "summary_cache.db")
+
+HEADING = re.compile(r"^#{1,6}\s")
+FENCE = re.compile(r"^\s*(```|~~~)")
+
+
+def _split_sections(text: str) -> List[str]:
+    """Split markdown before every heading line, ignoring '#' lines inside fenced code blocks"""
+    sections, current, in_fence = [], [], False
+    for line in text.splitlines():
+        if FENCE.match(line):
+            in_fence = not in_fence
+        if not in_fence and HEADING.match(line) and any(l.strip() for l in current):
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if any(l.strip() for l in current):
+        sections.append("\n".join(current).strip())
+    return sections
+
+
+def _pack(pieces: List[str], max_tokens: int, separator: str) -> List[str]:
+    """Greedily merge consecutive pieces into chunks of at most max_tokens (single oversized pieces pass through)"""
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(separator.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def _split_oversized(section: str, max_tokens: int) -> List[str]:
+    if count_tokens(section) <= max_tokens:
+        return [section]
+
+    lines = section.split("\n")
+    heading = lines[0] if HEADING.match(lines[0]) else ""
+    body = "\n".join(lines[1:] if heading else lines)
+    budget = max(max_tokens - count_tokens(heading), 1)
+
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", body):
+        if count_tokens(paragraph) <= budget:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            if count_tokens(line) <= budget:
+                pieces.append(line)
+                continue
+            words = line.split()
+            pieces.extend(_pack(words, budget, " "))
+
+    chunks = _pack([p for p in pieces if p.strip()], budget, "\n\n")
+    return [f"{heading}\n{chunk}" if heading else chunk for chunk in chunks]
+
+
+def split_markdown(text: str, max_tokens: int = SUMMARY_CHUNK_TOKENS) -> List[str]:
+    """Chunks along headings: small sections are merged, oversized ones split by paragraph with their heading repeated"""
+    pieces = []
+    for section in _split_sections(text):
+        pieces.extend(_split_oversized(section, max_tokens))
+    return _pack(pieces, max_tokens, "\n\n")
+
+
+class MapReduceSummarizer:
+    """Hierarchical summarizer for long documents.
+
+    Chunks are summarized concurrently (map), then the chunk summaries are combined in
+    groups that fit one prompt, level by level, until a single call can write the final
+    summary at the requested length (reduce). Chunk and intermediate summaries do not
+    depend on max_length and are cached by content hash.
+    """
+
+    def __init__(self, cache_path: str = SUMMARY_CACHE_PATH, concurrency: int = SUMMARY_MAP_CONCURRENCY):
+        self.cache = LLMCache(cache_path, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES)
+        self.concurrency = concurrency
+
+    @property
+    def llm(self):
+        return registry.get_llm()
+
+    def _model_name(self) -> str:
+        return getattr(self.llm.metadata, "model_name", "") or type(self.llm).__name__
+
+    def _chunk_prompt(self, chunk: str) -> str:
+        return f"""
+Summarize the following section of a longer document in at most {SUMMARY_CHUNK_WORDS} words.
+Keep the key facts, figures and conclusions.
+
+Section:
+{chunk}
+
+Summary:
+"""
+
+    def _combine_prompt(self, summaries: List[str], max_length: int) -> str:
+        parts = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(summaries))
+        return f"""
+The following are summaries of consecutive parts of one document.
+Combine them into a single summary of at most {max_length} words that covers the main points and key information in document order.
+
+{parts}
+
+Summary:
+"""
+
+    async def _cached_complete(self, kind: str, text: str, prompt: str, semaphore: asyncio.Semaphore) -> str:
+        key = LLMCache.make_key(self._model_name(), {"kind": kind, "words": SUMMARY_CHUNK_WORDS}, text)
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            return cached
+
+        async with semaphore:
+            response = await limited_acomplete(self.llm, prompt, count_tokens(prompt) + SUMMARY_CHUNK_WORDS * 2)
+        summary = str(response).strip()
+        await self.cache.aset(key, self._model_name(), summary)
+        return summary
+
+    async def _map_reduce(self, text: str) -> List[str]:
+        """Summaries small enough for one final combine call"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chunks = split_markdown(text)
+
+        summaries = await asyncio.gather(*(
+            self._cached_complete("chunk", chunk, self._chunk_prompt(chunk), semaphore) for chunk in chunks
+        ))
+
+        level = 0
+        while len(summaries) > 1 and sum(count_tokens(s) for s in summaries) > SUMMARY_REDUCE_INPUT_TOKENS:
+            groups = self._group(summaries)
+            summaries = await asyncio.gather(*(self._reduce_group(group, semaphore) for group in groups))
+            level += 1
+
+        print(f"DEBUG: Summarized {len(chunks)} chunks with {level} reduce level(s)")
+        return list(summaries)
+
+    async def _reduce_group(self, group: List[str], semaphore: asyncio.Semaphore) -> str:
+        if len(group) == 1:
+            return group[0]
+        return await self._cached_complete(
+            "reduce", "\n\n".join(group), self._combine_prompt(group, SUMMARY_CHUNK_WORDS), semaphore
+        )
+
+    def _group(self, summaries: List[str]) -> List[List[str]]:
+        """Consecutive groups within the reduce budget, at least two summaries each so every level shrinks"""
+        groups, current, current_tokens = [], [], 0
+        for summary in summaries:
+            tokens = count_tokens(summary)
+            if len(current) >= 2 and current_tokens + tokens > SUMMARY_REDUCE_INPUT_TOKENS:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(summary)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _reduced(self, text: str) -> Optional[List[str]]:
+        """Summaries for the final combine call, None when the document fits one prompt"""
+        if count_tokens(text) <= SUMMARY_CHUNK_TOKENS:
+            return None
+        return await self._map_reduce(text)
+
+    def _final_prompt(self, text: str, summaries: Optional[List[str]], max_length: int) -> str:
+        if summaries is None:
+            # Short document: summarize it directly at the requested length
+            return f"""
+Please summarize the following text. The summary should not exceed {max_length} words and should include the main idea of the text.
+
+Text:
+{text}
+
+Summary:
+"""
+        return self._combine_prompt(summaries, max_length)
+
+    async def _final_summary(self, text: str, summaries: Optional[List[str]], max_length: int) -> str:
+        prompt = self._final_prompt(text, summaries, max_length)
+        response = await limited_acomplete(self.llm, prompt, count_tokens(prompt) + max_length * 2)
+        return str(response).strip()
+
+    async def asummarize(self, text: str, max_length: Optional[int] = 500) -> str:
+        max_length = max_length or 500
+        return await self._final_summary(text, await self._reduced(text), max_length)
+
+    async def asummarize_many(self, text: str, lengths: List[int]) -> Dict[int, str]:
+        """Summaries at several lengths sharing one map/reduce pass; only the final calls differ"""
+        summaries = await self._reduced(text)
+        results = await asyncio.gather(*(self._final_summary(text, summaries, length) for length in lengths))
+        return dict(zip(lengths, results))
+
+    async def astream_summarize(self, text: str, max_length: Optional[int] = 500) -> AsyncIterator[Tuple[str, Any]]:
+        """Map/reduce levels run first, then the final summary streams as ("token", delta) and ("answer", text)"""
+        max_length = max_length or 500
+        prompt = self._final_prompt(text, await self._reduced(text), max_length)
+        await llm_rate_limiter.acquire(count_tokens(prompt) + max_length * 2)
+
+        answer = ""
+        async for chunk in await self.llm.astream_complete(prompt):
+            delta = chunk.delta or ""
+            answer += delta
+            if delta:
+                yield "token", delta
+
+        yield "answer", answer.strip()
+
+
+map_reduce_summarizer = MapReduceSummarizer()
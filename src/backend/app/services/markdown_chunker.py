@@ -0,0 +1,196 @@
+# services/markdown_chunker.py
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, List, Sequence, Tuple
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode
+from llama_index.core.utils import get_tqdm_iterable
+
+from services.prompt_builder import count_tokens
+
+# Token budget of a chunk: small sections are merged up to it, larger ones split below it
+MARKDOWN_CHUNK_TOKENS = int(os.getenv("MARKDOWN_CHUNK_TOKENS", "512"))
+
+HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+FENCE = re.compile(r"^\s*(```|~~~)")
+TABLE_ROW = re.compile(r"^\s*\|")
+TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class Section:
+    path: Tuple[str, ...]
+    heading: str = ""
+    blocks: List[Tuple[str, str]] = field(default_factory=list)  # (kind, text), kind in paragraph/table/code
+
+
+@dataclass
+class Chunk:
+    text: str
+    path: Tuple[str, ...]
+
+
+def parse_sections(text: str) -> List[Section]:
+    """Split markdown into sections at headings, grouping lines into paragraph, table and code blocks"""
+    sections = [Section(path=())]
+    stack: List[Tuple[int, str]] = []
+    kind, lines = None, []
+
+    def flush():
+        nonlocal kind, lines
+        if lines and any(line.strip() for line in lines):
+            sections[-1].blocks.append((kind, "\n".join(lines).strip("\n")))
+        kind, lines = None, []
+
+    in_fence = False
+    for line in text.splitlines():
+        if in_fence:
+            lines.append(line)
+            if FENCE.match(line):
+                in_fence = False
+                flush()
+            continue
+        if FENCE.match(line):
+            flush()
+            kind, lines, in_fence = "code", [line], True
+            continue
+
+        heading = HEADING.match(line)
+        if heading:
+            flush()
+            level, title = len(heading.group(1)), heading.group(2)
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, title))
+            sections.append(Section(path=tuple(title for _, title in stack), heading=line.strip()))
+            continue
+
+        line_kind = "table" if TABLE_ROW.match(line) else "paragraph"
+        if not line.strip() or (kind and kind != line_kind):
+            flush()
+        if line.strip():
+            kind = line_kind
+            lines.append(line)
+    flush()
+    return [section for section in sections if section.blocks or section.heading]
+
+
+def _pack(pieces: List[str], budget: int, separator: str) -> List[str]:
+    packed, current, tokens = [], [], 0
+    for piece in pieces:
+        piece_tokens = count_tokens(piece)
+        if current and tokens + piece_tokens > budget:
+            packed.append(separator.join(current))
+            current, tokens = [], 0
+        current.append(piece)
+        tokens += piece_tokens
+    if current:
+        packed.append(separator.join(current))
+    return packed
+
+
+def _split_table(table: str, budget: int) -> List[str]:
+    """Row groups that fit the budget, each starting with the header row (and separator)"""
+    rows = table.split("\n")
+    header_size = 2 if len(rows) > 1 and TABLE_SEPARATOR.match(rows[1]) else 1
+    header = "\n".join(rows[:header_size])
+    groups = _pack(rows[header_size:], max(budget - count_tokens(header), 1), "\n")
+    return [f"{header}\n{group}" for group in groups] or [header]
+
+
+def _split_block(kind: str, text: str, budget: int) -> List[str]:
+    if count_tokens(text) <= budget:
+        return [text]
+    if kind == "table":
+        return _split_table(text, budget)
+    if kind == "code":
+        return _pack(text.split("\n"), budget, "\n")
+    pieces = []
+    for sentence in SENTENCE_END.split(text):
+        if count_tokens(sentence) <= budget:
+            pieces.append(sentence)
+        else:
+            pieces.extend(_pack(sentence.split(), budget, " "))
+    return _pack(pieces, budget, " ")
+
+
+def _common_path(paths: List[Tuple[str, ...]]) -> Tuple[str, ...]:
+    common = paths[0]
+    for path in paths[1:]:
+        size = 0
+        while size < min(len(common), len(path)) and common[size] == path[size]:
+            size += 1
+        common = common[:size]
+    return common or paths[0]
+
+
+def chunk_markdown(text: str, max_tokens: int = MARKDOWN_CHUNK_TOKENS) -> List[Chunk]:
+    """Chunks that follow the heading hierarchy.
+
+    Tables and code blocks stay whole when they fit; larger tables are split into row
+    groups with the header repeated. Consecutive sections are merged while they fit the
+    budget, and every chunk carries the heading path shared by the sections it contains.
+    """
+    chunks: List[Chunk] = []
+    current: List[str] = []
+    paths: List[Tuple[str, ...]] = []
+    tokens = 0
+
+    def emit():
+        nonlocal current, paths, tokens
+        if current:
+            chunks.append(Chunk(text="\n\n".join(current), path=_common_path(paths)))
+        current, paths, tokens = [], [], 0
+
+    for section in parse_sections(text):
+        section_text = "\n\n".join([section.heading] * bool(section.heading) + [block for _, block in section.blocks])
+        section_tokens = count_tokens(section_text)
+        if section_tokens <= max_tokens:
+            if current and tokens + section_tokens > max_tokens:
+                emit()
+            current.append(section_text)
+            paths.append(section.path)
+            tokens += section_tokens
+            continue
+
+        # Oversized section: its own chunks, each repeating the heading
+        emit()
+        heading_tokens = count_tokens(section.heading) if section.heading else 0
+        budget = max(max_tokens - heading_tokens, 1)
+        pieces = [piece for kind, block in section.blocks for piece in _split_block(kind, block, budget)]
+        bodies = [f"{section.heading}\n\n{body}" if section.heading else body for body in _pack(pieces, budget, "\n\n")] or [section.heading]
+        chunks.extend(Chunk(text=body, path=section.path) for body in bodies[:-1])
+        # The remainder can still take the following small sections
+        current, paths, tokens = [bodies[-1]], [section.path], count_tokens(bodies[-1])
+    emit()
+    return chunks
+
+
+class MarkdownStructureParser(NodeParser):
+    """Node parser for markdown that follows headings instead of a fixed window.
+
+    Nodes get heading_path ("Report > Revenue > Q3") and section metadata.
+    """
+
+    chunk_tokens: int = Field(default=MARKDOWN_CHUNK_TOKENS, description="Token budget of a chunk", gt=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MarkdownStructureParser"
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        all_nodes: List[BaseNode] = []
+        for node in get_tqdm_iterable(nodes, show_progress, "Parsing markdown"):
+            chunks = chunk_markdown(node.get_content(), self.chunk_tokens)
+            split_nodes = build_nodes_from_splits([chunk.text for chunk in chunks], node, id_func=self.id_func)
+            for split_node, chunk in zip(split_nodes, chunks):
+                split_node.metadata["heading_path"] = " > ".join(chunk.path)
+                if chunk.path:
+                    split_node.metadata["section"] = chunk.path[-1]
+            all_nodes.extend(split_nodes)
+        return all_nodes
@@ -0,0 +1,629 @@
+# services/numpy_vector_store.py
+import asyncio
+import json
+import os
+import struct
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+VECTORS_DIRNAME = "vectors"
+MANIFEST_FNAME = "manifest.json"
+TABLE_FNAME = "table.npz"
+
+ROW_LENGTH = struct.Struct("<I")
+
+# Compaction merges all segments into one base matrix once there are more segments than this,
+# or once this share of the rows has been deleted
+NUMPY_STORE_MAX_SEGMENTS = int(os.getenv("NUMPY_STORE_MAX_SEGMENTS", "8"))
+NUMPY_STORE_COMPACT_DEAD_RATIO = float(os.getenv("NUMPY_STORE_COMPACT_DEAD_RATIO", "0.2"))
+# "int8" or "binary": search scans quantized codes held in memory and rescores the best candidates
+# against the full vectors, which then stay on disk (mmap); "none" scans the full vectors
+NUMPY_STORE_QUANTIZATION = os.getenv("NUMPY_STORE_QUANTIZATION", "none").lower()
+# Candidates rescored exactly per result: top_k * this many (binary codes are coarser, so they need more)
+RESCORE_FACTORS = {"int8": 10, "binary": 40}
+NUMPY_STORE_RESCORE_FACTOR = int(os.getenv("NUMPY_STORE_RESCORE_FACTOR", "0")) or None
+# Rows converted at a time by the quantized scan, bounding its temporary memory
+QUANTIZED_BLOCK_ROWS = 256
+# Set bits of every byte value: Hamming distances on NumPy < 2.0, which has no np.bitwise_count
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+Codes = Tuple[np.ndarray, Optional[np.ndarray]]
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> Codes:
+    """Codes of L2-normalized vectors: int8 with one scale per row, or sign bits packed 8 per byte"""
+    if quantization == "binary":
+        return np.packbits(vectors > 0, axis=1), None
+    if quantization != "int8":
+        raise ValueError(f"Unknown quantization: {quantization}")
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+
+def popcount(bits: np.ndarray) -> np.ndarray:
+    """Set bits per uint8 element"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits)
+    return POPCOUNT[bits]
+
+
+def approximate_scores(codes: Codes, queries: np.ndarray) -> np.ndarray:
+    """(rows, queries) scores from codes: scaled int8 dot products, or minus the Hamming distance of the sign bits"""
+    matrix, scales = codes
+    blocks = []
+    if scales is None:
+        query_bits = np.packbits(queries > 0, axis=1)
+        for start in range(0, len(matrix), QUANTIZED_BLOCK_ROWS):
+            block = matrix[start:start + QUANTIZED_BLOCK_ROWS]
+            distance = popcount(block[:, None, :] ^ query_bits[None, :, :]).sum(axis=2, dtype=np.int32)
+            blocks.append(-distance.astype(np.float32))
+    else:
+        for start in range(0, len(matrix), QUANTIZED_BLOCK_ROWS):
+            block = matrix[start:start + QUANTIZED_BLOCK_ROWS].astype(np.float32)
+            blocks.append((block @ queries.T) * scales[start:start + QUANTIZED_BLOCK_ROWS, None])
+    return np.concatenate(blocks) if blocks else np.zeros((0, len(queries)), dtype=np.float32)
+
+
+def _safe(fn: Callable[[Any], bool]) -> Callable[[Any], bool]:
+    def check(value: Any) -> bool:
+        try:
+            return bool(fn(value))
+        except TypeError:
+            return False
+    return check
+
+
+def _predicate(operator: FilterOperator, operand: Any) -> Callable[[Any], bool]:
+    if operator == FilterOperator.EQ:
+        return _safe(lambda v: v == operand)
+    if operator == FilterOperator.NE:
+        return _safe(lambda v: v != operand)
+    if operator == FilterOperator.GT:
+        return _safe(lambda v: v is not None and v > operand)
+    if operator == FilterOperator.GTE:
+        return _safe(lambda v: v is not None and v >= operand)
+    if operator == FilterOperator.LT:
+        return _safe(lambda v: v is not None and v < operand)
+    if operator == FilterOperator.LTE:
+        return _safe(lambda v: v is not None and v <= operand)
+    if operator == FilterOperator.IN:
+        values = set(operand)
+        return _safe(lambda v: v in values)
+    if operator == FilterOperator.NIN:
+        values = set(operand)
+        return _safe(lambda v: v not in values)
+    if operator == FilterOperator.CONTAINS:
+        return _safe(lambda v: isinstance(v, (list, tuple, set)) and operand in v)
+    raise ValueError(f"Unsupported metadata filter operator: {operator}")
+
+
+def matches_filters(metadata: Dict[str, Any], filters: Optional[MetadataFilters]) -> bool:
+    """Evaluate MetadataFilters against a single metadata dict"""
+    if filters is None or not filters.filters:
+        return True
+    results = (
+        matches_filters(metadata, metadata_filter) if isinstance(metadata_filter, MetadataFilters)
+        else _predicate(metadata_filter.operator, metadata_filter.value)(metadata.get(metadata_filter.key))
+        for metadata_filter in filters.filters
+    )
+    return any(results) if filters.condition == FilterCondition.OR else all(results)
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """Vector store backed by contiguous float32 matrices.
+
+    Rows live in segments: persisted ones are .npy files opened with mmap_mode="r", new
+    rows collect in one in-memory tail segment until the next persist. Node id, ref_doc_id
+    and metadata of each row are length-prefixed JSON records in an append-only rows file;
+    table.npz holds its valid length and the alive bitmap, so a persist appends the new
+    rows and swaps in a new table. Embeddings are stored L2-normalized, so a query is one
+    matmul per segment plus argpartition top-k.
+
+    With quantization, each segment also has int8 or binary codes (persisted as .npz next
+    to it and loaded into memory); the scan runs on the codes and only the top candidates
+    are read from the mapped full vectors for exact rescoring.
+
+    Reads and writes share one reentrant lock, so a query never sees a half-applied
+    add, delete, compaction or persist (the corpus persists from a worker thread).
+    """
+
+    stores_text: bool = False
+    is_embedding_query: bool = True
+    persist_dir: Optional[str] = None
+    quantization: str = NUMPY_STORE_QUANTIZATION
+    rescore_factor: Optional[int] = NUMPY_STORE_RESCORE_FACTOR
+
+    _segments: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _codes: List[Codes] = PrivateAttr(default_factory=list)
+    _segment_files: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _metadata: List[Dict[str, Any]] = PrivateAttr(default_factory=list)
+    _alive: np.ndarray = PrivateAttr(default_factory=lambda: np.zeros(0, dtype=bool))
+    _rows_by_id: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _rows_by_ref_doc: Dict[str, List[int]] = PrivateAttr(default_factory=dict)
+    _columns: Dict[str, np.ndarray] = PrivateAttr(default_factory=dict)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    # Rows file of the persist dir and how much of it is valid; None until written or after a compaction
+    _rows_file: Optional[str] = PrivateAttr(default=None)
+    _rows_bytes: int = PrivateAttr(default=0)
+    _persisted_rows: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._segments[0].shape[1] if self._segments else None
+
+    @property
+    def quantized(self) -> bool:
+        return self.quantization in ("int8", "binary")
+
+    @property
+    def resident_bytes(self) -> int:
+        """Vectors a query keeps resident plus codes and an estimate of the sidecar table.
+
+        Without quantization every query scans all segments, so mapped ones count in full;
+        with it only the in-memory tail does, the mapped vectors are read just for rescoring.
+        """
+        with self._lock:
+            in_memory = sum(
+                segment.nbytes for segment, filename in zip(self._segments, self._segment_files)
+                if filename is None or not self.quantized
+            )
+            codes = sum(matrix.nbytes + (0 if scales is None else scales.nbytes) for matrix, scales in self._codes)
+            return in_memory + codes + len(self._ids) * 200
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._alive.sum())
+
+    def _append_rows(self, ids: List[str], ref_doc_ids: List[Optional[str]], metadata: List[Dict[str, Any]]):
+        start = len(self._ids)
+        self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+        for offset, (node_id, ref_doc_id) in enumerate(zip(ids, ref_doc_ids)):
+            row = start + offset
+            previous = self._rows_by_id.get(node_id)
+            if previous is not None:
+                # Re-added node: the newest row wins
+                self._alive[previous] = False
+            self._rows_by_id[node_id] = row
+            if ref_doc_id:
+                self._rows_by_ref_doc.setdefault(ref_doc_id, []).append(row)
+        self._ids.extend(ids)
+        self._ref_doc_ids.extend(ref_doc_ids)
+        self._metadata.extend(metadata)
+        self._columns = {}
+
+    def _append_vectors(self, vectors: np.ndarray):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if self._segments and self._segment_files[-1] is None:
+            # Keep a single in-memory tail segment
+            self._segments[-1] = np.vstack([self._segments[-1], vectors])
+            if self.quantized:
+                (matrix, scales), (new_matrix, new_scales) = self._codes[-1], quantize(vectors, self.quantization)
+                self._codes[-1] = (
+                    np.vstack([matrix, new_matrix]), None if scales is None else np.concatenate([scales, new_scales])
+                )
+        else:
+            self._segments.append(vectors)
+            self._segment_files.append(None)
+            if self.quantized:
+                self._codes.append(quantize(vectors, self.quantization))
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        with self._lock:
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({self.dim})")
+            self._append_vectors(vectors)
+            self._append_rows(
+                [node.node_id for node in nodes],
+                [node.ref_doc_id for node in nodes],
+                [dict(node.metadata) for node in nodes]
+            )
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            for row in self._rows_by_ref_doc.pop(ref_doc_id, []):
+                self._alive[row] = False
+                if self._rows_by_id.get(self._ids[row]) == row:
+                    del self._rows_by_id[self._ids[row]]
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any
+    ) -> None:
+        with self._lock:
+            rows = set()
+            if node_ids:
+                rows.update(self._rows_by_id[node_id] for node_id in node_ids if node_id in self._rows_by_id)
+            if filters is not None:
+                rows.update(np.flatnonzero(self._alive & self._filter_mask(filters)).tolist())
+            for row in rows:
+                self._alive[row] = False
+                self._rows_by_id.pop(self._ids[row], None)
+                ref_doc_rows = self._rows_by_ref_doc.get(self._ref_doc_ids[row])
+                if ref_doc_rows and row in ref_doc_rows:
+                    ref_doc_rows.remove(row)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._segments, self._segment_files, self._codes = [], [], []
+            self._ids, self._ref_doc_ids, self._metadata = [], [], []
+            self._alive = np.zeros(0, dtype=bool)
+            self._rows_by_id, self._rows_by_ref_doc, self._columns = {}, {}, {}
+            self._rows_file = None
+
+    def _column(self, key: str) -> np.ndarray:
+        column = self._columns.get(key)
+        if column is None:
+            column = np.empty(len(self._metadata), dtype=object)
+            column[:] = [metadata.get(key) for metadata in self._metadata]
+            self._columns[key] = column
+        return column
+
+    def _filter_mask(self, filters: MetadataFilters) -> np.ndarray:
+        masks = []
+        for metadata_filter in filters.filters:
+            if isinstance(metadata_filter, MetadataFilters):
+                masks.append(self._filter_mask(metadata_filter))
+                continue
+            check = np.frompyfunc(_predicate(metadata_filter.operator, metadata_filter.value), 1, 1)
+            masks.append(check(self._column(metadata_filter.key)).astype(bool))
+
+        if not masks:
+            return np.ones(len(self._ids), dtype=bool)
+        if filters.condition == FilterCondition.OR:
+            return np.logical_or.reduce(masks)
+        return np.logical_and.reduce(masks)
+
+    def _candidate_mask(self, query: VectorStoreQuery) -> np.ndarray:
+        mask = self._alive.copy()
+        if query.filters is not None:
+            mask &= self._filter_mask(query.filters)
+        if query.node_ids:
+            allowed = np.zeros(len(self._ids), dtype=bool)
+            allowed[[self._rows_by_id[i] for i in query.node_ids if i in self._rows_by_id]] = True
+            mask &= allowed
+        if query.doc_ids:
+            allowed = np.zeros(len(self._ids), dtype=bool)
+            allowed[[row for doc_id in query.doc_ids for row in self._rows_by_ref_doc.get(doc_id, [])]] = True
+            mask &= allowed
+        return mask
+
+    def scores(self, query_embedding: List[float]) -> np.ndarray:
+        """Cosine similarity of the query against every row (deleted rows included)"""
+        q = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm > 0:
+            q = q / norm
+        with self._lock:
+            return np.concatenate([segment @ q for segment in self._segments])
+
+    def _vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Full vectors of the given rows, read from their segments"""
+        offsets = np.cumsum([0] + [len(segment) for segment in self._segments])
+        segment_of_row = np.searchsorted(offsets, rows, side="right") - 1
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        for segment in np.unique(segment_of_row):
+            selected = np.flatnonzero(segment_of_row == segment)
+            vectors[selected] = self._segments[segment][rows[selected] - offsets[segment]]
+        return vectors
+
+    def _search(self, queries: np.ndarray, mask: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """(rows, similarities) of the top k unmasked rows per normalized query"""
+        if not self.quantized:
+            scores = np.concatenate([segment @ queries.T for segment in self._segments])
+            scores[~mask] = -np.inf
+            top = np.argpartition(-scores, k - 1, axis=0)[:k]
+            results = []
+            for column in range(len(queries)):
+                rows = top[:, column]
+                rows = rows[np.argsort(-scores[rows, column])]
+                results.append((rows, scores[rows, column]))
+            return results
+
+        approximate = np.concatenate([approximate_scores(codes, queries) for codes in self._codes])
+        approximate[~mask] = -np.inf
+        factor = self.rescore_factor or RESCORE_FACTORS[self.quantization]
+        candidates = min(k * max(factor, 1), int(mask.sum()))
+        top = np.argpartition(-approximate, candidates - 1, axis=0)[:candidates]
+        results = []
+        for column in range(len(queries)):
+            rows = np.sort(top[:, column])
+            exact = self._vectors(rows) @ queries[column]
+            best = np.argsort(-exact)[:k]
+            results.append((rows[best], exact[best]))
+        return results
+
+    @staticmethod
+    def _normalized(query_embeddings: List[List[float]]) -> np.ndarray:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        return queries / np.where(norms > 0, norms, 1.0)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        with self._lock:
+            if query.query_embedding is None or not self._segments:
+                return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+            mask = self._candidate_mask(query)
+            k = min(query.similarity_top_k, int(mask.sum()))
+            if k <= 0:
+                return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+            ((rows, similarities),) = self._search(self._normalized([query.query_embedding]), mask, k)
+            return VectorStoreQueryResult(
+                similarities=[float(similarity) for similarity in similarities],
+                ids=[self._ids[row] for row in rows]
+            )
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        # Off the event loop: the scan, or waiting for a persist to release the lock, would block it
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+    def query_batch(
+        self,
+        query_embeddings: List[List[float]],
+        similarity_top_k: int,
+        filters: Optional[MetadataFilters] = None
+    ) -> List[VectorStoreQueryResult]:
+        """Top-k of several queries sharing one filter, scored with one matrix product per segment"""
+        empty = [VectorStoreQueryResult(nodes=[], similarities=[], ids=[]) for _ in query_embeddings]
+        with self._lock:
+            if not query_embeddings or not self._segments:
+                return empty
+
+            mask = self._candidate_mask(VectorStoreQuery(query_embedding=None, similarity_top_k=similarity_top_k, filters=filters))
+            k = min(similarity_top_k, int(mask.sum()))
+            if k <= 0:
+                return empty
+
+            return [
+                VectorStoreQueryResult(
+                    similarities=[float(similarity) for similarity in similarities],
+                    ids=[self._ids[row] for row in rows]
+                )
+                for rows, similarities in self._search(self._normalized(query_embeddings), mask, k)
+            ]
+
+    def _needs_compaction(self) -> bool:
+        dead = len(self._ids) - len(self)
+        return len(self._segments) > NUMPY_STORE_MAX_SEGMENTS or (
+            len(self._ids) > 0 and dead / len(self._ids) > NUMPY_STORE_COMPACT_DEAD_RATIO
+        )
+
+    def compact(self):
+        """Merge all segments into one matrix and drop deleted rows"""
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            segments = [np.ascontiguousarray(np.concatenate(self._segments)[rows])] if len(rows) else []
+            codes = [quantize(segments[0], self.quantization)] if segments and self.quantized else []
+            ids = [self._ids[row] for row in rows]
+            ref_doc_ids = [self._ref_doc_ids[row] for row in rows]
+            metadata = [self._metadata[row] for row in rows]
+            rows_by_ref_doc: Dict[str, List[int]] = {}
+            for row, ref_doc_id in enumerate(ref_doc_ids):
+                if ref_doc_id:
+                    rows_by_ref_doc.setdefault(ref_doc_id, []).append(row)
+
+            (
+                self._segments, self._segment_files, self._codes, self._ids, self._ref_doc_ids, self._metadata,
+                self._alive, self._rows_by_id, self._rows_by_ref_doc, self._columns, self._rows_file
+            ) = (
+                segments, [None] * len(segments), codes, ids, ref_doc_ids, metadata,
+                np.ones(len(ids), dtype=bool), {node_id: row for row, node_id in enumerate(ids)}, rows_by_ref_doc, {}, None
+            )
+
+    def _codes_filename(self, segment_file: str) -> str:
+        return f"{segment_file[:-len('.npy')]}.{self.quantization}.npz"
+
+    def _load_codes(self, vectors_dir: str):
+        """Codes of the persisted segments, computed (and written on the next persist) when missing"""
+        self._codes = []
+        for segment, filename in zip(self._segments, self._segment_files):
+            path = os.path.join(vectors_dir, self._codes_filename(filename))
+            if os.path.exists(path):
+                with np.load(path) as codes:
+                    self._codes.append((codes["matrix"], codes["scales"] if "scales" in codes else None))
+            else:
+                self._codes.append(quantize(np.asarray(segment), self.quantization))
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """Write new segments and the sidecar table next to the other stores of the persist dir"""
+        vectors_dir = os.path.join(os.path.dirname(persist_path), VECTORS_DIRNAME)
+        os.makedirs(vectors_dir, exist_ok=True)
+        with self._lock:
+            self._persist(vectors_dir)
+            self.persist_dir = os.path.dirname(persist_path)
+
+    def _persist(self, vectors_dir: str):
+        # Segments persisted under another directory are rewritten here
+        if self.persist_dir and os.path.abspath(self.persist_dir) != os.path.abspath(os.path.dirname(vectors_dir)):
+            segments = [np.concatenate(self._segments)] if self._segments else []
+            codes = [quantize(segment, self.quantization) for segment in segments] if self.quantized else []
+            self._segments, self._segment_files, self._codes, self._rows_file = segments, [None] * len(segments), codes, None
+
+        if self._needs_compaction():
+            self.compact()
+
+        segments, segment_files = [], []
+        for segment, filename in zip(self._segments, self._segment_files):
+            if filename is None:
+                filename = f"segment-{uuid.uuid4().hex}.npy"
+                np.save(os.path.join(vectors_dir, filename), np.ascontiguousarray(segment, dtype=np.float32))
+                segment = np.load(os.path.join(vectors_dir, filename), mmap_mode="r")
+            segments.append(segment)
+            segment_files.append(filename)
+        self._segments, self._segment_files = segments, segment_files
+        codes_files = []
+        if self.quantized:
+            for filename, (matrix, scales) in zip(self._segment_files, self._codes):
+                codes_files.append(self._codes_filename(filename))
+                path = os.path.join(vectors_dir, codes_files[-1])
+                if not os.path.exists(path):
+                    arrays = {"matrix": matrix} if scales is None else {"matrix": matrix, "scales": scales}
+                    with open(f"{path}.tmp", "wb") as f:
+                        np.savez(f, **arrays)
+                    os.replace(f"{path}.tmp", path)
+
+        self._write_rows(vectors_dir)
+        self._write_table(vectors_dir)
+        self._write_json(os.path.join(vectors_dir, MANIFEST_FNAME), {"segments": self._segment_files, "table": TABLE_FNAME})
+
+        for filename in os.listdir(vectors_dir):
+            stale_segment = filename.endswith(".npy") and filename not in self._segment_files
+            stale_codes = filename.endswith(".npz") and filename not in codes_files and filename != TABLE_FNAME
+            stale_rows = filename.startswith("rows-") and filename != self._rows_file
+            legacy_table = filename == "table.json"
+            if stale_segment or stale_codes or stale_rows or legacy_table:
+                os.remove(os.path.join(vectors_dir, filename))
+
+    def _write_rows(self, vectors_dir: str):
+        """Append the rows added since the last persist; a new rows file is started after a compaction"""
+        if self._rows_file is None:
+            self._rows_file, self._rows_bytes, self._persisted_rows = f"rows-{uuid.uuid4().hex}.bin", 0, 0
+        path = os.path.join(vectors_dir, self._rows_file)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            # Bytes past the table's length are left over from a persist that crashed before its table swap
+            f.seek(self._rows_bytes)
+            f.truncate()
+            for row in range(self._persisted_rows, len(self._ids)):
+                payload = json.dumps(
+                    [self._ids[row], self._ref_doc_ids[row], self._metadata[row]], ensure_ascii=False, default=str
+                ).encode("utf-8")
+                f.write(ROW_LENGTH.pack(len(payload)))
+                f.write(payload)
+            self._rows_bytes = f.tell()
+        self._persisted_rows = len(self._ids)
+
+    def _write_table(self, vectors_dir: str):
+        """Write table.npz through a temporary file so readers never see a partial table"""
+        tmp_path = os.path.join(vectors_dir, f"{TABLE_FNAME}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                rows_file=np.asarray(self._rows_file),
+                rows_bytes=np.int64(self._rows_bytes),
+                row_count=np.int64(len(self._ids)),
+                alive=np.packbits(self._alive)
+            )
+        os.replace(tmp_path, os.path.join(vectors_dir, TABLE_FNAME))
+
+    @staticmethod
+    def _read_rows(path: str, length: int) -> Tuple[List[str], List[Optional[str]], List[Dict[str, Any]]]:
+        with open(path, "rb") as f:
+            blob = f.read(length)
+        ids, ref_doc_ids, metadata = [], [], []
+        offset = 0
+        while offset < length:
+            (size,) = ROW_LENGTH.unpack_from(blob, offset)
+            offset += ROW_LENGTH.size
+            node_id, ref_doc_id, row_metadata = json.loads(blob[offset:offset + size].decode("utf-8"))
+            offset += size
+            ids.append(node_id)
+            ref_doc_ids.append(ref_doc_id)
+            metadata.append(row_metadata)
+        return ids, ref_doc_ids, metadata
+
+    @classmethod
+    def _read_table(cls, vectors_dir: str, name: str) -> Dict[str, Any]:
+        path = os.path.join(vectors_dir, name)
+        if not path.endswith(".npz"):
+            # Stores persisted before table.npz
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        with np.load(path) as table:
+            if "rows_file" not in table:
+                # table.npz holding every row, before the rows file
+                return {
+                    "ids": table["ids"].tolist(),
+                    "ref_doc_ids": [ref_doc_id or None for ref_doc_id in table["ref_doc_ids"].tolist()],
+                    "metadata": json.loads(table["metadata"].tobytes().decode("utf-8")),
+                    "alive": table["alive"]
+                }
+            rows_file, rows_bytes = str(table["rows_file"]), int(table["rows_bytes"])
+            alive = np.unpackbits(table["alive"], count=int(table["row_count"])).astype(bool)
+        ids, ref_doc_ids, metadata = cls._read_rows(os.path.join(vectors_dir, rows_file), rows_bytes)
+        return {
+            "ids": ids,
+            "ref_doc_ids": ref_doc_ids,
+            "metadata": metadata,
+            "alive": alive,
+            "rows_file": rows_file,
+            "rows_bytes": rows_bytes
+        }
+
+    @staticmethod
+    def _write_json(path: str, data: Any):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def exists(cls, persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, VECTORS_DIRNAME, MANIFEST_FNAME))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(persist_dir=persist_dir, **kwargs)
+        vectors_dir = os.path.join(persist_dir, VECTORS_DIRNAME)
+        with open(os.path.join(vectors_dir, MANIFEST_FNAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        table = cls._read_table(vectors_dir, manifest["table"])
+
+        store._segments = [np.load(os.path.join(vectors_dir, name), mmap_mode="r") for name in manifest["segments"]]
+        store._segment_files = list(manifest["segments"])
+        if store.quantized:
+            store._load_codes(vectors_dir)
+        store._append_rows(table["ids"], table["ref_doc_ids"], table["metadata"])
+        store._alive = np.asarray(table["alive"], dtype=bool)
+        if "rows_file" in table:
+            store._rows_file, store._rows_bytes, store._persisted_rows = table["rows_file"], table["rows_bytes"], len(store._ids)
+        for ref_doc_id, rows in list(store._rows_by_ref_doc.items()):
+            store._rows_by_ref_doc[ref_doc_id] = [row for row in rows if store._alive[row]]
+        store._rows_by_id = {node_id: row for node_id, row in store._rows_by_id.items() if store._alive[row]}
+        return store
+
+    @classmethod
+    def from_simple_vector_store(cls, simple_store: Any) -> "NumpyVectorStore":
+        """Migrate the embeddings of a llama_index SimpleVectorStore"""
+        store = cls()
+        data = simple_store.data
+        ids = list(data.embedding_dict.keys())
+        if ids:
+            store._append_vectors(np.asarray([data.embedding_dict[i] for i in ids], dtype=np.float32))
+            store._append_rows(
+                ids,
+                [data.text_id_to_ref_doc_id.get(i) for i in ids],
+                [dict((data.metadata_dict or {}).get(i) or {}) for i in ids]
+            )
+        return store
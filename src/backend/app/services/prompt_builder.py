@@ -0,0 +1,75 @@
+# services/prompt_builder.py
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.core.utils import get_tokenizer
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text))
+
+
+class PromptBuilder:
+    """Packs prompt facts into a token budget, keeping the most salient ones.
+
+    Facts are added to named sections with a salience score. build() keeps required
+    facts first, then the highest-salience ones that still fit, and renders them in
+    their original order under each section header.
+    """
+
+    def __init__(self, token_budget: int, tokenizer: Optional[Callable[[str], List[Any]]] = None):
+        self.token_budget = token_budget
+        self.tokenizer = tokenizer or get_tokenizer()
+        self._sections: Dict[str, Dict[str, Any]] = {}
+        self._order = 0
+        self.usage: Dict[str, Any] = {}
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text))
+
+    def add_section(self, name: str, header: str):
+        self._sections[name] = {"header": header, "facts": []}
+
+    def add_fact(self, section: str, text: str, salience: float = 0.0, required: bool = False):
+        self._sections[section]["facts"].append({
+            "text": text,
+            "salience": salience,
+            "required": required,
+            "order": self._order,
+            "tokens": self.count_tokens(text + "\n")
+        })
+        self._order += 1
+
+    def build(self) -> str:
+        header_tokens = {name: self.count_tokens(section["header"] + "\n") for name, section in self._sections.items()}
+        candidates = [
+            (name, fact)
+            for name, section in self._sections.items()
+            for fact in section["facts"]
+        ]
+        candidates.sort(key=lambda c: (not c[1]["required"], -c[1]["salience"], c[1]["order"]))
+
+        used = 0
+        selected = {name: [] for name in self._sections}
+        for name, fact in candidates:
+            cost = fact["tokens"] + (header_tokens[name] if not selected[name] else 0)
+            if used + cost > self.token_budget and not fact["required"]:
+                continue
+            selected[name].append(fact)
+            used += cost
+
+        lines = []
+        usage = {}
+        for name, section in self._sections.items():
+            facts = sorted(selected[name], key=lambda f: f["order"])
+            omitted = len(section["facts"]) - len(facts)
+            if facts:
+                lines.append(section["header"])
+                lines.extend(fact["text"] for fact in facts)
+            usage[name] = {
+                "tokens": (header_tokens[name] if facts else 0) + sum(f["tokens"] for f in facts),
+                "facts": len(facts),
+                "omitted": omitted
+            }
+
+        self.usage = {"budget": self.token_budget, "total": used, "sections": usage}
+        return "\n".join(lines)
@@ -0,0 +1,262 @@
+# services/query_cache.py
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "query_cache.db")
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", str(24 * 3600)))
+# Cosine similarity above which a cached answer is reused for a differently worded query; 0 disables the semantic level
+QUERY_CACHE_SIMILARITY = float(os.getenv("QUERY_CACHE_SIMILARITY", "0.95"))
+
+ALL_FILES = "*"
+
+
+def normalize_query(query: str) -> str:
+    text = " ".join(unicodedata.normalize("NFC", query).lower().split())
+    return text.rstrip("?!. ")
+
+
+class QueryCache:
+    """Two-level cache of RAG answers.
+
+    Level one is an exact match on (scope, normalized query, index version); level two
+    reuses the answer of the most similar cached query embedding in the same scope and
+    version when the cosine similarity clears the threshold. The scope is the queried
+    file_ids plus filters; the version of a scope changes whenever one of its documents
+    (or, for corpus-wide queries, any document) is re-added or deleted.
+
+    Lookups and stores do SQLite I/O; async callers use the a* methods, which run them
+    in a worker thread.
+    """
+
+    def __init__(self, path: str = QUERY_CACHE_PATH, ttl_seconds: int = QUERY_CACHE_TTL, similarity: float = QUERY_CACHE_SIMILARITY):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # scope version -> (keys, normalized embedding matrix, created_at) of its cached queries
+        self._embeddings: Dict[str, Tuple[List[str], np.ndarray, np.ndarray]] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_cache (
+                key TEXT PRIMARY KEY,
+                scope_version TEXT,
+                files TEXT,
+                response TEXT,
+                embedding BLOB,
+                created_at REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_query_cache_scope ON query_cache (scope_version)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_index_versions (
+                file_id TEXT PRIMARY KEY,
+                version INTEGER
+            )
+        """)
+        self._conn.commit()
+
+    def _version(self, file_id: str) -> int:
+        row = self._conn.execute("SELECT version FROM query_index_versions WHERE file_id = ?", (file_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _scope_version(self, file_ids: Optional[List[str]], filters: Optional[Dict[str, Any]]) -> str:
+        files = sorted(file_ids) if file_ids else [ALL_FILES]
+        payload = json.dumps(
+            {"files": files, "filters": filters, "versions": [self._version(file_id) for file_id in files]},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _files_column(file_ids: Optional[List[str]]) -> str:
+        return "|" + "|".join(sorted(file_ids) if file_ids else [ALL_FILES]) + "|"
+
+    @staticmethod
+    def _key(scope_version: str, query: str) -> str:
+        return hashlib.sha256(f"{scope_version}\0{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def _fresh(self, created_at: float) -> bool:
+        return not self.ttl_seconds or time.time() - created_at <= self.ttl_seconds
+
+    def get(self, file_ids: Optional[List[str]], filters: Optional[Dict[str, Any]], query: str) -> Optional[Dict[str, Any]]:
+        """Exact level: same scope, index version and normalized query"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM query_cache WHERE key = ?",
+                (self._key(self._scope_version(file_ids, filters), query),)
+            ).fetchone()
+            if row and self._fresh(row[1]):
+                self.exact_hits += 1
+                return {**json.loads(row[0]), "query": query, "cached": "exact"}
+            if self.similarity <= 0:
+                self.misses += 1
+            return None
+
+    async def aget(self, file_ids: Optional[List[str]], filters: Optional[Dict[str, Any]], query: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, file_ids, filters, query)
+
+    def get_similar(
+        self,
+        file_ids: Optional[List[str]],
+        filters: Optional[Dict[str, Any]],
+        query: str,
+        embedding: List[float]
+    ) -> Optional[Dict[str, Any]]:
+        """Semantic level: the closest cached query embedding of the same scope and index version"""
+        if self.similarity <= 0:
+            return None
+        with self._lock:
+            hit = self._most_similar(self._scope_version(file_ids, filters), embedding)
+            if hit is None:
+                self.misses += 1
+                return None
+            self.semantic_hits += 1
+            return {**json.loads(hit), "query": query, "cached": "semantic"}
+
+    async def aget_similar(
+        self,
+        file_ids: Optional[List[str]],
+        filters: Optional[Dict[str, Any]],
+        query: str,
+        embedding: List[float]
+    ) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get_similar, file_ids, filters, query, embedding)
+
+    def _most_similar(self, scope_version: str, embedding: List[float]) -> Optional[str]:
+        if scope_version not in self._embeddings:
+            rows = self._conn.execute(
+                "SELECT key, embedding, created_at FROM query_cache WHERE scope_version = ? AND embedding IS NOT NULL",
+                (scope_version,)
+            ).fetchall()
+            keys = [key for key, _, _ in rows]
+            matrix = np.asarray([np.frombuffer(blob, dtype=np.float32) for _, blob, _ in rows], dtype=np.float32)
+            self._embeddings[scope_version] = (keys, matrix, np.asarray([created_at for _, _, created_at in rows], dtype=np.float64))
+
+        keys, matrix, created = self._embeddings[scope_version]
+        if not keys:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        if matrix.shape[1] != query.shape[0]:
+            return None
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = matrix @ query
+        if self.ttl_seconds:
+            # Expired rows are swept from SQLite by put but stay in the matrix until it is reloaded
+            scores[created < time.time() - self.ttl_seconds] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+
+        row = self._conn.execute("SELECT response, created_at FROM query_cache WHERE key = ?", (keys[best],)).fetchone()
+        return row[0] if row and self._fresh(row[1]) else None
+
+    def put(
+        self,
+        file_ids: Optional[List[str]],
+        filters: Optional[Dict[str, Any]],
+        query: str,
+        response: Dict[str, Any],
+        embedding: Optional[List[float]] = None
+    ):
+        blob = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            blob = (vector / (np.linalg.norm(vector) or 1.0)).tobytes()
+        payload = json.dumps({k: v for k, v in response.items() if k != "cached"}, ensure_ascii=False, default=str)
+
+        now = time.time()
+        with self._lock:
+            scope_version = self._scope_version(file_ids, filters)
+            key = self._key(scope_version, query)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_cache (key, scope_version, files, response, embedding, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, scope_version, self._files_column(file_ids), payload, blob, now)
+            )
+            if self.ttl_seconds:
+                self._conn.execute("DELETE FROM query_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.commit()
+            self._add_embedding(scope_version, key, blob, now)
+
+    async def aput(
+        self,
+        file_ids: Optional[List[str]],
+        filters: Optional[Dict[str, Any]],
+        query: str,
+        response: Dict[str, Any],
+        embedding: Optional[List[float]] = None
+    ):
+        await asyncio.to_thread(self.put, file_ids, filters, query, response, embedding)
+
+    def _add_embedding(self, scope_version: str, key: str, blob: Optional[bytes], created_at: float):
+        """Keep a loaded scope matrix in step with a stored row; other scopes are unaffected"""
+        entry = self._embeddings.get(scope_version)
+        if entry is None:
+            return
+        keys, matrix, created = entry
+        if key in keys:
+            # Replaced row: drop the old vector
+            row = keys.index(key)
+            keys = keys[:row] + keys[row + 1:]
+            matrix, created = np.delete(matrix, row, axis=0), np.delete(created, row)
+        if blob is not None:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            if len(keys) and matrix.shape[1] != len(vector):
+                del self._embeddings[scope_version]
+                return
+            keys = keys + [key]
+            matrix = np.vstack([matrix.reshape(len(keys) - 1, len(vector)), vector])
+            created = np.append(created, created_at)
+        self._embeddings[scope_version] = (keys, matrix, created)
+
+    def invalidate(self, file_id: str):
+        """Bump the index version of a document (and of the corpus) and drop the answers that depended on it"""
+        with self._lock:
+            for key in (file_id, ALL_FILES):
+                self._conn.execute(
+                    "INSERT INTO query_index_versions (file_id, version) VALUES (?, 1) "
+                    "ON CONFLICT(file_id) DO UPDATE SET version = version + 1",
+                    (key,)
+                )
+            self._conn.execute(
+                "DELETE FROM query_cache WHERE files = ? OR files LIKE ?",
+                (self._files_column(None), f"%|{file_id}|%")
+            )
+            self._conn.commit()
+            self._embeddings.clear()
+
+    async def ainvalidate(self, file_id: str):
+        await asyncio.to_thread(self.invalidate, file_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "entries": entries,
+            "similarity_threshold": self.similarity,
+            "ttl_seconds": self.ttl_seconds,
+            "path": self.path
+        }
+
+
+query_cache = QueryCache()
@@ -0,0 +1,80 @@
+# services/query_engines.py
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.response_synthesizers import ResponseMode
+
+# Retrievers and query engines kept per index and configuration
+QUERY_ENGINE_CACHE_SIZE = int(os.getenv("QUERY_ENGINE_CACHE_SIZE", "64"))
+# Synthesis used when a query does not pick one: compact (one LLM call for most queries), refine or tree
+DEFAULT_RESPONSE_MODE = os.getenv("RAG_RESPONSE_MODE", "compact")
+
+RESPONSE_MODES = {
+    "compact": ResponseMode.COMPACT,
+    "refine": ResponseMode.REFINE,
+    "tree": ResponseMode.TREE_SUMMARIZE
+}
+
+
+def config_key(*parts: Any) -> str:
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+class QueryEngineCache:
+    """LRU of retrievers and query engines.
+
+    Entries remember the index they were built on: when an index is evicted and
+    reloaded (or the corpus index is rebuilt) the stale entry is replaced instead
+    of keeping the old index alive.
+    """
+
+    def __init__(self, max_size: int = QUERY_ENGINE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, index: Any, key: Hashable, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is index:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = build()
+        with self._lock:
+            self._entries[key] = (index, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def retriever(self, index: Any, key: str, build: Callable[[], Any]) -> Any:
+        return self.get(index, ("retriever", key), build)
+
+    def query_engine(self, retriever: Any, response_mode: Optional[str] = None) -> Any:
+        """Query engine over a (cached) retriever; the entry lives as long as that retriever is current"""
+        response_mode = response_mode or DEFAULT_RESPONSE_MODE
+        return self.get(
+            retriever,
+            ("query_engine", id(retriever), response_mode),
+            lambda: RetrieverQueryEngine.from_args(retriever, response_mode=RESPONSE_MODES[response_mode])
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+query_engine_cache = QueryEngineCache()
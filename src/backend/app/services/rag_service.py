@@ -1,19 +1,25 @@
+import asyncio
 import os
 import shutil
-from typing import Dict, Any
-from pathlib import Path
+import time
+from typing import Dict, Any, AsyncIterator, Tuple, List, Optional
 
-from llama_index.core import VectorStoreIndex, Settings, StorageContext, load_index_from_storage
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.readers.file import MarkdownReader
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI
-#from llama_index.embeddings.ollama import OllamaEmbedding
-#from llama_index.llms.ollama import Ollama
+from llama_index.core import Document, Settings
+from llama_index.core.schema import QueryBundle
 
-from dotenv import load_dotenv
-load_dotenv()
-api_key = os.getenv('OPENAI_API_KEY')
+from services.client_registry import registry
+from services.streaming import astream_retriever_answer, format_hits, format_sources
+from services.index_registry import index_registry
+from services.ingestion import achunk_documents, aingest_nodes
+from services.corpus_index import corpus_index, tag_documents
+from services.query_cache import query_cache, QUERY_CACHE_ENABLED
+from services.query_engines import query_engine_cache, config_key, DEFAULT_RESPONSE_MODE
+from services.prompt_builder import count_tokens
+from services.rate_limiter import limited_aembed, llm_rate_limiter, retry_with_backoff
+
+QUERY_TOP_K = 5
+# Answers of a batch query synthesized at the same time (LLM calls are also paced by the rate limiter)
+QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", "8"))
 
 
 class RAGService:
@@ -22,102 +28,404 @@ class RAGService:
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
         
-        self.index_dir = "index"
+        self.index_dir = index_registry.index_dir
         if not os.path.exists(self.index_dir):
             os.makedirs(self.index_dir)
         
+        registry.configure_settings()
+        
+        self.indices = index_registry
+    
+    async def aadd_document(self, file_id: str, text: str, report_id: Optional[int] = None):
+        await self.aingest_document(file_id, text, report_id)
+        return f"Document {file_id} is added"
+    
+    async def aingest_document(self, file_id: str, text: str, report_id: Optional[int] = None) -> Dict[str, Any]:
+        """Async upsert into the corpus index: batched concurrent embedding of new chunks, inserted as their batch is embedded"""
+        file_path = os.path.join(self.data_dir, f"{file_id}.md")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        
+        if not text.strip():
+            raise ValueError("No documents were loaded from the markdown file")
+        
+        # One document per file: the node parser follows its headings and can merge small sections
+        documents = [Document(text=text, id_=file_id)]
+        
+        tag_documents(documents, file_id, report_id)
+        
+        await corpus_index.aget_index()
+        start = time.perf_counter()
+        nodes = await achunk_documents(documents)
+        # Concurrent re-adds of the same file would each diff against the stored nodes and insert duplicates
+        async with corpus_index.file_lock(file_id):
+            # Re-adding a file only embeds and inserts the chunks that changed
+            new_nodes, diff = await corpus_index.adiff_file(file_id, nodes)
+            stats = await aingest_nodes(new_nodes, corpus_index.insert_callback(file_id), start=start)
+            stats.update(diff)
+            await corpus_index.apersist()
+            await query_cache.ainvalidate(file_id)
+        
+        return stats
+    
+    def load_index(self, file_id: str):
         try:
-            #Settings.embed_model = OllamaEmbedding(model_name="nomic-embed-text:latest")
-            #Settings.llm = Ollama(model="gemma3:12b", request_timeout=600.0)
-            Settings.embed_model = OpenAIEmbedding(api_key=api_key)
-            Settings.llm = OpenAI(api_key=api_key)
-            Settings.text_splitter = SentenceSplitter(chunk_size=512, chunk_overlap=10)
+            return self.indices.get(file_id)
         except Exception as e:
-            raise
+            return None
+    
+    async def aload_index(self, file_id: str):
+        try:
+            return await self.indices.aget(file_id)
+        except Exception as e:
+            return None
+    
+    def _file_scope(self, file_id: Optional[str], file_ids: Optional[List[str]]) -> Optional[List[str]]:
+        scope = list(file_ids or [])
+        if file_id and file_id not in scope:
+            scope.append(file_id)
+        return scope or None
+    
+    def _query_retriever(self, scope: Optional[List[str]], filters: Optional[Dict[str, Any]], legacy_index):
+        """Cached retriever for a query, or None when nothing matches the scope"""
+        if legacy_index is not None:
+            # Indexed per file before the corpus index existed: no metadata to filter on
+            return query_engine_cache.retriever(
+                legacy_index, config_key("legacy", QUERY_TOP_K),
+                lambda: legacy_index.as_retriever(similarity_top_k=QUERY_TOP_K)
+            )
+        
+        if scope and not any(corpus_index.contains(file_id) for file_id in scope):
+            return None
+        if not corpus_index.file_ids:
+            return None
         
-        self.indices = {}
+        return query_engine_cache.retriever(
+            corpus_index.get_index(), config_key("corpus", QUERY_TOP_K, sorted(scope or []), filters),
+            lambda: corpus_index.as_retriever(**corpus_index.retriever_kwargs(QUERY_TOP_K, scope, filters))
+        )
     
-    def add_document(self, file_id: str, text: str):
+    def _cache_filters(self, filters: Optional[Dict[str, Any]], response_mode: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Answers synthesized with another response mode are cached apart"""
+        response_mode = response_mode or DEFAULT_RESPONSE_MODE
+        if response_mode == "compact":
+            return filters
+        return {**(filters or {}), "_response_mode": response_mode}
+    
+    def _legacy_file(self, scope: Optional[List[str]]) -> Optional[str]:
+        if scope and len(scope) == 1 and not corpus_index.contains(scope[0]):
+            return scope[0]
+        return None
+    
+    def query(
+        self,
+        file_id: Optional[str],
+        query: str,
+        file_ids: Optional[List[str]] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: str = "answer",
+        response_mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """mode="retrieve" returns the top nodes with highlights and makes no LLM call"""
         try:
-            file_path = os.path.join(self.data_dir, f"{file_id}.md")
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(text)
+            scope = self._file_scope(file_id, file_ids)
+            cache_filters = self._cache_filters(filters, response_mode)
+            if mode != "retrieve":
+                cached = self._cached_response(scope, cache_filters, query)
+                if cached:
+                    return cached
             
-            documents = MarkdownReader().load_data(Path(file_path))
+            legacy_file = self._legacy_file(scope)
+            retriever = self._query_retriever(
+                scope, filters, self.load_index(legacy_file) if legacy_file else None
+            )
+            if not retriever:
+                return self._missing_index_response(query)
             
-            if not documents:
-                raise ValueError("No documents were loaded from the markdown file")
+            if mode == "retrieve":
+                return self._format_hits_response(query, retriever.retrieve(query))
             
-            storage_context = StorageContext.from_defaults()
-            index = VectorStoreIndex.from_documents(
-                documents, 
-                storage_context=storage_context
-            )
+            embedding = Settings.embed_model.get_query_embedding(query) if self._semantic_cache else None
+            cached = self._similar_response(scope, cache_filters, query, embedding)
+            if cached:
+                return cached
             
-            index_path = os.path.join(self.index_dir, file_id)
-            index.storage_context.persist(persist_dir=index_path)
+            query_engine = query_engine_cache.query_engine(retriever, response_mode)
             
-            self.indices[file_id] = index
+            response = query_engine.query(QueryBundle(query, embedding=embedding))
             
-            return f"Document {file_id} is added"
+            return self._store_response(scope, cache_filters, self._format_query_response(query, response), embedding)
         except Exception as e:
-            raise
+            return self._query_error_response(query, e)
     
-    def load_index(self, file_id: str):
+    async def aquery(
+        self,
+        file_id: Optional[str],
+        query: str,
+        file_ids: Optional[List[str]] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: str = "answer",
+        response_mode: Optional[str] = None
+    ) -> Dict[str, Any]:
         try:
-            if file_id in self.indices:
-                return self.indices[file_id]
+            scope = self._file_scope(file_id, file_ids)
+            cache_filters = self._cache_filters(filters, response_mode)
+            if mode != "retrieve":
+                cached = await self._acached_response(scope, cache_filters, query)
+                if cached:
+                    return cached
             
-            index_path = os.path.join(self.index_dir, file_id)
-            if not os.path.exists(index_path):
-                return None
+            # Loaded off the event loop before _legacy_file checks the corpus
+            await corpus_index.aget_index()
+            legacy_file = self._legacy_file(scope)
+            retriever = self._query_retriever(
+                scope, filters, await self.aload_index(legacy_file) if legacy_file else None
+            )
+            if not retriever:
+                return self._missing_index_response(query)
             
-            storage_context = StorageContext.from_defaults(persist_dir=index_path)
+            if mode == "retrieve":
+                return self._format_hits_response(query, await retriever.aretrieve(query))
             
-            index = load_index_from_storage(storage_context)
+            embedding = await Settings.embed_model.aget_query_embedding(query) if self._semantic_cache else None
+            cached = await self._asimilar_response(scope, cache_filters, query, embedding)
+            if cached:
+                return cached
             
-            self.indices[file_id] = index
-            return index
-        
+            query_engine = query_engine_cache.query_engine(retriever, response_mode)
+            
+            response = await query_engine.aquery(QueryBundle(query, embedding=embedding))
+            
+            return await self._astore_response(scope, cache_filters, self._format_query_response(query, response), embedding)
         except Exception as e:
+            return self._query_error_response(query, e)
+    
+    async def astream_query(
+        self,
+        file_id: Optional[str],
+        query: str,
+        file_ids: Optional[List[str]] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: str = "answer"
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Streams ("sources", ...), ("token", delta) and finally ("answer", text) events.
+        
+        mode="retrieve" streams the highlighted hits as sources and an empty answer.
+        """
+        scope = self._file_scope(file_id, file_ids)
+        # Streamed answers are synthesized in the default response mode
+        cache_filters = self._cache_filters(filters, None)
+        cached = await self._acached_response(scope, cache_filters, query) if mode != "retrieve" else None
+        if cached is None:
+            # Loaded off the event loop before _legacy_file checks the corpus
+            await corpus_index.aget_index()
+            legacy_file = self._legacy_file(scope)
+            retriever = self._query_retriever(
+                scope, filters, await self.aload_index(legacy_file) if legacy_file else None
+            )
+            if not retriever:
+                yield "answer", self._missing_index_response(query)["answer"]
+                return
+            
+            if mode == "retrieve":
+                yield "sources", format_hits(await retriever.aretrieve(query), query)
+                yield "answer", ""
+                return
+            
+            embedding = await Settings.embed_model.aget_query_embedding(query) if self._semantic_cache else None
+            cached = await self._asimilar_response(scope, cache_filters, query, embedding)
+        
+        if cached:
+            yield "sources", cached["sources"]
+            yield "token", cached["answer"]
+            yield "answer", cached["answer"]
+            return
+        
+        sources = []
+        async for event, data in astream_retriever_answer(retriever, query, embedding):
+            if event == "sources":
+                sources = data
+            elif event == "answer":
+                await self._astore_response(scope, cache_filters, {"query": query, "answer": data, "sources": sources}, embedding)
+            yield event, data
+    
+    async def abatch_query(
+        self,
+        file_id: Optional[str],
+        queries: List[str],
+        file_ids: Optional[List[str]] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        response_mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Answer several questions over the same scope.
+        
+        Questions missing from the query cache are embedded in one batch request and retrieved
+        together (one matrix top-k over the corpus vectors, shared chunks loaded once); their
+        answers are synthesized concurrently, paced by the shared LLM rate limiter.
+        """
+        start = time.perf_counter()
+        scope = self._file_scope(file_id, file_ids)
+        cache_filters = self._cache_filters(filters, response_mode)
+        answers: List[Optional[Dict[str, Any]]] = list(await asyncio.gather(
+            *(self._acached_response(scope, cache_filters, query) for query in queries)
+        ))
+        stats = {"questions": len(queries), "cached": 0, "retrieved_chunks": 0, "unique_chunks": 0}
+        
+        pending = [i for i, answer in enumerate(answers) if answer is None]
+        retriever = None
+        if pending:
+            # Loaded off the event loop before _legacy_file checks the corpus
+            await corpus_index.aget_index()
+            legacy_file = self._legacy_file(scope)
+            retriever = self._query_retriever(
+                scope, filters, await self.aload_index(legacy_file) if legacy_file else None
+            )
+            if not retriever:
+                for i in pending:
+                    answers[i] = self._missing_index_response(queries[i])
+                pending = []
+        
+        if pending:
+            # One embedding request for every question (query and text embeddings share the model)
+            texts = [queries[i] for i in pending]
+            embeddings = await limited_aembed(Settings.embed_model, texts, sum(count_tokens(text) for text in texts))
+            bundles = {}
+            for i, embedding in zip(pending, embeddings):
+                answers[i] = await self._asimilar_response(scope, cache_filters, queries[i], embedding) if self._semantic_cache else None
+                if answers[i] is None:
+                    bundles[i] = QueryBundle(queries[i], embedding=embedding)
+            
+            if hasattr(retriever, "retrieve_batch"):
+                retrieved = await asyncio.to_thread(retriever.retrieve_batch, list(bundles.values()))
+            else:
+                retrieved = await asyncio.gather(*(retriever.aretrieve(bundle) for bundle in bundles.values()))
+            stats["retrieved_chunks"] = sum(len(nodes) for nodes in retrieved)
+            stats["unique_chunks"] = len({node.node.node_id for nodes in retrieved for node in nodes})
+            
+            query_engine = query_engine_cache.query_engine(retriever, response_mode)
+            semaphore = asyncio.Semaphore(QUERY_BATCH_CONCURRENCY)
+            
+            async def answer(i: int, bundle: QueryBundle, nodes):
+                async def call():
+                    context_tokens = sum(count_tokens(node.node.get_content()) for node in nodes)
+                    await llm_rate_limiter.acquire(context_tokens + count_tokens(bundle.query_str))
+                    return await query_engine.asynthesize(bundle, nodes)
+                
+                try:
+                    async with semaphore:
+                        response = await retry_with_backoff(call)
+                    answers[i] = await self._astore_response(
+                        scope, cache_filters, self._format_query_response(bundle.query_str, response),
+                        bundle.embedding if self._semantic_cache else None
+                    )
+                except Exception as e:
+                    answers[i] = self._query_error_response(bundle.query_str, e)
+            
+            await asyncio.gather(*(
+                answer(i, bundle, nodes) for (i, bundle), nodes in zip(bundles.items(), retrieved)
+            ))
+        
+        stats["cached"] = sum(1 for answer in answers if answer.get("cached"))
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        print(f"DEBUG: Batch query answered {stats['questions']} questions ({stats['cached']} cached, "
+              f"{stats['unique_chunks']} unique chunks) in {stats['seconds']}s")
+        return {"answers": answers, "stats": stats}
+    
+    @property
+    def _semantic_cache(self) -> bool:
+        return QUERY_CACHE_ENABLED and query_cache.similarity > 0
+    
+    def _cached_response(self, scope: Optional[List[str]], filters: Optional[Dict[str, Any]], query: str) -> Optional[Dict[str, Any]]:
+        if not QUERY_CACHE_ENABLED:
             return None
+        return query_cache.get(scope, filters, query)
     
-    def query(self, file_id: str, query: str) -> Dict[str, Any]:
-        try:
-            index = self.load_index(file_id)
-            if not index:
-                return {
-                    "query": query,
-                    "answer": "Could not find Index. Upload the file first.",
-                    "sources": []
-                }
-            
-            query_engine = index.as_query_engine(similarity_top_k=5)
-            
-            response = query_engine.query(query)
-            
-            sources = []
-            for node in response.source_nodes:
-                sources.append({
-                    "text": node.node.text[:200] + "..." if len(node.node.text) > 200 else node.node.text,
-                    "score": node.score
-                })
-            
-            
-            return {
-                "query": query,
-                "answer": str(response),
-                "sources": sources
-            }
-        except Exception as e:
-            return {
-                "query": query,
-                "answer": f"Error while querying: {str(e)}",
-                "sources": []
-            }
+    async def _acached_response(self, scope: Optional[List[str]], filters: Optional[Dict[str, Any]], query: str) -> Optional[Dict[str, Any]]:
+        if not QUERY_CACHE_ENABLED:
+            return None
+        return await query_cache.aget(scope, filters, query)
+    
+    def _similar_response(
+        self,
+        scope: Optional[List[str]],
+        filters: Optional[Dict[str, Any]],
+        query: str,
+        embedding: Optional[List[float]]
+    ) -> Optional[Dict[str, Any]]:
+        if embedding is None:
+            return None
+        return query_cache.get_similar(scope, filters, query, embedding)
+    
+    async def _asimilar_response(
+        self,
+        scope: Optional[List[str]],
+        filters: Optional[Dict[str, Any]],
+        query: str,
+        embedding: Optional[List[float]]
+    ) -> Optional[Dict[str, Any]]:
+        if embedding is None:
+            return None
+        return await query_cache.aget_similar(scope, filters, query, embedding)
+    
+    def _store_response(
+        self,
+        scope: Optional[List[str]],
+        filters: Optional[Dict[str, Any]],
+        response: Dict[str, Any],
+        embedding: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        if QUERY_CACHE_ENABLED:
+            query_cache.put(scope, filters, response["query"], response, embedding)
+        return response
     
-    def delete_document(self, file_id: str):
+    async def _astore_response(
+        self,
+        scope: Optional[List[str]],
+        filters: Optional[Dict[str, Any]],
+        response: Dict[str, Any],
+        embedding: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        if QUERY_CACHE_ENABLED:
+            await query_cache.aput(scope, filters, response["query"], response, embedding)
+        return response
+    
+    def _format_query_response(self, query: str, response) -> Dict[str, Any]:
+        return {
+            "query": query,
+            "answer": str(response),
+            "sources": format_sources(response.source_nodes)
+        }
+    
+    def _format_hits_response(self, query: str, nodes) -> Dict[str, Any]:
+        return {
+            "query": query,
+            "answer": "",
+            "sources": format_hits(nodes, query)
+        }
+    
+    def _missing_index_response(self, query: str) -> Dict[str, Any]:
+        return {
+            "query": query,
+            "answer": "Could not find Index. Upload the file first.",
+            "sources": []
+        }
+    
+    def _query_error_response(self, query: str, error: Exception) -> Dict[str, Any]:
+        return {
+            "query": query,
+            "answer": f"Error while querying: {str(error)}",
+            "sources": []
+        }
+    
+    async def adelete_document(self, file_id: str):
         try:
+            await corpus_index.aget_index()
+            async with corpus_index.file_lock(file_id):
+                if corpus_index.contains(file_id):
+                    await corpus_index.adelete_file(file_id)
+                    await corpus_index.apersist()
+                await query_cache.ainvalidate(file_id)
+            
             file_path = os.path.join(self.data_dir, f"{file_id}.md")
             if os.path.exists(file_path):
                 os.remove(file_path)
@@ -126,8 +434,7 @@ class RAGService:
             if os.path.exists(index_path):
                 shutil.rmtree(index_path)
             
-            if file_id in self.indices:
-                del self.indices[file_id]
+            self.indices.remove(file_id)
             
             return f"Document {file_id} is deleted"
         except Exception as e:
@@ -135,12 +442,14 @@ class RAGService:
 
 rag_service = RAGService()
 
-def add_document_to_rag(file_id: str, text: str):
-    return rag_service.add_document(file_id, text)
-
 def query_rag(file_id: str, query: str):
     return rag_service.query(file_id, query)
 
-def delete_from_rag(file_id: str):
+async def aadd_document_to_rag(file_id: str, text: str, report_id: Optional[int] = None):
+    return await rag_service.aadd_document(file_id, text, report_id)
+
+async def aquery_rag(file_id: str, query: str):
+    return await rag_service.aquery(file_id, query)
 
-    return rag_service.delete_document(file_id)
+async def adelete_from_rag(file_id: str):
+    return await rag_service.adelete_document(file_id)
@@ -0,0 +1,116 @@
+# services/rate_limiter.py
+import asyncio
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, List
+
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30.0"))
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = ("RateLimit", "Timeout", "APIConnection", "InternalServer", "ServiceUnavailable")
+
+
+class AsyncTokenBucket:
+    """Async limiter for requests/min and tokens/min, shared by all coroutines of the process"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.request_capacity = float(requests_per_minute)
+        self.token_capacity = float(tokens_per_minute)
+        self._requests = self.request_capacity
+        self._tokens = self.token_capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.request_capacity, self._requests + elapsed * self.request_capacity / 60.0)
+        self._tokens = min(self.token_capacity, self._tokens + elapsed * self.token_capacity / 60.0)
+
+    async def acquire(self, tokens: int = 1):
+        tokens = min(float(tokens), self.token_capacity)
+        while True:
+            async with self._lock:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60.0 / self.request_capacity,
+                    (tokens - self._tokens) * 60.0 / self.token_capacity,
+                    0.01
+                )
+            await asyncio.sleep(wait)
+
+
+def is_retryable(error: Exception) -> bool:
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status_code in RETRYABLE_STATUS_CODES:
+        return True
+    return any(name in type(error).__name__ for name in RETRYABLE_ERROR_NAMES)
+
+
+def is_bad_request(error: Exception) -> bool:
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status_code == 400 or "BadRequest" in type(error).__name__
+
+
+async def retry_with_backoff(
+    call: Callable[[], Awaitable[Any]],
+    max_retries: int = LLM_MAX_RETRIES,
+    base_delay: float = LLM_RETRY_BASE_DELAY,
+    max_delay: float = LLM_RETRY_MAX_DELAY
+) -> Any:
+    """Retry transient LLM failures with exponential backoff and full jitter"""
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"DEBUG: Retrying LLM call in {delay:.2f}s after {type(e).__name__} (attempt {attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+llm_rate_limiter = AsyncTokenBucket(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+
+
+async def limited_acomplete(llm, prompt: str, estimated_tokens: int, **kwargs: Any):
+    """acomplete through the shared rate limiter, retrying rate limits and transient errors"""
+    is_cached = getattr(llm, "is_cached", None)
+    if is_cached is not None and is_cached(prompt, **kwargs):
+        return await llm.acomplete(prompt, **kwargs)
+
+    async def call():
+        await llm_rate_limiter.acquire(estimated_tokens)
+        return await llm.acomplete(prompt, **kwargs)
+
+    return await retry_with_backoff(call)
+
+
+embedding_rate_limiter = AsyncTokenBucket(EMBEDDING_REQUESTS_PER_MINUTE, EMBEDDING_TOKENS_PER_MINUTE)
+
+
+async def limited_aembed(embed_model, texts: List[str], estimated_tokens: int) -> List[List[float]]:
+    """Batch text embedding through the embedding rate limiter, retrying rate limits and transient errors"""
+    is_cached = getattr(embed_model, "is_cached", None)
+    if is_cached is not None and is_cached(texts):
+        return await embed_model.aget_text_embedding_batch(texts)
+
+    async def call():
+        await embedding_rate_limiter.acquire(estimated_tokens)
+        return await embed_model.aget_text_embedding_batch(texts)
+
+    return await retry_with_backoff(call)
@@ -0,0 +1,91 @@
+# services/streaming.py
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from llama_index.core import Settings
+from llama_index.core.prompts.default_prompts import DEFAULT_TEXT_QA_PROMPT
+from llama_index.core.schema import QueryBundle
+
+from services.bm25_index import TOKEN, TOKEN_PART, tokenize
+
+
+def format_sources(source_nodes) -> List[Dict[str, Any]]:
+    sources = []
+    for node in source_nodes:
+        source = {
+            "text": node.node.text[:200] + "..." if len(node.node.text) > 200 else node.node.text,
+            "score": node.score
+        }
+        if node.node.metadata.get("file_id"):
+            source["file_id"] = node.node.metadata["file_id"]
+            source["section"] = node.node.metadata.get("section", "")
+        sources.append(source)
+    return sources
+
+
+def highlight_spans(text: str, query: str) -> List[List[int]]:
+    """[start, end) character offsets of the query terms in text, identifier parts included"""
+    terms = {term for term in tokenize(query) if len(term) > 1}
+    spans = []
+    for match in TOKEN.finditer(text):
+        if match.group(0).lower() in terms:
+            spans.append([match.start(), match.end()])
+            continue
+        for part in TOKEN_PART.finditer(match.group(0)):
+            if part.group(0).lower() in terms:
+                spans.append([match.start() + part.start(), match.start() + part.end()])
+    return spans
+
+
+def format_hits(nodes, query: str) -> List[Dict[str, Any]]:
+    """Retrieval-only results: whole node texts with scores and highlighted query terms"""
+    hits = []
+    for node in nodes:
+        text = node.node.get_content()
+        hits.append({
+            "node_id": node.node.node_id,
+            "text": text,
+            "score": node.score,
+            "file_id": node.node.metadata.get("file_id"),
+            "section": node.node.metadata.get("section", ""),
+            "heading_path": node.node.metadata.get("heading_path", ""),
+            "highlights": highlight_spans(text, query)
+        })
+    return hits
+
+
+async def astream_index_answer(
+    index,
+    query: str,
+    similarity_top_k: int = 5,
+    filters: Optional[Any] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Retrieve context from an index and stream the synthesized answer token by token.
+
+    Yields ("sources", [...]) once retrieval finishes, then ("token", delta) per chunk and
+    finally ("answer", full_text).
+    """
+    retriever = index.as_retriever(similarity_top_k=similarity_top_k, filters=filters)
+    async for event in astream_retriever_answer(retriever, query):
+        yield event
+
+
+async def astream_retriever_answer(
+    retriever,
+    query: str,
+    query_embedding: Optional[List[float]] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Same events as astream_index_answer, with context from any retriever"""
+    nodes = await retriever.aretrieve(QueryBundle(query, embedding=query_embedding))
+    yield "sources", format_sources(nodes)
+
+    context_str = "\n\n".join(node.node.get_content() for node in nodes)
+    prompt = DEFAULT_TEXT_QA_PROMPT.format(context_str=context_str, query_str=query)
+
+    answer = ""
+    async for chunk in await Settings.llm.astream_complete(prompt):
+        delta = chunk.delta or ""
+        answer += delta
+        if delta:
+            yield "token", delta
+
+    yield "answer", answer
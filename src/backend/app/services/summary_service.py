@@ -1,35 +1,139 @@
 # services/summary_service.py
+import asyncio
 import os
-import traceback
-from typing import Optional
-from llama_index.core import StorageContext, load_index_from_storage
-#from llama_index.llms.ollama import Ollama
-from dotenv import load_dotenv
-from llama_index.llms.openai import OpenAI
-load_dotenv()
-api_key = os.getenv('OPENAI_API_KEY')
+from typing import Optional, AsyncIterator, Tuple, Any, Dict, List
+from sqlalchemy.orm import Session
+from core.database import SessionLocal
+from crud.crud import get_stored_summary, save_stored_summary
+from models.schemas import StoredSummaryCreate
+from services.client_registry import registry
+from services.index_registry import index_registry
+from services.corpus_index import corpus_index
+from services.streaming import astream_index_answer
+from services.map_reduce_summary import map_reduce_summarizer
+
+SUMMARY_TOP_K = 2
+# Short, medium and long summaries precomputed at ingest; requests are served from the largest bucket <= max_length
+SUMMARY_LENGTH_BUCKETS = sorted(int(b) for b in os.getenv("SUMMARY_LENGTH_BUCKETS", "100,250,500").split(","))
+
+
+def length_bucket(max_length: Optional[int]) -> int:
+    max_length = max_length or SUMMARY_LENGTH_BUCKETS[-1]
+    fitting = [bucket for bucket in SUMMARY_LENGTH_BUCKETS if bucket <= max_length]
+    return fitting[-1] if fitting else max_length
 
 class SummaryService:
-    def __init__(self):
-        #self.llm = Ollama(model="gemma3:12b", request_timeout=600.0)
-        self.llm = OpenAI(api_key=api_key)
+    @property
+    def llm(self):
+        return registry.get_llm()
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.llm.metadata, "model_name", "") or type(self.llm).__name__
+
+    async def _aload_index(self, file_id: str):
+        index = await index_registry.aget(file_id)
+        
+        if index is None:
+            raise ValueError(f"Index for file_id {file_id} not found")
+        
+        return index
 
-    def summarize_document(self, file_id: str, max_length: Optional[int] = 500) -> str:
+    def _load_markdown(self, file_id: str) -> Optional[str]:
+        markdown_path = os.path.join("data", f"{file_id}.md")
+        
+        if not os.path.exists(markdown_path):
+            return None
+        
+        with open(markdown_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def _summary_prompt(self, max_length: Optional[int]) -> str:
+        return f"Please provide a concise summary of this document in less than {max_length} words. Focus on the main points and key information."
+
+    async def asummarize_document(self, file_id: str, max_length: Optional[int] = 500) -> str:
+        """Map-reduce summary of the whole markdown; retrieval over the index when only the index exists"""
         try:
-            index_path = f"index/{file_id}"
-            
-            if not os.path.exists(index_path):
-                raise ValueError(f"Index for file_id {file_id} not found")
-            
-            storage_context = StorageContext.from_defaults(persist_dir=index_path)
-            index = load_index_from_storage(storage_context)
-            
-            query_engine = index.as_query_engine()
+            text = self._load_markdown(file_id)
+            if text is not None:
+                return await map_reduce_summarizer.asummarize(text, max_length)
             
-            prompt = f"Please provide a concise summary of this document in less than {max_length} words. Focus on the main points and key information."
-            response = query_engine.query(prompt)           
+            await corpus_index.aget_index()
+            if corpus_index.contains(file_id):
+                query_engine = corpus_index.get_index().as_query_engine(
+                    **corpus_index.retriever_kwargs(SUMMARY_TOP_K, [file_id])
+                )
+            else:
+                index = await self._aload_index(file_id)
+                query_engine = index.as_query_engine(similarity_top_k=SUMMARY_TOP_K)
+            response = await query_engine.aquery(self._summary_prompt(max_length))
             return str(response)
         
         except Exception as e:
 
             raise Exception(f"Error generating summary: {str(e)}")
+
+    async def astream_summary(self, file_id: str, max_length: Optional[int] = 500) -> AsyncIterator[Tuple[str, Any]]:
+        """Streams ("token", delta) and finally ("answer", summary) events, plus ("sources", ...) for index summaries"""
+        text = self._load_markdown(file_id)
+        if text is not None:
+            async for event in map_reduce_summarizer.astream_summarize(text, max_length):
+                yield event
+            return
+        
+        await corpus_index.aget_index()
+        if corpus_index.contains(file_id):
+            index, retriever_kwargs = corpus_index.get_index(), corpus_index.retriever_kwargs(SUMMARY_TOP_K, [file_id])
+        else:
+            index, retriever_kwargs = await self._aload_index(file_id), {"similarity_top_k": SUMMARY_TOP_K}
+        async for event in astream_index_answer(index, self._summary_prompt(max_length), **retriever_kwargs):
+            yield event
+
+    def stored_summary(self, db: Session, file_id: str, max_length: Optional[int]) -> Optional[str]:
+        stored = get_stored_summary(db, file_id, length_bucket(max_length), self.model_name)
+        return stored.summary_text if stored is not None else None
+
+    def store_summary(self, db: Session, file_id: str, max_length: Optional[int], summary_text: str):
+        save_stored_summary(db, StoredSummaryCreate(
+            file_id=file_id,
+            length_bucket=length_bucket(max_length),
+            model=self.model_name,
+            summary_text=summary_text
+        ))
+
+    async def aget_summary(self, db: Session, file_id: str, max_length: Optional[int] = 500) -> str:
+        """Stored summary of the length bucket, generated and stored on a miss"""
+        summary_text = self.stored_summary(db, file_id, max_length)
+        if summary_text is not None:
+            return summary_text
+        
+        summary_text = await self.asummarize_document(file_id, length_bucket(max_length))
+        self.store_summary(db, file_id, max_length, summary_text)
+        return summary_text
+
+    async def asummarize_lengths(self, file_id: str, lengths: List[int]) -> Dict[int, str]:
+        text = self._load_markdown(file_id)
+        if text is not None:
+            return await map_reduce_summarizer.asummarize_many(text, lengths)
+        
+        summaries = await asyncio.gather(*(self.asummarize_document(file_id, length) for length in lengths))
+        return dict(zip(lengths, summaries))
+
+    async def aprecompute_summaries(self, file_id: str):
+        """Ingest background batch: every missing length bucket from one map/reduce pass"""
+        db = SessionLocal()
+        try:
+            missing = [bucket for bucket in SUMMARY_LENGTH_BUCKETS if self.stored_summary(db, file_id, bucket) is None]
+            if not missing:
+                return
+            
+            summaries = await self.asummarize_lengths(file_id, missing)
+            for bucket, summary_text in summaries.items():
+                self.store_summary(db, file_id, bucket, summary_text)
+            print(f"DEBUG: Precomputed {len(summaries)} summaries for {file_id}")
+        except Exception as e:
+            print(f"DEBUG: Precomputing summaries for {file_id} failed: {str(e)}")
+        finally:
+            db.close()
+
+summary_service = SummaryService()
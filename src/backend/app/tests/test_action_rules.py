@@ -0,0 +1,49 @@
+# tests/test_action_rules.py
+from services.action_rules import ActionRuleEngine, extract_facts
+
+RESULTS = {
+    "trends": {
+        "sales": {"trend": "decreasing", "correlation": -0.8},
+        "visits": {"trend": "increasing", "correlation": 0.3},
+    },
+    "summary": {"rows": 10, "null_counts": {"region": 5, "sales": 0}},
+    "kpis": {"statistics": {"revenue": [0.0, 100.0, 10.0, 10.0, 5.0]}},
+}
+
+
+def test_extracts_facts_per_kind():
+    facts = extract_facts(RESULTS)
+    assert [f["column"] for f in facts["trends"]] == ["sales", "visits"]
+    assert facts["data_quality"][0]["null_ratio"] == 0.5
+    assert facts["kpis"][0]["severity"] == 18.0
+
+
+def test_items_sorted_by_priority_then_salience():
+    result = ActionRuleEngine().evaluate(RESULTS)
+    titles = [item["title"] for item in result["action_items"]]
+    priorities = [item["priority"] for item in result["action_items"]]
+
+    assert priorities == sorted(priorities, key=["high", "medium", "low"].index)
+    # Outlier salience is capped at 1.0, above the 0.8 trend and 0.5 null ratio
+    assert titles[:3] == [
+        "Review outliers in revenue",
+        "Investigate the decrease in sales values",
+        "Complete missing data in region column",
+    ]
+    assert "Sustain the increase in visits values" in titles
+    assert "1 metric(s) with significant outliers" in result["key_insights"]
+
+
+def test_tolerates_malformed_results():
+    result = ActionRuleEngine().evaluate({
+        "trends": [{"trend": "decreasing"}, "bad"],
+        "summary": {"null_counts": {"a": "n/a"}},
+        "kpis": {"statistics": {"b": [1, 2]}},
+    })
+    assert [item["title"] for item in result["action_items"]] == ["Check data quality in a column"]
+
+
+def test_no_findings():
+    result = ActionRuleEngine().evaluate({})
+    assert result["action_items"] == []
+    assert result["key_insights"] == ["No significant trends or data quality issues detected"]
@@ -0,0 +1,69 @@
+# tests/test_bm25_index.py
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import FilterOperator, MetadataFilter, MetadataFilters
+
+from services.bm25_index import BM25Index, tokenize
+
+
+def node(node_id, text, file_id):
+    return TextNode(id_=node_id, text=text, metadata={"file_id": file_id})
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.db"))
+    index.add_nodes([
+        node("a", "Invoice INV-2024-0012 was paid late", "f1"),
+        node("b", "Revenue grew in the third quarter", "f1"),
+        node("c", "Revenue revenue revenue forecast", "f2"),
+        node("d", "Shipping costs for SKU_88/A", "f2"),
+    ])
+    return index
+
+
+def test_tokenize_keeps_identifiers_and_parts():
+    assert tokenize("INV-2024-0012 and revenue_q3") == [
+        "inv-2024-0012", "inv", "2024", "0012", "and", "revenue_q3", "revenue", "q3"
+    ]
+
+
+def test_search_ranks_by_bm25(index):
+    hits = index.search("revenue", top_k=5)
+    assert [node_id for node_id, _ in hits] == ["c", "b"]
+    assert hits[0][1] > hits[1][1] > 0
+    assert index.search("inv-2024-0012")[0][0] == "a"
+    assert index.search("sku_88/a")[0][0] == "d"
+    assert index.search("unknown words") == []
+
+
+def test_filters(index):
+    filters = MetadataFilters(filters=[MetadataFilter(key="file_id", value="f1", operator=FilterOperator.EQ)])
+    assert [node_id for node_id, _ in index.search("revenue", filters=filters)] == ["b"]
+
+
+def test_replace_delete_and_reopen(tmp_path, index):
+    index.add_nodes([node("b", "Costs fell", "f1")])
+    assert [node_id for node_id, _ in index.search("revenue")] == ["c"]
+    assert index.search("costs", top_k=5)[0][0] in ("b", "d")
+
+    index.delete_file("f2")
+    assert index.search("revenue") == []
+    assert index.doc_count == 2
+
+    reopened = BM25Index(index.path)
+    assert reopened.doc_count == 2
+    assert [node_id for node_id, _ in reopened.search("costs")] == ["b"]
+    assert [node_id for node_id, _ in reopened.search("invoice")] == ["a"]
+
+
+def test_compaction_drops_deleted_postings(index):
+    index.delete_nodes(["c", "d"])
+    # Half the docs are dead, above the compaction ratio
+    assert index._stale == 0
+    assert index._postings("revenue")[:, 0].tolist() == [1]
+    assert index._postings("forecast") is None
+    assert [node_id for node_id, _ in index.search("revenue")] == ["b"]
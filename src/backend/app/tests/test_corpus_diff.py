@@ -0,0 +1,88 @@
+# tests/test_corpus_diff.py
+import asyncio
+
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+
+def make_node(node_id, text, file_id="f1"):
+    return TextNode(
+        id_=node_id,
+        text=text,
+        embedding=[1.0, float(len(text)), 0.0],
+        metadata={"file_id": file_id, "upload_date": node_id},
+        excluded_embed_metadata_keys=["file_id", "upload_date"],
+        relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=f"{file_id}-doc")}
+    )
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    # The module builds its singleton (and BM25 database) under the working directory on import
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=3))
+    from services.bm25_index import BM25Index
+    from services.corpus_index import CorpusIndex
+
+    return CorpusIndex(str(tmp_path / "corpus"), BM25Index(str(tmp_path / "bm25.db")))
+
+
+def ingest(corpus, file_id, nodes):
+    async def run():
+        new_nodes, diff = await corpus.adiff_file(file_id, nodes)
+        await corpus.insert_callback(file_id)(new_nodes)
+        await corpus.apersist()
+        return new_nodes, diff
+
+    return asyncio.run(run())
+
+
+def stored_texts(index, file_id):
+    return sorted(
+        node.get_content() for node in index.docstore.docs.values() if node.metadata.get("file_id") == file_id
+    )
+
+
+def test_re_add_keeps_unchanged_chunks(corpus):
+    ingest(corpus, "f1", [make_node("a1", "alpha"), make_node("a2", "beta"), make_node("a3", "gamma")])
+    ingest(corpus, "f2", [make_node("b1", "alpha", "f2")])
+
+    # Re-add with new node ids and upload dates: only changed content is embedded again
+    new_nodes, diff = ingest(corpus, "f1", [make_node("c1", "alpha"), make_node("c2", "beta"), make_node("c3", "delta")])
+    assert [node.node_id for node in new_nodes] == ["c3"]
+    assert diff == {"unchanged": 2, "added": 1, "removed": 1}
+
+    index = corpus.get_index()
+    assert stored_texts(index, "f1") == ["alpha", "beta", "delta"]
+    assert stored_texts(index, "f2") == ["alpha"]
+    assert [node_id for node_id, _ in corpus.bm25.search("gamma")] == []
+    assert [node_id for node_id, _ in corpus.bm25.search("delta")] == ["c3"]
+
+
+def test_duplicate_chunks_are_matched_one_to_one(corpus):
+    ingest(corpus, "f1", [make_node("a1", "same"), make_node("a2", "same")])
+
+    new_nodes, diff = ingest(corpus, "f1", [make_node("c1", "same"), make_node("c2", "same"), make_node("c3", "same")])
+    assert diff == {"unchanged": 2, "added": 1, "removed": 0}
+    assert stored_texts(corpus.get_index(), "f1") == ["same", "same", "same"]
+
+    new_nodes, diff = ingest(corpus, "f1", [make_node("d1", "same")])
+    assert diff == {"unchanged": 1, "added": 0, "removed": 2}
+    assert stored_texts(corpus.get_index(), "f1") == ["same"]
+
+
+def test_diff_survives_reload(tmp_path, corpus):
+    from services.corpus_index import CorpusIndex
+
+    ingest(corpus, "f1", [make_node("a1", "alpha"), make_node("a2", "beta")])
+    reloaded = CorpusIndex(corpus.persist_dir, corpus.bm25)
+    assert reloaded.contains("f1")
+
+    new_nodes, diff = ingest(reloaded, "f1", [make_node("c1", "beta")])
+    assert diff == {"unchanged": 1, "added": 0, "removed": 1}
+    assert stored_texts(reloaded.get_index(), "f1") == ["beta"]
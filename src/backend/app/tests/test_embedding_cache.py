@@ -0,0 +1,39 @@
+# tests/test_embedding_cache.py
+import os
+
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from services.embedding_cache import EmbeddingCache
+
+
+def test_round_trip_and_normalized_keys(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many("m", ["a  b", "c"], [[1.0, 2.0], [3.0, 4.0]])
+
+    assert cache.get_many("m", ["a b", "x", "c"]) == [[1.0, 2.0], None, [3.0, 4.0]]
+    assert cache.get_many("other", ["c"]) == [None]
+    assert cache.contains_all("m", ["c", "a\nb"])
+    assert not cache.contains_all("m", ["c", "x"])
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_duplicates_are_stored_once(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many("m", ["a", "a"], [[1.0, 0.0], [1.0, 0.0]])
+    cache.put_many("m", ["a", "b"], [[9.0, 9.0], [0.0, 1.0]])
+
+    assert cache.get_many("m", ["a", "b"]) == [[1.0, 0.0], [0.0, 1.0]]
+    assert os.path.getsize(cache._vector_path("m", 2)) == 2 * 2 * 4
+    assert cache.stats()["entries"] == 2
+
+
+def test_reopened_cache_reads_appended_rows(tmp_path):
+    EmbeddingCache(str(tmp_path)).put_many("m", ["a"], [[1.0, 2.0, 3.0]])
+    cache = EmbeddingCache(str(tmp_path))
+    assert cache.get_many("m", ["a"]) == [[1.0, 2.0, 3.0]]
+
+    # Rows appended after the file was mapped are picked up by remapping
+    cache.put_many("m", ["b"], [[4.0, 5.0, 6.0]])
+    assert cache.get_many("m", ["b", "a"]) == [[4.0, 5.0, 6.0], [1.0, 2.0, 3.0]]
@@ -0,0 +1,127 @@
+# tests/test_index_snapshot.py
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.vector_stores import SimpleVectorStore, VectorStoreQuery
+
+from services.index_snapshot import (
+    DOCSTORE_FNAME,
+    VECTOR_STORE_FNAME,
+    SnapshotKVStore,
+    current_generation,
+    load_docstore,
+    load_vector_store,
+    snapshot_exists,
+)
+from services.numpy_vector_store import NumpyVectorStore
+
+NODES = "docstore/data"
+
+
+def make_nodes(count, start=0):
+    return [
+        TextNode(
+            id_=f"n{i}",
+            text=f"text {i}",
+            embedding=[float(i), 1.0, 0.0],
+            metadata={"file_id": "f1"},
+            relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id="doc")}
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def value(i):
+    return {"__data__": {"id_": f"n{i}", "text": f"text {i}"}, "__type__": "1"}
+
+
+def test_kvstore_round_trip(tmp_path):
+    path = str(tmp_path / DOCSTORE_FNAME)
+    store = SnapshotKVStore()
+    for i in range(10):
+        store.put(f"n{i}", value(i), NODES)
+    store.put("doc", {"node_ids": ["n0"]}, "docstore/ref_doc_info")
+    store.persist(path)
+
+    reloaded = SnapshotKVStore.from_persist_path(path)
+    assert reloaded.get("n3", NODES) == value(3)
+    assert len(reloaded.get_all(NODES)) == 10
+    assert reloaded.get("doc", "docstore/ref_doc_info") == {"node_ids": ["n0"]}
+
+
+def test_appends_until_dead_records_dominate(tmp_path):
+    path = str(tmp_path / DOCSTORE_FNAME)
+    store = SnapshotKVStore()
+    for i in range(10):
+        store.put(f"n{i}", value(i), NODES)
+    store.persist(path)
+    generation = store.directory
+
+    store.put("n10", value(10), NODES)
+    store.delete("n0", NODES)
+    store.put("n1", {"__data__": {"id_": "n1", "text": "changed"}}, NODES)
+    store.put("doc", {"node_ids": ["n1"]}, "docstore/ref_doc_info")
+    store.persist(path)
+    # Appended to the same generation
+    assert store.directory == generation
+
+    reloaded = SnapshotKVStore.from_persist_path(path)
+    assert reloaded.get("n0", NODES) is None
+    assert reloaded.get("n1", NODES)["__data__"]["text"] == "changed"
+    assert reloaded.get("n10", NODES) == value(10)
+    assert reloaded.get("doc", "docstore/ref_doc_info") == {"node_ids": ["n1"]}
+
+    for i in range(2, 10):
+        reloaded.delete(f"n{i}", NODES)
+    reloaded.delete("doc", "docstore/ref_doc_info")
+    reloaded.persist(path)
+    # More dead records than live ones: compacted into a new generation
+    assert reloaded.directory != generation
+    assert sorted(os.listdir(os.path.dirname(generation))) == sorted(["CURRENT", os.path.basename(reloaded.directory)])
+
+    final = SnapshotKVStore.from_persist_path(path)
+    assert sorted(final.get_all(NODES)) == ["n1", "n10"]
+    assert final.get("doc", "docstore/ref_doc_info") is None
+
+
+def test_migrates_json_docstore(tmp_path):
+    persist_dir = str(tmp_path)
+    docstore = SimpleDocumentStore()
+    docstore.add_documents(make_nodes(5))
+    docstore.persist(os.path.join(persist_dir, DOCSTORE_FNAME))
+
+    migrated = load_docstore(persist_dir)
+    assert snapshot_exists(persist_dir)
+    assert not os.path.exists(os.path.join(persist_dir, DOCSTORE_FNAME))
+    assert migrated.get_node("n2").get_content() == "text 2"
+    assert migrated.get_ref_doc_info("doc").node_ids == ["n0", "n1", "n2", "n3", "n4"]
+
+    # Later loads read the snapshot
+    generation = current_generation(persist_dir)
+    reloaded = load_docstore(persist_dir)
+    assert current_generation(persist_dir) == generation
+    assert len(reloaded.docs) == 5
+
+
+def test_migrates_json_vector_store(tmp_path):
+    persist_dir = str(tmp_path)
+    simple = SimpleVectorStore()
+    simple.add(make_nodes(5))
+    simple.persist(os.path.join(persist_dir, VECTOR_STORE_FNAME))
+
+    migrated = load_vector_store(persist_dir)
+    assert NumpyVectorStore.exists(persist_dir)
+    assert not os.path.exists(os.path.join(persist_dir, VECTOR_STORE_FNAME))
+    assert len(migrated) == 5
+
+    reloaded = load_vector_store(persist_dir)
+    result = reloaded.query(VectorStoreQuery(query_embedding=[4.0, 1.0, 0.0], similarity_top_k=1))
+    assert result.ids == ["n4"]
+    assert result.similarities[0] == pytest.approx(1.0)
+    assert isinstance(reloaded._segments[0], np.memmap)
@@ -0,0 +1,45 @@
+# tests/test_json_stream.py
+import pytest
+
+from services.json_stream import JSONArrayStreamParser, parse_partial_json
+
+
+def test_parses_complete_object():
+    assert parse_partial_json('{"action_items": [{"a": 1}], "summary": "s"}') == {"action_items": [{"a": 1}], "summary": "s"}
+
+
+def test_recovers_truncated_output():
+    parsed = parse_partial_json('{"action_items": [{"title": "Done", "priority": 2}, {"title": "Inc')
+    # The cut-off item is closed empty; callers drop items that do not validate
+    assert parsed["action_items"][0] == {"title": "Done", "priority": 2}
+    assert parsed["action_items"][1:] in ([], [{}])
+
+
+def test_skips_brackets_in_preamble():
+    text = 'Based on section [2] of the data, here is the result: {"action_items": []}'
+    assert parse_partial_json(text) == {"action_items": []}
+    assert parse_partial_json(text, key="action_items") == {"action_items": []}
+
+
+def test_skips_objects_without_key():
+    text = 'Columns {"a": 1} were read. {"action_items": [{"a": 1}]}'
+    assert parse_partial_json(text, key="action_items") == {"action_items": [{"a": 1}]}
+    assert parse_partial_json(text) == {"a": 1}
+
+
+def test_falls_back_to_arrays():
+    assert parse_partial_json("Items: [1, 2, 3]") == [1, 2, 3]
+
+
+def test_raises_without_json():
+    with pytest.raises(ValueError):
+        parse_partial_json("no json here")
+
+
+def test_stream_parser_yields_complete_elements():
+    parser = JSONArrayStreamParser("action_items")
+    elements = []
+    for delta in ['{"action_items": [{"a": "x]"}', ', {"b": [1, 2]}', ', {"c"', ': 3}]}']:
+        elements.extend(parser.feed(delta))
+    assert elements == [{"a": "x]"}, {"b": [1, 2]}, {"c": 3}]
+    assert parser.done
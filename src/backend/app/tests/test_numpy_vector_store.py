@@ -0,0 +1,130 @@
+# tests/test_numpy_vector_store.py
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores import FilterOperator, MetadataFilter, MetadataFilters, VectorStoreQuery
+
+from services.numpy_vector_store import NumpyVectorStore
+
+DIM = 16
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(200, DIM)).astype(np.float32)
+
+
+def make_nodes(vectors, start, stop):
+    return [
+        TextNode(
+            id_=f"n{i}",
+            text=f"text {i}",
+            embedding=vectors[i].tolist(),
+            metadata={"file_id": f"f{i % 4}"},
+            relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=f"d{i % 10}")}
+        )
+        for i in range(start, stop)
+    ]
+
+
+def top_ids(store, embedding, k=3, **kwargs):
+    return store.query(VectorStoreQuery(query_embedding=embedding, similarity_top_k=k, **kwargs)).ids
+
+
+def exact_top(vectors, query, k, rows=None):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    rows = np.arange(len(vectors)) if rows is None else np.asarray(rows)
+    return [f"n{row}" for row in rows[np.argsort(-scores[rows])[:k]]]
+
+
+def persist(store, directory):
+    store.persist(os.path.join(directory, "default__vector_store.json"))
+
+
+def test_segments_survive_persist_and_reload(tmp_path, vectors):
+    store = NumpyVectorStore()
+    store.add(make_nodes(vectors, 0, 50))
+    store.add(make_nodes(vectors, 50, 100))
+    # New rows collect in one in-memory tail segment
+    assert len(store._segments) == 1
+
+    persist(store, str(tmp_path))
+    store.add(make_nodes(vectors, 100, 150))
+    persist(store, str(tmp_path))
+
+    reloaded = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    assert len(reloaded) == 150
+    assert len(reloaded._segments) == 2
+    assert all(isinstance(segment, np.memmap) for segment in reloaded._segments)
+    assert top_ids(reloaded, vectors[120].tolist()) == exact_top(vectors[:150], vectors[120], 3)
+
+
+def test_deletes_are_persisted(tmp_path, vectors):
+    store = NumpyVectorStore()
+    store.add(make_nodes(vectors, 0, 100))
+    persist(store, str(tmp_path))
+
+    store.delete("d7")
+    store.delete_nodes(node_ids=["n0"])
+    assert "n17" not in top_ids(store, vectors[17].tolist(), k=10)
+
+    persist(store, str(tmp_path))
+    reloaded = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    alive = [i for i in range(100) if i % 10 != 7 and i != 0]
+    assert len(reloaded) == len(alive)
+    assert top_ids(reloaded, vectors[17].tolist(), k=5) == exact_top(vectors[:100], vectors[17], 5, alive)
+
+
+def test_compaction_drops_deleted_rows(tmp_path, vectors):
+    store = NumpyVectorStore()
+    store.add(make_nodes(vectors, 0, 100))
+    for doc in range(5):
+        store.delete(f"d{doc}")
+    persist(store, str(tmp_path))
+
+    # Half the rows were deleted, so the persist compacted them away
+    assert len(store._ids) == len(store) == 50
+    reloaded = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    assert len(reloaded._ids) == 50
+    assert top_ids(reloaded, vectors[55].tolist(), k=1) == ["n55"]
+
+
+def test_filters_and_re_added_nodes(vectors):
+    store = NumpyVectorStore()
+    store.add(make_nodes(vectors, 0, 100))
+    filters = MetadataFilters(filters=[MetadataFilter(key="file_id", value="f1", operator=FilterOperator.EQ)])
+    rows = [i for i in range(100) if i % 4 == 1]
+    assert top_ids(store, vectors[5].tolist(), k=4, filters=filters) == exact_top(vectors[:100], vectors[5], 4, rows)
+
+    # Re-adding a node replaces its row
+    store.add(make_nodes(vectors[::-1].copy(), 5, 6))
+    assert len(store) == 100
+    assert top_ids(store, vectors[194].tolist(), k=1) == ["n5"]
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_search_rescores_exactly(tmp_path, vectors, quantization):
+    store = NumpyVectorStore(quantization=quantization)
+    store.add(make_nodes(vectors, 0, 200))
+    persist(store, str(tmp_path))
+    reloaded = NumpyVectorStore.from_persist_dir(str(tmp_path), quantization=quantization)
+
+    for row in (3, 77, 150):
+        result = reloaded.query(VectorStoreQuery(query_embedding=vectors[row].tolist(), similarity_top_k=5))
+        assert result.ids[0] == f"n{row}"
+        # Similarities are exact cosine scores of the rescored vectors, in descending order
+        for node_id, similarity in zip(result.ids, result.similarities):
+            vector = vectors[int(node_id[1:])]
+            expected = vector @ vectors[row] / np.linalg.norm(vector) / np.linalg.norm(vectors[row])
+            assert similarity == pytest.approx(float(expected), abs=1e-5)
+        assert result.similarities == sorted(result.similarities, reverse=True)
+
+    # Rescoring every row gives the exact ranking
+    reloaded.rescore_factor = 200
+    assert top_ids(reloaded, vectors[9].tolist(), k=5) == exact_top(vectors, vectors[9], 5)
@@ -0,0 +1,100 @@
+# tests/test_query_cache.py
+import asyncio
+
+import pytest
+
+from services.query_cache import QueryCache, normalize_query
+
+RESPONSE = {"response": "42", "sources": []}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return QueryCache(str(tmp_path / "query_cache.db"), ttl_seconds=3600, similarity=0.9)
+
+
+def test_normalize_query():
+    assert normalize_query("  What IS   the total?? ") == "what is the total"
+
+
+def test_exact_hit_per_scope(cache):
+    cache.put(["f1"], None, "What is the total?", RESPONSE)
+
+    hit = cache.get(["f1"], None, "what is the total")
+    assert hit["response"] == "42" and hit["cached"] == "exact"
+    assert cache.get(["f2"], None, "what is the total") is None
+    assert cache.get(["f1"], {"year": 2024}, "what is the total") is None
+
+
+def test_semantic_hit(cache):
+    cache.put(["f1"], None, "total revenue", RESPONSE, embedding=[1.0, 0.0, 0.0])
+
+    hit = cache.get_similar(["f1"], None, "overall revenue", [0.99, 0.05, 0.0])
+    assert hit["cached"] == "semantic" and hit["query"] == "overall revenue"
+    assert cache.get_similar(["f1"], None, "costs", [0.0, 1.0, 0.0]) is None
+    assert cache.get_similar(None, None, "overall revenue", [0.99, 0.05, 0.0]) is None
+
+
+def test_re_added_file_invalidates_its_answers(cache):
+    cache.put(["f1"], None, "q", RESPONSE, embedding=[1.0, 0.0])
+    cache.put(["f2"], None, "q", RESPONSE, embedding=[1.0, 0.0])
+    cache.put(["f1", "f2"], None, "q", RESPONSE)
+    cache.put(None, None, "q", RESPONSE)
+    # Load the semantic matrix of f1 before re-adding it
+    assert cache.get_similar(["f1"], None, "q2", [1.0, 0.0]) is not None
+
+    cache.invalidate("f1")
+
+    assert cache.get(["f1"], None, "q") is None
+    assert cache.get_similar(["f1"], None, "q2", [1.0, 0.0]) is None
+    assert cache.get(["f1", "f2"], None, "q") is None
+    assert cache.get(None, None, "q") is None
+    assert cache.get(["f2"], None, "q") is not None
+
+    # Answers stored after the re-add are served again
+    cache.put(["f1"], None, "q", {"response": "new"}, embedding=[1.0, 0.0])
+    assert cache.get(["f1"], None, "q")["response"] == "new"
+    assert cache.get_similar(["f1"], None, "q2", [1.0, 0.0])["response"] == "new"
+
+
+def test_versions_survive_reopen(tmp_path, cache):
+    cache.put(["f1"], None, "q", RESPONSE)
+    cache.invalidate("f1")
+    cache.put(["f1"], None, "q", {"response": "new"})
+
+    reopened = QueryCache(cache.path, ttl_seconds=3600, similarity=0.9)
+    assert reopened.get(["f1"], None, "q")["response"] == "new"
+
+
+def test_put_keeps_other_scopes_loaded(cache):
+    cache.put(["f1"], None, "a", RESPONSE, embedding=[1.0, 0.0])
+    cache.get_similar(["f1"], None, "a", [1.0, 0.0])
+    cache.put(["f2"], None, "b", RESPONSE, embedding=[0.0, 1.0])
+    assert len(cache._embeddings) == 1
+
+    # A put into a loaded scope extends its matrix in place
+    cache.put(["f1"], None, "c", {"response": "c"}, embedding=[0.0, 1.0])
+    assert cache.get_similar(["f1"], None, "d", [0.0, 1.0])["response"] == "c"
+
+
+def test_expired_answers_are_not_served(tmp_path):
+    cache = QueryCache(str(tmp_path / "query_cache.db"), ttl_seconds=1, similarity=0.9)
+    cache.put(["f1"], None, "q", RESPONSE, embedding=[1.0, 0.0])
+    cache.get_similar(["f1"], None, "q", [1.0, 0.0])
+    keys, matrix, created = next(iter(cache._embeddings.values()))
+    created[:] = 0
+    cache._conn.execute("UPDATE query_cache SET created_at = 0")
+
+    assert cache.get(["f1"], None, "q") is None
+    assert cache.get_similar(["f1"], None, "q", [1.0, 0.0]) is None
+
+
+def test_async_wrappers(cache):
+    async def run():
+        await cache.aput(["f1"], None, "q", RESPONSE)
+        hit = await cache.aget(["f1"], None, "q")
+        await cache.ainvalidate("f1")
+        return hit, await cache.aget(["f1"], None, "q")
+
+    hit, after = asyncio.run(run())
+    assert hit["response"] == "42" and after is None